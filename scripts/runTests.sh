@@ -2,11 +2,26 @@
 
 # Common packages
 python -m unittest tests/stacks/common/src/python/orangeUtils/testLoggerSetup.py
+python -m unittest tests/stacks/common/src/python/orangeUtils/testAsyncNetworkUtils.py
+python -m unittest tests/stacks/common/src/python/orangeUtils/testAwsUtils.py
+python -m unittest tests/stacks/common/src/python/orangeUtils/testTimeUtils.py
 
 # Collector packages
+python -m unittest tests/stacks/collector/src/python/testCollectorDaemon.py
+python -m unittest tests/stacks/collector/src/python/testMain.py
+python -m unittest tests/stacks/collector/src/python/testNearDupFilter.py
 python -m unittest tests/stacks/collector/src/python/testStillsGrabber.py
 python -m unittest tests/stacks/collector/src/python/testVideosGrabber.py
 python -m unittest tests/stacks/collector/src/python/testYoutubeInterface.py
 
+# Dispatcher packages
+python -m unittest tests/stacks/dispatcher/src/python/testMain.py
+
 # Drover packages
 python -m unittest tests/stacks/drover/src/python/testMain.py
+
+# Minion packages
+python -m unittest tests/stacks/minion/src/python/testMain.py
+
+# Scheduler packages
+python -m unittest tests/stacks/scheduler/src/python/testMain.py
@@ -0,0 +1,220 @@
+"""
+Long-running Collector host mode
+
+Takes collection orders from a queue of its own (or from a local spool directory standing in
+for it) and runs them in a pool of threads; so a couple of always-on hosts can serve the
+high-frequency aimpoints instead of spawning a cold Collector lambda for each order.
+
+Not the dispatch queue: the Dispatcher lambda consumes that one and the two would race for
+every order; orders for the daemons are sent to their queue the same way. The network session lives as long as the daemon; connections to the targets are kept alive
+between collections. Queue delays are honored by SQS itself; the spool honors them by file time.
+"""
+
+# External libraries import statements
+import os
+import json
+import time
+import signal
+import logging
+import threading
+import concurrent.futures
+
+
+# This application's import statements
+try:
+    # These are for when running in an EC2
+    from exceptions import *
+    import superGlblVars as GLOBALS
+    from superGlblVars import config
+    from utils import hPatrolUtils as hput
+
+except ModuleNotFoundError as err:
+    # These are for when running in a Lambda
+    print(f"Loading module for lambda execution: {__name__}")
+    from src.python.exceptions import *
+    from src.python.superGlblVars import config
+    from src.python import superGlblVars as GLOBALS
+    from src.python.utils import hPatrolUtils as hput
+
+
+logger = logging.getLogger()
+
+
+def poolSize(workers=None, mbps=None):
+    # Explicit worker count wins; otherwise size it to the cores and, if known, the bandwidth
+    if workers:
+        return workers
+
+    size = (os.cpu_count() or 1) * GLOBALS.daemonThreadsPerCore
+    if mbps:
+        size = min(size, max(1, int(mbps // GLOBALS.daemonMbpsPerCollection)))
+    return size
+
+
+class SqsSource:
+    """
+    Collection orders from an SQS queue dedicated to the daemon(s)
+    """
+
+    def __init__(self, queue, waitSecs=20):
+        self.queue = queue
+        self.waitSecs = waitSecs
+
+    def receive(self, maxMessages):
+        received = []
+        for aMsg in GLOBALS.sqsUtils.receiveMessages(self.queue, maxMessages, self.waitSecs):
+            try:
+                body = json.loads(aMsg["Body"])
+                if not isinstance(body, dict):
+                    raise ValueError(f"not a JSON object: {type(body).__name__}")
+            except ValueError as err:
+                # Won't ever be any better; don't let it come back
+                logger.error(f"Malformed order '{aMsg.get('MessageId')}'; deleting it:::{err}")
+                self.delete(aMsg["ReceiptHandle"])
+                continue
+            received.append((body, aMsg["ReceiptHandle"]))
+        return received
+
+    def delete(self, handle):
+        GLOBALS.sqsUtils.deleteMessage(self.queue, handle)
+
+    def release(self, handle):
+        # Hidden for a while; right away, this same long-polling daemon would just take it back
+        GLOBALS.sqsUtils.releaseMessage(self.queue, handle, GLOBALS.daemonReleaseSecs)
+
+
+class SpoolSource:
+    """
+    Collection orders from JSON files in a local directory; stand-in for the queue
+    Each file holds {"delay": secs, "body": message}; it becomes available "delay" seconds
+    after it was written, the same way SQS handles DelaySeconds. See spoolMessage()
+    """
+
+    def __init__(self, spoolDir, waitSecs=20):
+        self.spoolDir = spoolDir
+        self.waitSecs = waitSecs
+        self.skipped = set()
+        os.makedirs(spoolDir, exist_ok=True)
+
+    def receive(self, maxMessages):
+        waitUntil = time.time() + self.waitSecs
+        while True:
+            found = self._dueFiles(maxMessages)
+            if found or time.time() >= waitUntil:
+                return found
+            time.sleep(1)
+
+    def _dueFiles(self, maxMessages):
+        found = []
+        now = time.time()
+        for aFile in sorted(os.listdir(self.spoolDir)):
+            fullPath = os.path.join(self.spoolDir, aFile)
+            if not aFile.endswith(".json") or fullPath in self.skipped:
+                continue
+            try:
+                with open(fullPath, "r") as f:
+                    spooled = json.load(f)
+                if not isinstance(spooled, dict) or not isinstance(spooled.get("body"), dict):
+                    raise ValueError("not a spooled order")
+                if os.path.getmtime(fullPath) + spooled.get("delay", 0) > now:
+                    continue
+            except (OSError, ValueError, TypeError) as err:
+                logger.warning(f"Unable to read spooled message '{aFile}'; skipping:::{err}")
+                self.skipped.add(fullPath)
+                continue
+
+            found.append((spooled["body"], fullPath))
+            if len(found) == maxMessages:
+                break
+        return found
+
+    def delete(self, handle):
+        try:
+            os.remove(handle)
+        except FileNotFoundError:
+            pass
+
+    def release(self, handle):
+        # Nobody else takes from a local spool; stop looking at it
+        self.skipped.add(handle)
+
+
+def spoolMessage(spoolDir, message, delay=0):
+    # Local equivalent of SQSutils.sendMessage()
+    os.makedirs(spoolDir, exist_ok=True)
+    fileName = f"{time.time_ns()}_{threading.get_ident()}.json"
+    tmpPath = os.path.join(spoolDir, f".{fileName}")
+    with open(tmpPath, "w") as f:
+        json.dump({"delay": delay, "body": message}, f)
+    # Renamed in so the daemon never sees half a file
+    os.replace(tmpPath, os.path.join(spoolDir, fileName))
+
+
+def _canServe(message):
+    # This host has a single network setup; orders needing another proxy or a VPN go elsewhere
+    ourProxy = config.get("proxy") or None
+    for ap in message.get("aimpoints", [message]):
+        if ap.get("vpn") or (ap.get("proxy") or None) != ourProxy:
+            return False
+    return True
+
+
+def serve(source, runAimpoint, workers):
+    """
+    Takes orders from the source and runs runAimpoint(ap) for each aimpoint in them
+    Only asks for as many orders as there are free workers; returns after SIGTERM/SIGINT
+    once the collections in progress are done
+    """
+    stopping = threading.Event()
+
+    def stopHandler(signum, frame):
+        logger.info(f"Signal {signum} received; finishing collections in progress")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stopHandler)
+    signal.signal(signal.SIGINT, stopHandler)
+
+    logger.info(f"Collector daemon started with {workers} workers")
+    inFlight = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collector") as executor:
+        while not stopping.is_set():
+            inFlight = {aFuture for aFuture in inFlight if not aFuture.done()}
+            freeWorkers = workers - len(inFlight)
+            if freeWorkers <= 0:
+                concurrent.futures.wait(inFlight, timeout=5, return_when=concurrent.futures.FIRST_COMPLETED)
+                continue
+
+            for message, handle in source.receive(min(freeWorkers, 10)):
+                # Orders may only reference the aimpoints; see hput.resolveAimpoint()
+                try:
+                    message = hput.resolveDispatch(message)
+                except HPatrolError as err:
+                    logger.error(f"Dropping order:::{err}")
+                    source.delete(handle)
+                    continue
+
+                if not _canServe(message):
+                    logger.warning("Order needs a different proxy or a VPN; returning it")
+                    source.release(handle)
+                    continue
+
+                # Handed over once it's ours; same as the Dispatcher's fire-and-forget invoke
+                source.delete(handle)
+                for ap in message.get("aimpoints", [message]):
+                    inFlight.add(executor.submit(_runSafely, runAimpoint, ap))
+
+    logger.info("Collector daemon stopped")
+
+
+def _runSafely(runAimpoint, ap):
+    try:
+        threading.current_thread().name = hput.formatNameBase(ap["filenameBase"], ap["deviceID"])
+    except KeyError:
+        pass
+
+    try:
+        return runAimpoint(ap)
+    except Exception as e:
+        # One bad collection must not take the daemon down
+        logger.exception(f"UNHANDLED EXCEPTION CAUGHT:::{e}")
+        return False
@@ -14,6 +14,7 @@ import certifi
 import argparse
 import threading
 import datetime as dt
+import concurrent.futures
 from OpenSSL import crypto
 
 
@@ -25,6 +26,7 @@ try:
     from exceptions import *
     import stillsGrabber as sg
     import videosGrabber as vg
+    import collectorDaemon as cd
     import youtubeInterface as yt
     import playwrightGrabber as pg
     import superGlblVars as GLOBALS
@@ -45,6 +47,7 @@ except ModuleNotFoundError as err:
     from src.python import systemSettings
     from src.python import stillsGrabber as sg
     from src.python import videosGrabber as vg
+    from src.python import collectorDaemon as cd
     from src.python.superGlblVars import config
     from src.python import youtubeInterface as yt
     from src.python.orangeUtils import auditUtils
@@ -59,6 +62,39 @@ except ModuleNotFoundError as err:
 
 logger = logging.getLogger()
 
+# Types of collection that can be tasked
+_collectionTypesMap = {
+      "M3U": CollectionType.M3U
+    , "STILLS": CollectionType.STILLS
+    , "FSTLLS": CollectionType.FSTLLS
+    , "ISTLLS": CollectionType.ISTLLS
+    , "IVIDEO": CollectionType.IVIDEO
+    , "UFANET": CollectionType.UFANET
+    , "RTSPME": CollectionType.RTSPME
+    , "IPLIVE": CollectionType.IPLIVE
+    , "HNGCLD": CollectionType.HNGCLD
+    , "GNDONG": CollectionType.GNDONG
+    , "BAZNET": CollectionType.BAZNET
+    , "YOUTUB": CollectionType.YOUTUB
+    , "YTFILE": CollectionType.YTFILE
+    , "STREAM": CollectionType.STREAM
+    , "OPTION": CollectionType.OPTION
+    , "FIRSTCONTACT": CollectionType.FIRST
+    , "PLAYWRIGHT": CollectionType.PLAYWRIGHT
+    , "IMAGEINJSON": CollectionType.IMAGEINJSON
+}
+
+# Audit-log subtask names for the types not reported as "Video"
+_subtaskNames = {
+      CollectionType.YTFILE: "YouTubeFile"
+    , CollectionType.STREAM: "Stream"
+    , CollectionType.PLAYWRIGHT: "Playwright"
+    , CollectionType.IMAGEINJSON: "Still"
+    , CollectionType.STILLS: "Still"
+    , CollectionType.FSTLLS: "Still"
+    , CollectionType.ISTLLS: "Still"
+}
+
 
 def lambdaHandler(event, context):
     upSince = processInit.preFlightSetup()
@@ -70,6 +106,13 @@ def lambdaHandler(event, context):
         logger.error("Failed to initialize")
         exit(1)
 
+    # The Dispatcher may only send references to the aimpoints; see hput.resolveAimpoint()
+    try:
+        event = hput.resolveDispatch(event)
+    except HPatrolError as err:
+        logger.error(f"Unable to rebuild the aimpoint(s) received:::{err}")
+        return {"status": False}
+
     if "vpn" in event and event["vpn"]:
         config["proxy"] = event["vpn"]
         logger.info("Will use aimpoint-specified VPN")
@@ -85,14 +128,58 @@ def lambdaHandler(event, context):
     # Capture our ARN for later use
     GLOBALS.myArn = context.invoked_function_arn
 
+    if "aimpoints" in event:
+        # Several aimpoints sharing this invocation; see GLOBALS.collectorBatch
+        trueOrFalse = executeBatch(event["aimpoints"], context)
+    else:
+        trueOrFalse = _executeAndAudit(event, context, upSince)
+
+    # Need to reset; lambdas can keep memory
+    # This is specific for cases where the aimpoint needs a proxy; most don't
+    config["proxy"] = False     
+
+    toPrint = "Exiting Process"
+    logger.info(f"= {toPrint} =")
+    logger.info(f"=={'=' * len(toPrint)}==")
+
+    return {"status": trueOrFalse}
+
+
+def executeBatch(aimpoints, lambdaContext=None):
+    # All aimpoints run at the same time, each in its own thread, sharing this invocation's
+    # network session and proxy; the Dispatcher only groups aimpoints that can share those
+    # Threads are not pooled because most aimpoints keep collecting for the whole period
+    logger.info(f"Batch of {len(aimpoints)} aimpoints received")
+    if not aimpoints:
+        logger.warning("Empty batch; nothing to collect")
+        return False
+
+    def runOne(ap):
+        # Name the thread after the aimpoint to tell them apart in the logs
+        try:
+            threading.current_thread().name = hput.formatNameBase(ap["filenameBase"], ap["deviceID"])
+        except KeyError:
+            pass
+        return _executeAndAudit(ap, lambdaContext, int(time.time()))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(aimpoints)) as executor:
+        results = list(executor.map(runOne, aimpoints))
+
+    logger.info(f"Batch finished; {results.count(True)} of {len(results)} aimpoints without errors")
+    return all(results)
+
+
+def _executeAndAudit(ap, context, upSince):
+    # Executes one aimpoint and writes its audit entry
     try:
         # Pre-set values in case execution is interrupted
         dataLevel = AuditLogLevel.WARN
         systemLevel = AuditLogLevel.WARN
         exitMessage = "Exit with errors"
+        subtaskName = _subtaskName(ap)
 
         # Execute!
-        exitMessage, trueOrFalse = execute(event, context)
+        exitMessage, trueOrFalse = execute(ap, context)
 
         # Seems execution was ok, update audit values
         dataLevel = AuditLogLevel.INFO
@@ -113,8 +200,9 @@ def lambdaHandler(event, context):
         nownow = int(time.time())
         logger.info(f"Process clocked at {str(dt.timedelta(seconds=nownow-upSince))}")
 
+        # GLOBALS.subtaskName is shared by all threads in a batch; use this aimpoint's own
         auditUtils.logFromLambda(
-            event=event,
+            event=ap,
             msg=exitMessage,
             arn=GLOBALS.myArn,
             dataLevel=dataLevel,
@@ -123,25 +211,17 @@ def lambdaHandler(event, context):
             systemLevel=systemLevel,
             taskName=GLOBALS.taskName,
             stackName=GLOBALS.projectName,
-            subtaskName=GLOBALS.subtaskName,
+            subtaskName=subtaskName,
             enterDatetime=dt.datetime.fromtimestamp(upSince),
             leaveDatetime=dt.datetime.fromtimestamp(nownow),
-            location=event["longLat"],
+            location=ap.get("longLat"),
             # **collectionSummaryArgs
             # collectionSummaryArgs1="some",
             # collectionSummaryArgs2="additional",
             # collectionSummaryArgs3="info"
         )
 
-    # Need to reset; lambdas can keep memory
-    # This is specific for cases where the aimpoint needs a proxy; most don't
-    config["proxy"] = False     
-
-    toPrint = "Exiting Process"
-    logger.info(f"= {toPrint} =")
-    logger.info(f"=={'=' * len(toPrint)}==")
-
-    return {"status": trueOrFalse}
+    return trueOrFalse
 
 
 def _modifyCAfile():
@@ -190,29 +270,8 @@ def execute(ap, lambdaContext=None):
         pass
 
     # Validate type of collection being tasked
-    collectionTypesMap = {
-          "M3U": CollectionType.M3U
-        , "STILLS": CollectionType.STILLS
-        , "FSTLLS": CollectionType.FSTLLS
-        , "ISTLLS": CollectionType.ISTLLS
-        , "IVIDEO": CollectionType.IVIDEO
-        , "UFANET": CollectionType.UFANET
-        , "RTSPME": CollectionType.RTSPME
-        , "IPLIVE": CollectionType.IPLIVE
-        , "HNGCLD": CollectionType.HNGCLD
-        , "GNDONG": CollectionType.GNDONG
-        , "BAZNET": CollectionType.BAZNET
-        , "YOUTUB": CollectionType.YOUTUB
-        , "YTFILE": CollectionType.YTFILE
-        , "STREAM": CollectionType.STREAM
-        , "OPTION": CollectionType.OPTION
-        , "FIRSTCONTACT": CollectionType.FIRST
-        , "PLAYWRIGHT": CollectionType.PLAYWRIGHT
-        , "IMAGEINJSON": CollectionType.IMAGEINJSON
-    }
-
     try:
-        collType = collectionTypesMap[ap["collectionType"]]
+        collType = _collectionTypesMap[ap["collectionType"]]
 
         # Identify our subtask for the audit logs
         GLOBALS.subtaskName = ap["collectionType"]
@@ -241,6 +300,14 @@ def execute(ap, lambdaContext=None):
         return rtnMessage, False
 
 
+def _subtaskName(ap):
+    # Audit-log subtask for the aimpoint; same as what _handleType() sets in GLOBALS.subtaskName
+    collType = _collectionTypesMap.get(ap.get("collectionType"))
+    if collType is None:
+        return ap.get("collectionType")
+    return _subtaskNames.get(collType, "Video")
+
+
 def _handleType(collType, ap, lambdaContext=None):
     try:
         # Determine the S3's prefix
@@ -329,9 +396,31 @@ if __name__ == "__main__":
                         ),
                         dest="testFile",
                         default="testResources/aimpoint-youtube.json")
+    parser.add_argument("--daemon",
+                        help=(
+                            "Keep running, taking collection orders from --queue\n"\
+                            "(or from --spool) instead of running the -f file once"
+                        ),
+                        action="store_true")
+    parser.add_argument("--spool",
+                        help="Local directory to take orders from instead of the queue (with --daemon)",
+                        dest="spoolDir")
+    parser.add_argument("--queue",
+                        help=(
+                            "Queue to take orders from (with --daemon)\n"\
+                            "must be the daemons' own; the Dispatcher lambda consumes the dispatch queue"
+                        ))
+    parser.add_argument("--workers",
+                        help="Collections to run at the same time (with --daemon)\ndefault: sized to cores and --mbps",
+                        type=int)
+    parser.add_argument("--mbps",
+                        help="Bandwidth available to this host, to size the workers (with --daemon)",
+                        type=float)
 
     args = parser.parse_args()
     testFile = args.testFile
+    if args.daemon and not (args.queue or args.spoolDir):
+        parser.error("--daemon needs --queue or --spool")
     # print(args)
 
     upSince = processInit.preFlightSetup()
@@ -340,6 +429,12 @@ if __name__ == "__main__":
         logger.error("Failed to initialize")
         exit(1)
 
+    if args.daemon:
+        workers = cd.poolSize(args.workers, args.mbps)
+        # The session lives as long as the daemon; keep connections alive to all the targets
+        # (times two for the CDNs many of the targets redirect to)
+        processInit.initSessionObject(config["sessionHeaders"], poolHosts=workers * 2)
+
     # Don't use proxy for AWS metadata; will timeout if proxy is tried
     # This is the equivalent of doing: $ export no_proxy=169.254.169.254
     try:
@@ -354,15 +449,29 @@ if __name__ == "__main__":
     arn = f"arn:aws:ec2:{region}:{accountId}:instance/{instanceId}"
     GLOBALS.myArn = arn
 
-    logger.debug(f"Reading from test file '{testFile}'")
-    with open(testFile, "r") as f:
-        testEvent = json.loads(f.read())
-    # logger.debug(f"AIMPOINT:\n'{json.dumps(testEvent)}'")
+    if args.daemon:
+        if args.spoolDir:
+            source = cd.SpoolSource(args.spoolDir)
+        elif args.queue.rstrip("/").split("/")[-1] == config["disQueue"].rstrip("/").split("/")[-1]:
+            logger.error(f"'{args.queue}' is the Dispatcher's queue; the daemon needs a queue of its own")
+            exit(1)
+        else:
+            source = cd.SqsSource(args.queue)
+        cd.serve(source, lambda ap: _executeAndAudit(ap, None, int(time.time())), workers)
 
-    try:
-        trueOrFalse = execute(testEvent)
-    except ConnectionError as err:
-        logger.info(f"Caught exception: {err}")
+    else:
+        logger.debug(f"Reading from test file '{testFile}'")
+        with open(testFile, "r") as f:
+            testEvent = json.loads(f.read())
+        # logger.debug(f"AIMPOINT:\n'{json.dumps(testEvent)}'")
+
+        try:
+            if "aimpoints" in testEvent:
+                trueOrFalse = executeBatch(testEvent["aimpoints"])
+            else:
+                trueOrFalse = execute(testEvent)
+        except ConnectionError as err:
+            logger.info(f"Caught exception: {err}")
 
     nownow = int(time.time())
     logger.info(f"Process clocked at {str(dt.timedelta(seconds=nownow-upSince))}")
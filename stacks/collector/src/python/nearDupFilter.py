@@ -0,0 +1,130 @@
+"""
+Perceptual-hash filter for near-duplicate stills
+
+MD5 only catches byte-identical images; many cameras re-encode the same static scene with a
+new timestamp overlay. Each still is shrunk to a small grayscale thumbnail and reduced to a
+64-bit hash (DCT or average); stills within a few bits of a recently kept one are dropped.
+
+NumPy and Pillow are optional; without them the filter keeps every image.
+"""
+
+# External libraries import statements
+import logging
+from io import BytesIO
+from collections import deque
+
+try:
+    import numpy as np
+    from PIL import Image
+    phashAvailable = True
+except ImportError:
+    phashAvailable = False
+
+
+# This application's import statements
+try:
+    # These are for when running in an EC2
+    import superGlblVars as GLOBALS
+
+except ModuleNotFoundError as err:
+    # These are for when running in a Lambda
+    print(f"Loading module for lambda execution: {__name__}")
+    from src.python import superGlblVars as GLOBALS
+
+
+logger = logging.getLogger()
+
+HASH_SIDE = 8       # hashes are HASH_SIDE x HASH_SIDE bits
+DCT_SIDE = 32       # thumbnail side for the DCT hash
+
+_dctMatrix = None
+
+
+def _thumbnail(imageData, side):
+    with Image.open(BytesIO(imageData)) as img:
+        # JPEG draft mode decodes at a fraction of the size; much cheaper than a full decode
+        img.draft("L", (side * 4, side * 4))
+        small = img.convert("L").resize((side, side), Image.BILINEAR)
+    return np.asarray(small, dtype=np.float64)
+
+
+def _toInt(bits):
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+def averageHash(imageData):
+    pixels = _thumbnail(imageData, HASH_SIDE)
+    return _toInt(pixels > pixels.mean())
+
+
+def dctHash(imageData):
+    global _dctMatrix
+    if _dctMatrix is None:
+        # Orthonormal DCT-II basis; the 2D transform is then just two matrix products
+        n = np.arange(DCT_SIDE)
+        matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * DCT_SIDE))
+        matrix[0] /= np.sqrt(2)
+        _dctMatrix = matrix * np.sqrt(2 / DCT_SIDE)
+
+    pixels = _thumbnail(imageData, DCT_SIDE)
+    lowFreqs = (_dctMatrix @ pixels @ _dctMatrix.T)[:HASH_SIDE, :HASH_SIDE]
+    return _toInt(lowFreqs > np.median(lowFreqs))
+
+
+def hammingDistance(hashA, hashB):
+    return bin(hashA ^ hashB).count("1")
+
+
+_hashFunctions = {"dct": dctHash, "average": averageHash}
+
+
+class NearDupFilter:
+    """
+    Remembers the perceptual hashes of the last few stills kept for one camera
+    """
+
+    def __init__(self, threshold, history=None, method="dct"):
+        self.threshold = threshold
+        self.hashFunc = _hashFunctions[method]
+        self.recent = deque(maxlen=max(1, history or GLOBALS.nearDupHistory))
+
+
+    def check(self, imageData):
+        """
+        Return (isNearDup, theHash); call keep() with the hash once the image is stored
+        Images that can't be decoded are never considered duplicates
+        """
+        try:
+            theHash = self.hashFunc(imageData)
+        except Exception as err:
+            logger.warning(f"Unable to compute perceptual hash; keeping image ({err})")
+            return False, None
+
+        for aHash in self.recent:
+            distance = hammingDistance(theHash, aHash)
+            if distance < self.threshold:
+                logger.info(f"Near-duplicate image (distance {distance} < {self.threshold})")
+                return True, theHash
+        return False, theHash
+
+
+    def keep(self, theHash):
+        if theHash is not None:
+            self.recent.append(theHash)
+
+
+def filterFor(ap, filters, key):
+    # Returns the camera's filter, or None when the aimpoint doesn't ask for one
+    threshold = ap.get("nearDupThreshold")
+    if not threshold:
+        return None
+
+    if not phashAvailable:
+        logger.warning("nearDupThreshold set but NumPy/Pillow not available; near-duplicates are kept")
+        return None
+
+    if key not in filters:
+        filters[key] = NearDupFilter(
+            threshold, ap.get("nearDupHistory"), ap.get("nearDupMethod", "dct")
+        )
+    return filters[key]
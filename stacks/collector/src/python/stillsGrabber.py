@@ -3,9 +3,12 @@ import os
 import json
 import time
 import base64
+import tarfile
 import logging
+import urllib.parse
 import datetime as dt
-from shutil import copyfile
+import concurrent.futures
+from io import BytesIO
 
 
 # This application's import statements
@@ -16,6 +19,7 @@ try:
     from superGlblVars import config
     from orangeUtils import utils as ut
     from addons import iodineAddon as io
+    import nearDupFilter as ndf
     from utils import hPatrolUtils as hput
     from collectionTypes import CollectionType
 
@@ -27,12 +31,30 @@ except ModuleNotFoundError as err:
     from src.python.orangeUtils import utils as ut
     from src.python import superGlblVars as GLOBALS
     from src.python.addons import iodineAddon as io
+    from src.python import nearDupFilter as ndf
     from src.python.utils import hPatrolUtils as hput
     from src.python.collectionTypes import CollectionType
 
 
 logger = logging.getLogger()
 
+# ETag/Last-Modified of the last image saved from each still URL, for conditional requests
+# Module-level so they last across the singleCollector loop and across warm invocations
+_imageValidators = {}
+
+# Hash of the last image saved for each device (keyed by its filename without the epoch)
+# Also module-level, so S3 is only asked once per device during the singleCollector loop;
+# asked again on each run since another container may have written a newer one (see _forgetLastHash)
+# _unflushedHashes are the ones not yet written to the device's hash file in S3
+_lastHashes = {}
+_unflushedHashes = set()
+
+# Perceptual-hash filters of the devices whose aimpoints set "nearDupThreshold"; see nearDupFilter.py
+_nearDupFilters = {}
+
+# Rolling archives of the devices whose aimpoints set "stillsArchive"; see _StillsArchive
+_archives = {}
+
 
 def handleStills(collType, prefixBase, ap, lambdaContext=None):
     try:
@@ -42,20 +64,7 @@ def handleStills(collType, prefixBase, ap, lambdaContext=None):
 
         elif collType == CollectionType.FSTLLS:
             logger.info("Type selected: fStills")
-            idList  = ap["deviceIdList"]
-            urlList = ap["accessUrlList"]
-            fnbList = ap["filenameBaseList"]
-            for id, url, fNamBas in zip(idList, urlList, fnbList):
-                ap["deviceID"] = id
-                ap["accessUrl"] = url
-                ap["filenameBase"] = fNamBas
-                fnBase = hput.formatNameBase(fNamBas, id)
-
-                # Reconstitute the prefixBase w/new fNamBas
-                # Do it like this here cause don't have date info here
-                prefixParts = prefixBase.split("/")
-                prefixBase = "/".join(prefixParts[:-1]) + "/" + fnBase
-                _collectStill(prefixBase, ap, lambdaContext)
+            _sweepStills(prefixBase, ap, lambdaContext)
 
         elif collType == CollectionType.ISTLLS:
             logger.info("Type selected: iStills")
@@ -97,164 +106,292 @@ def _collectStill(prefixBase, ap, lambdaContext=None, collType=CollectionType.ST
         raise HPatrolError('Parameter unspecified in input configuration')
 
     ourFilename = f"{hput.formatNameBase(filenameBase, devId)}.JPG"
+    _forgetLastHash(ourFilename)
 
     try:
-        decoy = True == ap["decoy"]
+        singleCollector = True == ap["singleCollector"]
     except KeyError:
-        decoy = False
+        singleCollector = False
+
+    breakPoint, theSleep, sleepyFraction = hput.calculateExecutionStop(ap, lambdaContext)
+
+    while True:
+        if not _pollStill(prefixBase, ap, collType):
+            # We may be getting denied, network down, or something else...wait the actual pollFrequency
+            if hput.itsTimeToBail(lambdaContext, breakPoint, ap["pollFrequency"]*1000):
+                # If we get here we're encountering an error and will not collect
+                GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": False})
+                break
+            logger.info(f"Sleeping the specified poll frequency: {ap['pollFrequency']}s")
+            time.sleep(ap["pollFrequency"])
+            continue
+
+        if not _keepCollecting(singleCollector, lambdaContext, breakPoint, theSleep, sleepyFraction):
+            break
+
+    # While-loop ends here
+
+    if collType != CollectionType.ISTLLS:
+        # Archives don't outlive the run; whatever is pending goes up now
+        _flushArchive(ourFilename)
+        # Only the last image's hash matters; written once per run instead of once per image
+        _pushHashInContent(ourFilename)
+
+
+def _sweepStills(prefixBase, ap, lambdaContext=None):
+    # FSTLLS: all the listed cameras are polled together on every tick, sharing the session
+    # and a single sleep; per-host limits keep us from hammering a station with many cameras
+    cameras = []
+    for id, url, fNamBas in zip(ap["deviceIdList"], ap["accessUrlList"], ap["filenameBaseList"]):
+        camAp = dict(ap, deviceID=id, accessUrl=url, filenameBase=fNamBas)
+        fnBase = hput.formatNameBase(fNamBas, id)
+
+        # Reconstitute the prefixBase w/new fNamBas
+        # Do it like this here cause don't have date info here
+        prefixParts = prefixBase.split("/")
+        camPrefix = "/".join(prefixParts[:-1]) + "/" + fnBase
+        cameras.append((camPrefix, camAp))
+        _forgetLastHash(f"{fnBase}.JPG")
+
+    if not cameras:
+        logger.warning("No cameras listed")
+        return
 
     try:
         singleCollector = True == ap["singleCollector"]
     except KeyError:
         singleCollector = False
 
+    maxHostConns = ap.get("hostConns", GLOBALS.hostConns)
     breakPoint, theSleep, sleepyFraction = hput.calculateExecutionStop(ap, lambdaContext)
 
-    while True:
-        if GLOBALS.useTestData:
-            testFile = "testResources/kameraSample.jpg"
-            camFile = f"{config['workDirectory']}/{ourFilename}"
-            copyfile(testFile, camFile)
-            hashFile = f"{ourFilename}.md5"
-            # Hash file is NOT created because it'd have to be deleted every time to test
-            logger.debug("Using TEST data; hash file is NOT created")
-
-        else:
-            if collType == CollectionType.ISTLLS:
-                # ISTILLS uses its own filename processing
-                fnBase = hput.formatNameBase(filenameBase, devId)
-
-                # Derive image filename
-                base = os.path.basename(imageUrl)                           # "PreX00002.jpg"
-                presetText = os.path.splitext(base)                         # ("PreX00002", ".jpg")
-                presetBase = presetText[0].replace(presetText[0][4:], "")   # "PreX"
-
-                lu = dt.datetime.strptime(ap["lastUpdate"], "%Y-%m-%dT%H:%M:%S.%fZ")
-                lastUpdate = lu.strftime("%Y%m%d%H%M%S")
-
-                # e.g.: ourFilename = <devID>-PreX_YYYYMMDDHHMMSS.jpg
-                ourFilename = f"{fnBase}-{presetBase}_{lastUpdate}{presetText[1]}"
-
-            if collType == CollectionType.IMAGEINJSON:
-                try:
-                    # If we don't specify ?format=xxx in the URL, the server gives code and instructions
-                    r = GLOBALS.netUtils.get(imageUrl)
-                    jsonContent = json.loads(r.text)
-
-                    # Uncomment to test this collectionType
-                    # testFile = "testResources/imageInJson.json"
-                    # logger.debug(f"Reading from test file '{testFile}'")
-                    # with open(testFile, "r") as f:
-                    #     jsonContent = json.loads(f.read())
-                except Exception as e:
-                    # We want the process to continue regardless of any errors collecting
-                    logger.error(e)
-                    logger.warning(f"Unable to grab camera from {imageUrl}")
-                    # We may be getting denied, network down, or something else...wait the actual pollFrequency
-                    if hput.itsTimeToBail(lambdaContext, breakPoint, ap["pollFrequency"]*1000):
-                        # If we get here we're encountering an error and will not collect
-                        GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": False})
-                        break
+    def pollCamera(camera):
+        camPrefix, camAp = camera
+        hostLimiter = hput.getHostLimiter(urllib.parse.urlparse(camAp["accessUrl"]).netloc, maxHostConns)
+        with hostLimiter:
+            return _pollStill(camPrefix, camAp, CollectionType.FSTLLS)
+
+    # Cameras whose last poll failed; reported as not collecting when the run ends
+    down = {}
+    toPoll = cameras
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(cameras)) as executor:
+        while True:
+            logger.info(f"Polling {len(toPoll)} camera(s)")
+            failed = []
+            for aCam, ok in zip(toPoll, executor.map(pollCamera, toPoll)):
+                if ok:
+                    down.pop(aCam[1]["deviceID"], None)
+                else:
+                    down[aCam[1]["deviceID"]] = aCam[1]
+                    failed.append(aCam)
+
+            if failed:
+                # Same as a single camera; failures are retried until it's time to bail
+                if hput.itsTimeToBail(lambdaContext, breakPoint, ap["pollFrequency"]*1000):
+                    break
+
+                if not singleCollector:
+                    toPoll = failed
                     logger.info(f"Sleeping the specified poll frequency: {ap['pollFrequency']}s")
                     time.sleep(ap["pollFrequency"])
                     continue
 
-                fullFilePath = os.path.join(config["workDirectory"], ourFilename)
-                # FIXME: Make an aimpoint parameter to specify the key from where to get the image 
-                #        This piece and collectionType was hastily put together for a time-sensitive task
-                #        Ideally we should have a configurable key like the {firstContactData:{key:""}} specification
-                #        i.e. here jsonContent["contentBase64"] is hardcoded to the particular target we have right now
-                with open(fullFilePath, "wb") as fh:
-                    # Extract the image from the JSON
-                    fh.write(base64.decodebytes(bytes(jsonContent["contentBase64"], "utf-8")))
-
-            # For all other types *except* IMAGEINJSON
-            else:
-                try:
-                    GLOBALS.netUtils.downloadImage(ourFilename, imageUrl)
-
-                except Exception as e:
-                    # We want the process to continue regardless of any errors collecting
-                    logger.error(e)
-                    logger.warning(f"Unable to grab camera from {imageUrl}")
-                    # We may be getting denied, network down, or something else...wait the actual pollFrequency
-                    if hput.itsTimeToBail(lambdaContext, breakPoint, ap["pollFrequency"]*1000):
-                        # If we get here we're encountering an error and will not collect
-                        GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": False})
-                        break
-                    logger.info(f"Sleeping the specified poll frequency: {ap['pollFrequency']}s")
-                    time.sleep(ap["pollFrequency"])
-                    continue
+            toPoll = cameras
+            if not _keepCollecting(singleCollector, lambdaContext, breakPoint, theSleep, sleepyFraction):
+                break
 
-        # Gave up on querying target's lastModDate; will always use our own timestamp
-        lastModDate = int(time.time())
+    # Includes the cameras that failed on an earlier tick of the singleCollector loop and never came back
+    for camAp in down.values():
+        GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": camAp, "isCollecting": False})
 
-        # Add suffix epoch to the filename
-        theSplit = os.path.splitext(ourFilename)
-        finalFilename = f"{theSplit[0]}_{lastModDate}{theSplit[1]}"
-        os.rename(
-            os.path.join(config["workDirectory"], ourFilename),
-            os.path.join(config["workDirectory"], finalFilename)
-        )
+    for camPrefix, camAp in cameras:
+        ourFilename = f"{hput.formatNameBase(camAp['filenameBase'], camAp['deviceID'])}.JPG"
+        _flushArchive(ourFilename)
+        _pushHashInContent(ourFilename)
 
-        wrkBucketName = hput.pickBestBucket(ap, "wrkBucket")
 
+def _pollStill(prefixBase, ap, collType):
+    # One poll of one camera: download, dedup and save
+    # Returns False when the image couldn't be obtained; an unchanged image is a success
+    devId = ap["deviceID"]
+    imageUrl = ap["accessUrl"]
+    filenameBase = ap["filenameBase"]
+    ourFilename = f"{hput.formatNameBase(filenameBase, devId)}.JPG"
+
+    try:
+        decoy = True == ap["decoy"]
+    except KeyError:
+        decoy = False
+
+    # Ask the camera for the image only if it changed since the last one we saved
+    conditional = ap.get("conditionalPoll", True)
+
+    # Images are kept in memory from download to upload; nothing is written to disk
+    validators = None
+    theHash = None
+    if GLOBALS.useTestData:
+        testFile = "testResources/kameraSample.jpg"
+        with open(testFile, "rb") as f:
+            imageData = f.read()
+
+    else:
         if collType == CollectionType.ISTLLS:
-            # For ISTILLS we already confirmed these are new images
-            if _saveWasSuccessful(decoy, wrkBucketName, prefixBase, finalFilename, ap):
-                _pushHashInTheName(io.hashForTracking(ap["deviceID"], ap["lastUpdate"]))
+            # ISTILLS uses its own filename processing
+            fnBase = hput.formatNameBase(filenameBase, devId)
+
+            # Derive image filename
+            base = os.path.basename(imageUrl)                           # "PreX00002.jpg"
+            presetText = os.path.splitext(base)                         # ("PreX00002", ".jpg")
+            presetBase = presetText[0].replace(presetText[0][4:], "")   # "PreX"
+
+            lu = dt.datetime.strptime(ap["lastUpdate"], "%Y-%m-%dT%H:%M:%S.%fZ")
+            lastUpdate = lu.strftime("%Y%m%d%H%M%S")
+
+            # e.g.: ourFilename = <devID>-PreX_YYYYMMDDHHMMSS.jpg
+            ourFilename = f"{fnBase}-{presetBase}_{lastUpdate}{presetText[1]}"
+
+        if collType == CollectionType.IMAGEINJSON:
+            try:
+                # If we don't specify ?format=xxx in the URL, the server gives code and instructions
+                r = GLOBALS.netUtils.get(imageUrl)
+                jsonContent = json.loads(r.text)
+
+                # Uncomment to test this collectionType
+                # testFile = "testResources/imageInJson.json"
+                # logger.debug(f"Reading from test file '{testFile}'")
+                # with open(testFile, "r") as f:
+                #     jsonContent = json.loads(f.read())
+            except Exception as e:
+                # We want the process to continue regardless of any errors collecting
+                logger.error(e)
+                logger.warning(f"Unable to grab camera from {imageUrl}")
+                return False
+
+            # FIXME: Make an aimpoint parameter to specify the key from where to get the image 
+            #        This piece and collectionType was hastily put together for a time-sensitive task
+            #        Ideally we should have a configurable key like the {firstContactData:{key:""}} specification
+            #        i.e. here jsonContent["contentBase64"] is hardcoded to the particular target we have right now
+            # Extract the image from the JSON
+            imageData = base64.decodebytes(bytes(jsonContent["contentBase64"], "utf-8"))
+
+        # For all other types *except* IMAGEINJSON
+        else:
+            if conditional:
+                # Only kept once the image is safely stored; see _rememberValidators()
+                validators = dict(_imageValidators.get(imageUrl, {}))
+            try:
+                response, imageData, theHash = GLOBALS.netUtils.downloadImageData(imageUrl, validators)
+
+            except Exception as e:
+                # We want the process to continue regardless of any errors collecting
+                logger.error(e)
+                logger.warning(f"Unable to grab camera from {imageUrl}")
+                return False
+
+            if response.status_code == 304:
+                logger.info("Image unchanged (not modified)")
+                return True
 
+    if theHash is None:
+        # Downloads are hashed as they arrive; the rest are hashed here
+        theHash = ut.getHashFromData(imageData)
+
+    # Gave up on querying target's lastModDate; will always use our own timestamp
+    lastModDate = int(time.time())
+
+    # Add suffix epoch to the filename
+    theSplit = os.path.splitext(ourFilename)
+    finalFilename = f"{theSplit[0]}_{lastModDate}{theSplit[1]}"
+
+    wrkBucketName = hput.pickBestBucket(ap, "wrkBucket")
+
+    if collType == CollectionType.ISTLLS:
+        # For ISTILLS we already confirmed these are new images
+        if _saveWasSuccessful(decoy, wrkBucketName, prefixBase, finalFilename, ap, imageData, theHash):
+            _pushHashInTheName(io.hashForTracking(ap["deviceID"], ap["lastUpdate"]))
+            _rememberValidators(imageUrl, validators)
+
+    else:
+        archive = None if decoy else _archiveFor(ap, ourFilename)
+        if not _isSameImage(wrkBucketName, ourFilename, theHash, archive):
+            # Optionally also drop images that only differ slightly (e.g. a timestamp overlay)
+            nearDup, pHash = False, None
+            nearFilter = ndf.filterFor(ap, _nearDupFilters, ourFilename)
+            if nearFilter:
+                nearDup, pHash = nearFilter.check(imageData)
+
+            if nearDup:
+                _rememberValidators(imageUrl, validators)
+            elif archive:
+                # The hash is only kept once the archive is in S3; see _StillsArchive.flush()
+                if _archiveWasSuccessful(archive, wrkBucketName, prefixBase, finalFilename, ap, imageData, theHash, lastModDate):
+                    _rememberValidators(imageUrl, validators)
+                    if nearFilter:
+                        nearFilter.keep(pHash)
+            elif _saveWasSuccessful(decoy, wrkBucketName, prefixBase, finalFilename, ap, imageData, theHash):
+                # Note that this dedup check uses the device name w/out the epoch (ourFilename)
+                _lastHashes[ourFilename] = theHash
+                _unflushedHashes.add(ourFilename)
+                _rememberValidators(imageUrl, validators)
+                if nearFilter:
+                    nearFilter.keep(pHash)
         else:
-            # Create hash id file
-            fullFilePath = os.path.join(config["workDirectory"], finalFilename)
-            hashFilePath = ut.makeHashFileFromData(
-                open(fullFilePath, "rb").read(),
-                config["workDirectory"],
-                ourFilename)
-            hashFile = os.path.basename(hashFilePath)
-
-            if not _isSameImage(wrkBucketName, ourFilename):
-                if _saveWasSuccessful(decoy, wrkBucketName, prefixBase, finalFilename, ap):
-                    # Note that this dedup check uses the device name w/out the epoch (ourFilename)
-                    _pushHashInContent(hashFile)
-
-        # We're only intended to run once
-        if not singleCollector:
-            logger.info("Not a singleCollector request; breaking out")
-            break
+            _rememberValidators(imageUrl, validators)
 
-        if hput.itsTimeToBail(lambdaContext, breakPoint, theSleep):
-            break
-        # Don't sleep if we're just using the test data; don't waste time
-        if not GLOBALS.useTestData:
-            logger.info(f"Sleeping {sleepyFraction*100:g}% of the poll frequency: {theSleep/1000:.2f}s")
-            time.sleep(theSleep/1000)
+    return True
+
+
+def _keepCollecting(singleCollector, lambdaContext, breakPoint, theSleep, sleepyFraction):
+    # Sleeps until the next poll; False when it's time to stop instead
+    # We're only intended to run once
+    if not singleCollector:
+        logger.info("Not a singleCollector request; breaking out")
+        return False
+
+    if hput.itsTimeToBail(lambdaContext, breakPoint, theSleep):
+        return False
+    # Don't sleep if we're just using the test data; don't waste time
+    if not GLOBALS.useTestData:
+        logger.info(f"Sleeping {sleepyFraction*100:g}% of the poll frequency: {theSleep/1000:.2f}s")
+        time.sleep(theSleep/1000)
+
+    return True
+
+
+def _rememberValidators(imageUrl, validators):
+    # Only validators of images already stored are used; otherwise a 304 could skip an image never saved
+    if validators and (validators.get("etag") or validators.get("lastMod")):
+        _imageValidators[imageUrl] = validators
+    else:
+        # Camera doesn't support conditional requests
+        _imageValidators.pop(imageUrl, None)
 
-    # While-loop ends here
 
+def _forgetLastHash(fileName):
+    # Start of a run: the device's hash file is read again, in case another container wrote it
+    # A hash not yet written back is newer than the file's; that one is kept
+    if fileName not in _unflushedHashes:
+        _lastHashes.pop(fileName, None)
 
-def _isSameImage(bucketName, fileName):
+
+def _isSameImage(bucketName, fileName, newHash, archive=None):
     logger.info(f"Checking for a change in image for '{fileName}'")
-    hashFileName = f"{fileName}.md5"
-    # Read from S3 the old hash id file
-    # Note: On this dup-check technique the hash is in the contents of the file
-    # on another dup-check, the filename is the hash.
-    oldHash = GLOBALS.S3utils.readFileContent(bucketName, f"{GLOBALS.s3Hashfiles}/{hashFileName}")
+    if archive and archive.lastHash():
+        # Newer than anything in S3; not uploaded yet
+        return archive.lastHash() == newHash
+
+    if fileName not in _lastHashes:
+        # Read from S3 the old hash id file; only the first time we see the device
+        # Note: On this dup-check technique the hash is in the contents of the file
+        # on another dup-check, the filename is the hash.
+        hashFileName = f"{fileName}.md5"
+        _lastHashes[fileName] = GLOBALS.S3utils.readFileContent(bucketName, f"{GLOBALS.s3Hashfiles}/{hashFileName}")
+
+    oldHash = _lastHashes[fileName]
     # logger.debug(f"oldHash ->{oldHash}<-")
     if not oldHash:
         logger.info("There may not be an MD5 file yet")
         return False
-
-    # Open recent hash id file; open as text
-    # Hash file (.md5) was created by the download function
-    try:
-        hashFile = os.path.join(config["workDirectory"], hashFileName)
-        logger.debug(f"Reading hash file '{hashFile}'")
-        with open(hashFile, "r") as f:
-            newHash = f.read()
-    except FileNotFoundError:
-        logger.info("No local MD5 file found")
-        return False
     # logger.debug(f"newHash ->{newHash}<-")
 
     if oldHash == newHash:
@@ -272,50 +409,193 @@ def _pushHashInTheName(theHash):
         logger.warning("Could not create hash file; ignoring its creation")
 
 
-def _pushHashInContent(hashFileName):
-    hashFilePath = os.path.join(config["workDirectory"], hashFileName)
+def _pushHashInContent(fileName):
+    # Writes the device's hash file with the hash of the last image saved, if it changed
+    if fileName not in _unflushedHashes:
+        return
+    hashFileName = f"{fileName}.md5"
 
     try:
-        if os.path.isfile(hashFilePath):
-            result = GLOBALS.S3utils.pushToS3(hashFilePath,
-                                                GLOBALS.s3Hashfiles,
-                                                config["defaultWrkBucket"],
-                                                deleteOrig=GLOBALS.onProd)
-            if result:
-                logger.info(f"Pushed hash file: {hashFileName}")
-            else:
-                logger.error(f"Hash file {hashFileName} was not pushed to S3!")
+        result = GLOBALS.S3utils.pushFileObjToS3(BytesIO(_lastHashes[fileName].encode("utf-8")),
+                                                 GLOBALS.s3Hashfiles,
+                                                 config["defaultWrkBucket"],
+                                                 hashFileName)
+        if result:
+            _unflushedHashes.discard(fileName)
+            logger.info(f"Pushed hash file: {hashFileName}")
         else:
-            logger.warning(f"Unable to push {hashFileName}; file not found: {hashFilePath}")
+            logger.error(f"Hash file {hashFileName} was not pushed to S3!")
     except:
-        logger.warning(f"Unknown error trying to push {hashFileName}: {hashFilePath}")
+        logger.warning(f"Unknown error trying to push {hashFileName}")
 
 
-def _saveWasSuccessful(decoy, theBucket, lzS3Prefix, finalFileName, ap):
+def _saveWasSuccessful(decoy, theBucket, lzS3Prefix, finalFileName, ap, imageData, theHash):
     if decoy:
         GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": True})
         logger.info("Decoy aimpoint; NOT pushing to S3")
         return True
 
     logger.info(f"Pushing image to S3 as '{finalFileName}'")
-    fileNamePath = os.path.join(config["workDirectory"], finalFileName)
     try:
-        if os.path.isfile(fileNamePath):
-            result = GLOBALS.S3utils.pushToS3(fileNamePath,
-                                                lzS3Prefix,
-                                                theBucket,
-                                                s3BaseFileName=finalFileName,
-                                                deleteOrig=GLOBALS.onProd,
-                                                extras={"ContentType": "image/jpeg"})
-            if result:
-                # Push successful
-                GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": True})
-                return True
-            else:
-                logger.error(f"Image file {finalFileName} was not pushed to S3!")
+        # The hash goes along as object metadata; no separate hash object per image
+        result = GLOBALS.S3utils.pushFileObjToS3(BytesIO(imageData),
+                                                 lzS3Prefix,
+                                                 theBucket,
+                                                 finalFileName,
+                                                 extras={"ContentType": "image/jpeg", "Metadata": {"md5": theHash}})
+        if result:
+            # Push successful
+            GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": True})
+            return True
         else:
-            logger.warning(f"Unable to push {finalFileName}; file not found: {fileNamePath}")
+            logger.error(f"Image file {finalFileName} was not pushed to S3!")
     except:
-        logger.warning(f"Unknown error trying to push {finalFileName}: {fileNamePath}")
+        logger.warning(f"Unknown error trying to push {finalFileName}")
     GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": False})
     return False
+
+
+class _StillsArchive:
+    """
+    Rolling tar of one device's stills, uploaded every so many images or seconds
+    Images are stored as they came (JPEGs don't compress) and an index.json member lists
+    each image's capture epoch and MD5; the minion unpacks these archives when zipping the day
+    The device's last hash is only updated once the archive is in S3
+    Tars that fail to upload are kept and retried on the next flush, up to archiveRetries times
+    """
+
+    def __init__(self, ourFilename, maxImages, maxSecs):
+        self.ourFilename = ourFilename
+        self.baseName = os.path.splitext(ourFilename)[0]
+        self.maxImages = maxImages
+        self.maxSecs = maxSecs
+        self.tarObj = None
+        self.entries = []
+        # Closed tars waiting to be uploaded, oldest first
+        self.pending = []
+
+
+    def add(self, theBucket, lzS3Prefix, finalFileName, ap, imageData, epoch, theHash):
+        if self.tarObj is None:
+            self.archiveName = f"{self.baseName}_{epoch}.TAR"
+            self.localPath = os.path.join(config["workDirectory"], self.archiveName)
+            self.tarObj = tarfile.open(self.localPath, "w")
+            self.startedAt = time.time()
+
+        # Uploaded wherever the last image would have gone; prefixes only change between runs
+        self.bucket = theBucket
+        self.prefix = lzS3Prefix
+        self.ap = ap
+
+        info = tarfile.TarInfo(finalFileName)
+        info.size = len(imageData)
+        info.mtime = epoch
+        self.tarObj.addfile(info, BytesIO(imageData))
+        self.entries.append({"file": finalFileName, "epoch": epoch, "md5": theHash})
+
+
+    def isDue(self):
+        return len(self.entries) >= self.maxImages or time.time() - self.startedAt >= self.maxSecs
+
+
+    def lastHash(self):
+        # Hash of the newest image not yet in S3, if any
+        if self.entries:
+            return self.entries[-1]["md5"]
+        if self.pending:
+            return self.pending[-1]["entries"][-1]["md5"]
+        return None
+
+
+    def flush(self, final=False):
+        # On the last flush of the run every pending tar gets all its attempts; nothing survives it
+        if self.tarObj is not None:
+            index = json.dumps({"images": self.entries}).encode("utf-8")
+            info = tarfile.TarInfo("index.json")
+            info.size = len(index)
+            info.mtime = int(time.time())
+            self.tarObj.addfile(info, BytesIO(index))
+            self.tarObj.close()
+
+            self.pending.append({"archiveName": self.archiveName, "localPath": self.localPath,
+                                 "entries": self.entries, "attempts": 0})
+            self.tarObj = None
+            self.entries = []
+
+        result = True
+        for aTar in list(self.pending):
+            pushed = self._push(aTar)
+            while not pushed and final and aTar["attempts"] < GLOBALS.archiveRetries:
+                pushed = self._push(aTar)
+
+            if pushed:
+                self.pending.remove(aTar)
+                # Only now can the next images be checked against the last one
+                _lastHashes[self.ourFilename] = aTar["entries"][-1]["md5"]
+                _unflushedHashes.add(self.ourFilename)
+                continue
+
+            result = False
+            if aTar["attempts"] < GLOBALS.archiveRetries:
+                # Keep this one and the newer ones in order; try again on the next flush
+                break
+
+            logger.error(f"Archive {aTar['archiveName']} was not pushed to S3 after "
+                         f"{aTar['attempts']} attempts; {len(aTar['entries'])} images lost!")
+            self.pending.remove(aTar)
+            if os.path.isfile(aTar["localPath"]):
+                os.remove(aTar["localPath"])
+            # Nor can the camera answer "not modified" for images that were lost
+            _imageValidators.pop(self.ap.get("accessUrl"), None)
+
+        return result
+
+
+    def _push(self, aTar):
+        aTar["attempts"] += 1
+        logger.info(f"Pushing archive of {len(aTar['entries'])} images to S3 as '{aTar['archiveName']}'")
+        try:
+            return GLOBALS.S3utils.pushToS3(aTar["localPath"],
+                                            self.prefix,
+                                            self.bucket,
+                                            deleteOrig=True,
+                                            extras={"ContentType": "application/x-tar"})
+        except Exception as e:
+            logger.warning(f"Unknown error trying to push {aTar['archiveName']}: {e}")
+            return False
+
+
+def _archiveFor(ap, ourFilename):
+    # Returns the device's rolling archive, or None when the aimpoint doesn't ask for one
+    if not ap.get("stillsArchive"):
+        return None
+
+    if not ap.get("singleCollector"):
+        # Archives are flushed at the end of every run; it'd be one image per archive
+        logger.warning("stillsArchive requires singleCollector; saving images one by one")
+        return None
+
+    if ourFilename not in _archives:
+        _archives[ourFilename] = _StillsArchive(
+            ourFilename,
+            ap.get("archiveImages", GLOBALS.archiveImages),
+            ap.get("archiveSecs", GLOBALS.archiveSecs)
+        )
+    return _archives[ourFilename]
+
+
+def _archiveWasSuccessful(archive, theBucket, lzS3Prefix, finalFileName, ap, imageData, theHash, epoch):
+    logger.info(f"Adding image to archive as '{finalFileName}'")
+    archive.add(theBucket, lzS3Prefix, finalFileName, ap, imageData, epoch, theHash)
+    GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": True})
+
+    if archive.isDue() and not archive.flush():
+        GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": False})
+        return False
+    return True
+
+
+def _flushArchive(ourFilename):
+    archive = _archives.pop(ourFilename, None)
+    if archive and not archive.flush(final=True):
+        GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": archive.ap, "isCollecting": False})
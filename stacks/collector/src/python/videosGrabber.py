@@ -59,6 +59,12 @@ except ModuleNotFoundError as err:
 
 logger = logging.getLogger()
 
+# MPEG-TS constants for the native PTS scanner; see _scanTsPts()
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+TS_SCAN_WINDOW = TS_PACKET_SIZE * 1024      # How much of the head and tail of a segment to read
+TS_VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24, 0x42, 0xEA}
+
 
 def handleVideos(collType, prefixBase, ap, lambdaContext=None):
     # Note that Collectors are assumed to be running because they are indeed supposed to be
@@ -163,36 +169,56 @@ def handleVideos(collType, prefixBase, ap, lambdaContext=None):
         raise HPatrolError("Empty playlist URL")
 
     allSegments = []
+    tracker = _SegmentTracker()
+    poller = _PlaylistPoller(ap, theSleep)
     while True:
         try:
-            tsList, segIniter, tsDurations = _getPlaylist(playlistUrl, ap, newHeaders)
+            tsList, segIniter, tsDurations, seqInfo = _getPlaylist(playlistUrl, ap, newHeaders, poller)
         except ConnectionError as err:
             logger.warning(err)
             break
 
-        try:
-            newM3u8List = _getTsFiles(
-                ap, playlistUrl, tsList, newHeaders, allSegments, tsDurations, segIniter
-            )
-        except KeyError as err:
-            logger.exception(f"Execution error:::{err}")
-            break
+        if poller.notModified:
+            logger.info("Playlist unchanged since the last request; nothing new to retrieve")
+            newM3u8List = []
+        else:
+            # Only go after the segments we haven't already retrieved on a previous iteration
+            newIdxs = tracker.selectNew(tsList, seqInfo)
+            try:
+                newM3u8List = _getTsFiles(
+                    ap,
+                    playlistUrl,
+                    [tsList[i] for i in newIdxs],
+                    newHeaders,
+                    allSegments,
+                    [tsDurations[i] for i in newIdxs],
+                    segIniter,
+                    tracker
+                )
+            except KeyError as err:
+                logger.exception(f"Execution error:::{err}")
+                break
 
         # One long list of segments to analyze as a whole and in case we need to concat them
         allSegments = allSegments + newM3u8List
+        poller.recordIteration(len(newM3u8List) > 0)
 
         # We're only intended to run once
         if not singleCollector:
             logger.info(f"Not a singleCollector request; breaking out")
             break
 
+        theSleep = poller.nextSleep()
         if hput.itsTimeToBail(lambdaContext, breakPoint, theSleep):
             break
         # Don't sleep if we're just using the test data
         if not GLOBALS.useTestData:
-            logger.info(
-                f"Sleeping {sleepyFraction*100:g}% of the poll frequency: {theSleep/1000:.2f}s"
-            )
+            if poller.adaptive:
+                logger.info(f"Sleeping per the playlist's cadence: {theSleep/1000:.2f}s")
+            else:
+                logger.info(
+                    f"Sleeping {sleepyFraction*100:g}% of the poll frequency: {theSleep/1000:.2f}s"
+                )
             time.sleep(theSleep / 1000)
     logger.info("Enough iterations for now")
 
@@ -207,7 +233,9 @@ def handleVideos(collType, prefixBase, ap, lambdaContext=None):
         logger.info(f"Decoy aimpoint; NOT pushing to S3")
         return
 
-    finalSegments = _uploadSegments(ap, wrkBucketName, allSegments, prefixBase)
+    # System-wide dedup for this device; loaded once, checked in memory, written back once
+    dedupIndex = hput.DedupIndex(wrkBucketName, ap["deviceID"]).load()
+    finalSegments = _uploadSegments(ap, wrkBucketName, allSegments, prefixBase, dedupIndex)
     if not finalSegments:
         logger.warning(f"No new segments found")
         GLOBALS.sqsUtils.sendMessage(config["statusQueue"], {"aimpoint": ap, "isCollecting": False})
@@ -283,11 +311,16 @@ def _determineIfFmp4(baseUrl, m3u8Str, useCurl, headers=None):
     return segInit
 
 
-def _playlistRequest(useCurl: bool, headers: dict, url: str) -> Response:
+def _playlistRequest(useCurl: bool, headers: dict, url: str, poller=None) -> Response:
     """Make GET request for the playlist"""
+    # Make it a conditional request if we have validators from a previous response
+    condHeaders = poller.conditionalHeaders(url) if poller else {}
+    if condHeaders:
+        headers = {**(headers or {}), **condHeaders}
+
     try:
         if headers:
-            m3u8Resp = GLOBALS.netUtils.get(url, headers=headers, useCurl=useCurl)
+            m3u8Resp = GLOBALS.netUtils.get(url, headers=headers, useCurl=useCurl, notModifiedOk=bool(condHeaders))
         else:
             m3u8Resp = GLOBALS.netUtils.get(url, useCurl=useCurl)
         return m3u8Resp
@@ -296,7 +329,7 @@ def _playlistRequest(useCurl: bool, headers: dict, url: str) -> Response:
         logger.info("SSL Error - switching to unverified certs")
         GLOBALS.netUtils.disableCertCheck()
         if headers:
-            m3u8Resp = GLOBALS.netUtils.get(url, headers=headers, useCurl=useCurl)
+            m3u8Resp = GLOBALS.netUtils.get(url, headers=headers, useCurl=useCurl, notModifiedOk=bool(condHeaders))
         else:
             m3u8Resp = GLOBALS.netUtils.get(url, useCurl=useCurl)
         return m3u8Resp
@@ -307,8 +340,10 @@ def _playlistRequest(useCurl: bool, headers: dict, url: str) -> Response:
         ) from None
 
 
-def _getPlaylist(url, ap, headers=None):
+def _getPlaylist(url, ap, headers=None, poller=None):
     # From m3u8 URL, get ts files
+    # If a poller is given, requests are conditional and poller.notModified tells
+    # whether the media playlist came back unchanged (HTTP 304)
 
     useCurl = ap.get("useCurl", False)
     attempts = 3  # Try x times before giving up
@@ -321,8 +356,17 @@ def _getPlaylist(url, ap, headers=None):
 
             m3u8Resp = MyClass()
         else:
-            m3u8Resp = _playlistRequest(useCurl, headers=headers, url=url)
-        m3u8Str = m3u8Resp.content.decode("utf-8")
+            m3u8Resp = _playlistRequest(useCurl, headers=headers, url=url, poller=poller)
+
+        notModified = False
+        if poller and getattr(m3u8Resp, "status_code", 200) == 304:
+            # Same playlist as last time; no body was sent, so use what we got before
+            notModified = True
+            m3u8Str = poller.cachedPlaylist(url)
+        else:
+            m3u8Str = m3u8Resp.content.decode("utf-8")
+            if poller and not GLOBALS.useTestData:
+                poller.remember(url, m3u8Resp.headers, m3u8Str)
         logger.debug(f"M3U CONTENTS:\n{m3u8Str}")
 
         playlistObj = m3u8.loads(m3u8Str)
@@ -331,7 +375,7 @@ def _getPlaylist(url, ap, headers=None):
         if playlistObj.is_variant:
             logger.info(f"Received m3u8 variant; analyzing")
             newUrl = _getSubM3uUrl(url, playlistObj)
-            tsList, fmp4Init, tsDurations = _getPlaylist(newUrl, ap)
+            tsList, fmp4Init, tsDurations, seqInfo = _getPlaylist(newUrl, ap, poller=poller)
 
             # Sometimes the subM3uUrl changes us to a different working path
             # for ex.: we went orginally to
@@ -356,15 +400,30 @@ def _getPlaylist(url, ap, headers=None):
                 except IndexError:
                     # There was no addedPath to add
                     pass
-            return tsList, fmp4Init, tsDurations
+            return tsList, fmp4Init, tsDurations, seqInfo
 
         tsList = [x.uri for x in playlistObj.segments]
         tsDurations = [x.duration for x in playlistObj.segments]
 
+        # Used to avoid requesting segments we already have; see _SegmentTracker
+        # Notice the m3u8 library defaults the media sequence to 0 when the tag is absent
+        seqInfo = {
+            "mediaSequence": playlistObj.media_sequence if "#EXT-X-MEDIA-SEQUENCE" in m3u8Str else None,
+            "discontinuitySequence": playlistObj.discontinuity_sequence,
+            "discontinuities": [x.discontinuity for x in playlistObj.segments]
+        }
+
         if _isPlaylistValid(tsList):
             logger.info(f"Total segments in playlist is {len(tsList)}: {tsList}")
+            if poller:
+                poller.notModified = notModified
+                poller.targetDuration = playlistObj.target_duration
+                poller.windowDuration = sum(x or 0 for x in tsDurations)
+            if notModified:
+                # Nothing will be retrieved; don't bother with the initializer
+                return tsList, None, tsDurations, seqInfo
             fmp4Init = _determineIfFmp4(url, m3u8Str, useCurl, headers)
-            return tsList, fmp4Init, tsDurations
+            return tsList, fmp4Init, tsDurations, seqInfo
 
         else:
             logger.warning("Invalid playlist")
@@ -429,75 +488,49 @@ def _isPlaylistValid(m3u8List):
 
 
 def _getTsFiles(
-    targetConfig, playlistUrl, tsList, newHeaders, previousSegments, tsDurations, segIniter=None
+    targetConfig, playlistUrl, tsList, newHeaders, previousSegments, tsDurations, segIniter=None, tracker=None
 ):
     useCurl = targetConfig.get("useCurl", False)
+    numThreads = targetConfig.get("dnThreads", GLOBALS.dnThreads)
+    maxHostConns = targetConfig.get("hostConns", GLOBALS.hostConns)
+
+    try:
+        honorExtinf = True == targetConfig["honorExtinf"]
+    except KeyError:
+        # Aimpoints may not have the honorExtinf key, so avoid raising here
+        honorExtinf = False
+
+    if honorExtinf:
+        # Pacing requests by the segments' durations only makes sense one at a time
+        numThreads = 1
 
-    # Decompose the playlist URL to use its portions later
-    parsedPlaylist = urllib.parse.urlparse(playlistUrl)
+    # Don't go through everything if we're not on PROD
+    if not GLOBALS.onProd and len(tsList) > 4:
+        logger.debug(f"Not running on PROD; limiting processing to the first 4 of {len(tsList)} videos")
+        tsList = tsList[:4]
 
-    # Iterate over tsList to download the video segment files
+    # Iterate over the downloaded video segment files; these come back in playlist order
     fCount = 0
     m3u8List = []
     dedupSet = set(
         [x["hash"] for x in previousSegments]
     )  # sets are faster than lists for lookup
-    for idx, tsEntry in enumerate(tsList):
-        # Don't go through everything if we're not on PROD
-        if not GLOBALS.onProd and idx == 4:
-            logger.debug(f"Not running on PROD; exiting before processing video #{idx}")
-            break
-
-        # Get the video segment file
-        if GLOBALS.useTestData:
-            testFile = "testResources/testVideo.ts"
-            logger.debug(f"Reading from test file '{testFile}'")
-            with open(testFile, "rb") as f:
-                videoContent = f.read()
-
-            class MyClass:
-                content = videoContent
-                headers = {}
-
-            tsResp = MyClass()
-
-        else:
-            # Figure out how the playlist is structured to compose the correct URL
-            if urllib.parse.urlparse(tsEntry).netloc != "":
-                # Sometimes the playlist contains full URLs
-                tsUrl = tsEntry
-
-            elif tsEntry[0] == "/":
-                # For cases where the playlist element starts at the server root
-                tsUrl = urllib.parse.urlunparse(
-                    urllib.parse.ParseResult(
-                        scheme=parsedPlaylist.scheme,
-                        netloc=parsedPlaylist.netloc,
-                        path=tsEntry,
-                        params=None,
-                        query=None,
-                        fragment=None,
-                    )
-                )
-
-            else:
-                # Simple concatenate; last slash is important
-                baseUrl = playlistUrl.split("/")[:-1]  # eliminate the .m3u8 portion
-                tsAccess = "/".join(baseUrl) + "/"
-                tsUrl = tsAccess + tsEntry
+    for idx, tsEntry, segment in _downloadSegments(
+        playlistUrl, tsList, newHeaders, useCurl, numThreads, maxHostConns, segIniter
+    ):
+        if segment is None:
+            continue
 
-            try:
-                tsResp = GLOBALS.netUtils.get(tsUrl, headers=newHeaders, useCurl=useCurl)
-            except Exception:
-                logger.warning(f"Unable to obtain {tsEntry}; continuing")
-                continue
         logger.info(f"Retrieved '{os.path.basename(tsEntry)}'")
-        thisHash = ut.getHashFromData(tsResp.content)
+        thisHash = segment["hash"]
+        if tracker:
+            tracker.markRetrieved(tsEntry)
 
         # Note: This dedup is local for the right-now execution
         # Later there's another dedup check against S3 for system-wide dedup
         if thisHash in dedupSet:
             logger.info(f"Ignored; segment previously captured ({thisHash})")
+            _removeLocalFile(segment["tmpFile"])
             continue
         dedupSet.add(thisHash)
 
@@ -511,7 +544,7 @@ def _getTsFiles(
         )
         ourTsFilename = f"{hput.formatNameBase(targetConfig['filenameBase'], targetConfig['deviceID'])}_{tsLastModDate}.ts"
 
-        # Save segment locally
+        # Save segment locally; it's already on disk, just needs its final name
         localFilenameAndPath = f"{config['workDirectory']}/{ourTsFilename}"
         if os.path.isfile(localFilenameAndPath):
             logger.info(f"Already have file '{ourTsFilename}'")
@@ -521,25 +554,19 @@ def _getTsFiles(
             logger.info(f"Renaming as '{ourTsFilename}'")
             localFilenameAndPath = f"{config['workDirectory']}/{ourTsFilename}"
 
-        with open(localFilenameAndPath, "wb") as f:
-            if segIniter:
-                logger.info("Prefixing with the initialization segment")
-                f.write(segIniter + tsResp.content)
-            else:
-                f.write(tsResp.content)
-        theSize = ut.sizeofFormat(len(tsResp.content))
+        os.replace(segment["tmpFile"], localFilenameAndPath)
+        theSize = ut.sizeofFormat(segment["size"])
         logger.debug(f"Saved as '{localFilenameAndPath}' ({theSize})")
         m3u8List.append({"file": ourTsFilename, "hash": thisHash})
 
         # How many new video segments have we actually gotten
         fCount += 1
 
-        try:
-            if targetConfig["honorExtinf"] == True:
+        if honorExtinf:
+            try:
                 time.sleep(tsDurations[idx])
-        except (KeyError, IndexError):
-            # Aimpoints may not have the honorExtinf key, so avoid raising here
-            pass
+            except IndexError:
+                pass
     if fCount == 0:
         logger.info("No new .ts files detected; could be harmless system overlap")
 
@@ -550,7 +577,278 @@ def _getTsFiles(
     return m3u8List
 
 
-def _uploadSegments(targetConfig, bucketName, origList, prefixBase):
+def _downloadSegments(playlistUrl, tsList, headers, useCurl, numThreads, maxHostConns, segIniter=None):
+    """
+    Generator yielding (idx, tsEntry, segment) tuples strictly in playlist order
+    Segments are fetched by a bounded pool of threads so one slow segment doesn't hold
+    up the rest of the playlist; segment is None if it couldn't be obtained
+    See _fetchSegment() for what the segment dictionary holds
+    """
+    tsUrls = [_composeTsUrl(playlistUrl, tsEntry) for tsEntry in tsList]
+
+    if numThreads <= 1:
+        # Fetch lazily so that any pacing done by the caller happens between requests
+        for idx, tsEntry in enumerate(tsList):
+            yield idx, tsEntry, _fetchSegment(tsEntry, tsUrls[idx], headers, useCurl, maxHostConns, segIniter)
+        return
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=numThreads)
+    futures = []
+    nextIdx = 0
+    try:
+        futures = [
+            executor.submit(_fetchSegment, tsEntry, tsUrl, headers, useCurl, maxHostConns, segIniter)
+            for tsEntry, tsUrl in zip(tsList, tsUrls)
+        ]
+        # Wait on each future in submission order; later segments keep downloading meanwhile
+        for idx, tsEntry in enumerate(tsList):
+            nextIdx = idx + 1
+            yield idx, tsEntry, futures[idx].result()
+    finally:
+        # If the caller stops early, don't bother with what hasn't started yet
+        # and don't leave behind the temporary files of what was never handed over
+        executor.shutdown(wait=True, cancel_futures=True)
+        for aFuture in futures[nextIdx:]:
+            if not aFuture.cancelled() and aFuture.result():
+                _removeLocalFile(aFuture.result()["tmpFile"])
+
+
+def _composeTsUrl(playlistUrl, tsEntry):
+    # Figure out how the playlist is structured to compose the correct URL
+    if urllib.parse.urlparse(tsEntry).netloc != "":
+        # Sometimes the playlist contains full URLs
+        return tsEntry
+
+    if tsEntry[0] == "/":
+        # For cases where the playlist element starts at the server root
+        parsedPlaylist = urllib.parse.urlparse(playlistUrl)
+        return urllib.parse.urlunparse(
+            urllib.parse.ParseResult(
+                scheme=parsedPlaylist.scheme,
+                netloc=parsedPlaylist.netloc,
+                path=tsEntry,
+                params=None,
+                query=None,
+                fragment=None,
+            )
+        )
+
+    # Simple concatenate; last slash is important
+    baseUrl = playlistUrl.split("/")[:-1]  # eliminate the .m3u8 portion
+    tsAccess = "/".join(baseUrl) + "/"
+    return tsAccess + tsEntry
+
+
+def _fetchSegment(tsEntry, tsUrl, headers, useCurl, maxHostConns, segIniter=None):
+    # Get the video segment file; runs in the download threads
+    # The segment is streamed to a temporary file while being hashed, so no more than
+    # one chunk is ever held in memory; returns {"tmpFile", "hash", "size"} or None
+    # Note the hash is of the segment alone, without the initializer
+    tmpFile = f"{config['workDirectory']}/{ut.generateRandomInt(signed=False)}.tmp"
+    if segIniter:
+        logger.info("Prefixing with the initialization segment")
+
+    if GLOBALS.useTestData:
+        testFile = "testResources/testVideo.ts"
+        logger.debug(f"Reading from test file '{testFile}'")
+        with open(testFile, "rb") as f:
+            chunks = iter(lambda: f.read(GLOBALS.segChunkSize), b"")
+            theHash, theSize = ut.writeChunksToFile(chunks, tmpFile, segIniter, ut.getFastHashObj())
+        return {"tmpFile": tmpFile, "hash": theHash, "size": theSize}
+
+    hostLimiter = hput.getHostLimiter(urllib.parse.urlparse(tsUrl).netloc, maxHostConns)
+    try:
+        with hostLimiter:
+            # Curl responses come fully buffered; only the requests library can stream
+            tsResp = GLOBALS.netUtils.get(tsUrl, headers=headers, useCurl=useCurl, stream=not useCurl)
+            try:
+                if useCurl:
+                    chunks = [tsResp.content]
+                else:
+                    chunks = tsResp.iter_content(chunk_size=GLOBALS.segChunkSize)
+                theHash, theSize = ut.writeChunksToFile(chunks, tmpFile, segIniter, ut.getFastHashObj())
+            finally:
+                if not useCurl:
+                    tsResp.close()
+    except Exception:
+        logger.warning(f"Unable to obtain {tsEntry}; continuing")
+        _removeLocalFile(tmpFile)
+        return None
+
+    return {"tmpFile": tmpFile, "hash": theHash, "size": theSize}
+
+
+def _removeLocalFile(filePath):
+    try:
+        os.remove(filePath)
+    except FileNotFoundError:
+        pass
+
+
+class _SegmentTracker:
+    """
+    Remembers which playlist segments were already retrieved during a singleCollector run
+    so that each playlist refresh only requests the segments not seen before
+
+    Segments are identified by their media sequence number (EXT-X-MEDIA-SEQUENCE plus their
+    position in the playlist) together with their URI. Whenever the sequence can't be trusted
+    (no sequence tag, sequence resets, discontinuities, or a URI that doesn't match what we
+    saw for that number) all segments are requested and the hash dedup sorts it out.
+    """
+
+    def __init__(self):
+        self.retrieved = {}         # media sequence number -> URI, for segments we obtained
+        self.pending = {}           # URI -> media sequence number, for segments being requested
+        self.lastSequence = None
+        self.lastDiscontinuitySeq = None
+
+
+    def selectNew(self, tsList, seqInfo) -> list:
+        """Returns the indexes of the tsList segments that need to be requested"""
+        allIdxs = list(range(len(tsList)))
+        mediaSeq = seqInfo["mediaSequence"]
+        self.pending = {}
+
+        if mediaSeq is None:
+            logger.debug("Playlist has no media sequence; requesting all segments")
+            self._reset()
+            return allIdxs
+
+        if self.lastSequence is not None and mediaSeq < self.lastSequence:
+            logger.info(f"Media sequence went back ({self.lastSequence} -> {mediaSeq}); requesting all segments")
+            self._reset()
+
+        if seqInfo["discontinuitySequence"] != self.lastDiscontinuitySeq:
+            if self.retrieved:
+                logger.info("Discontinuity sequence changed; requesting all segments")
+            self._reset()
+
+        newIdxs = []
+        for idx, tsEntry in enumerate(tsList):
+            knownUri = self.retrieved.get(mediaSeq + idx)
+            if knownUri is None:
+                if self.retrieved and seqInfo["discontinuities"][idx]:
+                    logger.info("Discontinuity among the new segments; requesting all segments")
+                    return self._restart(tsList, seqInfo)
+                newIdxs.append(idx)
+            elif knownUri != tsEntry:
+                logger.info(f"Segment #{mediaSeq + idx} changed URI; requesting all segments")
+                return self._restart(tsList, seqInfo)
+
+        # Forget the segments that already slid out of the playlist window
+        self.retrieved = {seq: uri for seq, uri in self.retrieved.items() if seq >= mediaSeq}
+        self.lastSequence = mediaSeq
+        self.lastDiscontinuitySeq = seqInfo["discontinuitySequence"]
+        self.pending = {tsList[idx]: mediaSeq + idx for idx in newIdxs}
+
+        skipped = len(tsList) - len(newIdxs)
+        if skipped:
+            logger.info(f"Skipping {skipped} segment{'s' if skipped > 1 else ''} already retrieved")
+
+        return newIdxs
+
+
+    def markRetrieved(self, tsEntry):
+        seq = self.pending.pop(tsEntry, None)
+        if seq is not None:
+            self.retrieved[seq] = tsEntry
+
+
+    def _restart(self, tsList, seqInfo):
+        self._reset()
+        return self.selectNew(tsList, seqInfo)
+
+
+    def _reset(self):
+        self.retrieved = {}
+        self.pending = {}
+        self.lastSequence = None
+        self.lastDiscontinuitySeq = None
+
+
+class _PlaylistPoller:
+    """
+    Keeps what's needed to poll a live playlist without wasting requests
+
+    Playlist requests are made conditional (If-None-Match/If-Modified-Since) whenever the
+    server gave us validators, so unchanged playlists come back as a body-less 304.
+    With the aimpoint's "adaptivePoll" set, the time between refreshes follows the
+    playlist's EXT-X-TARGETDURATION instead of the fixed poll frequency: we wake up when
+    the next segment is expected, and back off while the playlist doesn't change.
+    """
+
+    def __init__(self, ap, defaultSleep):
+        self.conditional = ap.get("conditionalPoll", True) and not ap.get("useCurl", False)
+        self.adaptive = True == ap.get("adaptivePoll", False)
+        self.defaultSleep = defaultSleep    # in milliseconds, as calculateExecutionStop() gives it
+        self.validators = {}                # URL -> {"etag", "lastMod", "body"}
+
+        # Set by _getPlaylist() on every media playlist it processes
+        self.notModified = False
+        self.targetDuration = None
+        self.windowDuration = 0
+
+        self.lastFetchAt = None
+        self.lastNewSegmentAt = None
+        self.unchangedCount = 0
+
+
+    def conditionalHeaders(self, url) -> dict:
+        self.lastFetchAt = time.time() * 1000
+        if not self.conditional or url not in self.validators:
+            return {}
+
+        condHeaders = {}
+        if self.validators[url]["etag"]:
+            condHeaders["If-None-Match"] = self.validators[url]["etag"]
+        if self.validators[url]["lastMod"]:
+            condHeaders["If-Modified-Since"] = self.validators[url]["lastMod"]
+        return condHeaders
+
+
+    def remember(self, url, headers, body):
+        if not self.conditional:
+            return
+        etag = headers.get("ETag")
+        lastMod = headers.get("Last-Modified")
+        if etag or lastMod:
+            self.validators[url] = {"etag": etag, "lastMod": lastMod, "body": body}
+        else:
+            # Server doesn't support conditional requests for this one
+            self.validators.pop(url, None)
+
+
+    def cachedPlaylist(self, url):
+        return self.validators[url]["body"]
+
+
+    def recordIteration(self, gotNew):
+        if gotNew:
+            self.lastNewSegmentAt = self.lastFetchAt
+            self.unchangedCount = 0
+        else:
+            self.unchangedCount += 1
+
+
+    def nextSleep(self):
+        """Returns how long to wait (in milliseconds) before the next playlist refresh"""
+        if not self.adaptive or not self.targetDuration:
+            return self.defaultSleep
+
+        targetDuration = self.targetDuration * 1000
+        if self.unchangedCount == 0 and self.lastNewSegmentAt:
+            # The next segment is expected about a target duration after the last one showed up
+            theSleep = self.lastNewSegmentAt + targetDuration - time.time() * 1000
+        else:
+            # Per the HLS spec, retry after half the target duration; and back off on every miss
+            theSleep = targetDuration / 2 * 2 ** max(0, self.unchangedCount - 1)
+
+        # Never wait so long that segments slide out of the playlist before we see them
+        ceiling = max(targetDuration / 2, self.windowDuration * 1000 / 2)
+        return int(min(max(theSleep, targetDuration / 2), ceiling))
+
+
+def _uploadSegments(targetConfig, bucketName, origList, prefixBase, dedupIndex=None):
     try:
         doConcat = True == targetConfig["concatenate"]
     except KeyError:
@@ -584,10 +882,10 @@ def _uploadSegments(targetConfig, bucketName, origList, prefixBase):
                 # and no, the probabilities of that are near nil; don't waste effort.
                 theHash = None
             else:
-                theHash = ut.getHashFromFile(config["workDirectory"], concatedFile)
+                theHash = ut.getFastHashFromFile(config["workDirectory"], concatedFile)
 
             if not _wasSaveSuccessful(
-                concatedFile, prefixBase, bucketName, origList[0]["file"], theHash
+                concatedFile, prefixBase, bucketName, origList[0]["file"], theHash, dedupIndex
             ):
                 raise HPatrolError("Error pushing to S3")
         except FileNotFoundError as err:
@@ -613,7 +911,7 @@ def _uploadSegments(targetConfig, bucketName, origList, prefixBase):
                 finalFileName = origList[idx]["file"]
 
                 # Schedule the callable function _wasSaveSuccesful with its parameters
-                futureObj = executor.submit(_wasSaveSuccessful, fileNamePath, prefixBase, bucketName, finalFileName, aTsFile["hash"])
+                futureObj = executor.submit(_wasSaveSuccessful, fileNamePath, prefixBase, bucketName, finalFileName, aTsFile["hash"], dedupIndex)
 
                 # The executers dictionary looks like this
                 #   Key:   ThreadPoolExecutor future object
@@ -635,18 +933,17 @@ def _uploadSegments(targetConfig, bucketName, origList, prefixBase):
                 except Exception as exc:
                     logger.error(f"Exception from '{finalFileName}' :::{exc}")
             finalList.sort(key=hput.naturalKeys)
+
+    if dedupIndex:
+        dedupIndex.flush()
     return finalList
 
 
-def _wasSaveSuccessful(filetoSave, prefixBase, bucketName, s3FileName, theHash):
-    # Note: On this dup-check technique we put the hash as a filename,
-    # on other dup-checks, we put the hash in the file contents
-    # FIXME: Add a target discriminator to the hashfiles location
-    #        It seems we're starting to see MD5 collisions
-    if theHash:
-        if GLOBALS.S3utils.isFileInS3(
-            bucketName, f"{GLOBALS.s3Hashfiles}/{theHash}.md5"
-        ):
+def _wasSaveSuccessful(filetoSave, prefixBase, bucketName, s3FileName, theHash, dedupIndex=None):
+    # The dedup index is per device, so same-content segments from other targets don't collide
+    # Without an index (or a hash) there's no system-wide dedup check
+    if theHash and dedupIndex is not None:
+        if theHash in dedupIndex:
             logger.info(f"Ignored; {s3FileName} previously captured ({theHash})")
             return False
 
@@ -657,11 +954,8 @@ def _wasSaveSuccessful(filetoSave, prefixBase, bucketName, s3FileName, theHash):
         s3BaseFileName=s3FileName,
         deleteOrig=GLOBALS.onProd
     ):
-        if theHash:
-            if not GLOBALS.S3utils.createEmptyKey(
-                bucketName, f"{GLOBALS.s3Hashfiles}/{theHash}.md5"
-            ):
-                logger.warning("Could not create MD5 file; ignoring its creation")
+        if theHash and dedupIndex is not None:
+            dedupIndex.add(theHash)
         return True
 
     return False
@@ -674,87 +968,31 @@ def _fixTsFilesOrder(tsList):
     for aTsFile in tsList:
         localFilePath = f"{config['workDirectory']}/{aTsFile['file']}"
 
-        # Get frame's metadata
-        commandString = f"{config['ffprobe']} -hide_banner -show_frames -print_format json {localFilePath}".split()
-        # logger.debug(f"commandString: {commandString}")
-        ffprobeResult = subprocess.run(commandString, capture_output=True, text=True)
+        # Reading the PTS straight from the MPEG-TS packets is much cheaper than forking ffprobe
+        # ffprobe is still used for anything we can't parse (e.g. fMP4, corrupted files)
+        thePts = _scanTsPts(localFilePath)
+        if not thePts:
+            logger.debug(f"Unable to scan PTS natively; using ffprobe on '{aTsFile['file']}'")
+            thePts = _probeTsPts(localFilePath)
 
-        if ffprobeResult.returncode != 0:
+        if not thePts:
             # Ignore and delete problematic frames; don't include them in the final list
-            logger.error(
-                f"Frame ignored {ffprobeResult.stderr} (ffprobeResult.returnCode={ffprobeResult.returncode})"
-            )
             try:
                 if GLOBALS.onProd:
                     os.remove(localFilePath)
             except FileNotFoundError:
                 pass
-        else:
-            videoInfo = json.loads(ffprobeResult.stdout)
-            # logger.debug(json.dumps(videoInfo)) # Print ffprobe's raw JSON result
-            try:
-                firstFrame = videoInfo["frames"][0]
-                lastFrame = videoInfo["frames"][-1]
-            except IndexError:
-                logger.error("FFprobe data does not contain frames; segment ignored")
-                logger.debug(videoInfo)
-                try:
-                    if GLOBALS.onProd:
-                        os.remove(localFilePath)
-                except FileNotFoundError:
-                    pass
-                continue
-
-            try:
-                pktPts1st = firstFrame["pkt_pts"]
-            except KeyError:
-                logger.error(
-                    "First frame does not contain presentation timestamp (pkt_pts); trying the next"
-                )
-                firstFrame = videoInfo["frames"][1]
-                try:
-                    pktPts1st = firstFrame["pkt_pts"]
-                except KeyError:
-                    logger.error(
-                        "Second frame does not contain presentation timestamp (pkt_pts); segment ignored"
-                    )
-                    logger.debug(json.dumps(videoInfo))
-                    try:
-                        if GLOBALS.onProd:
-                            os.remove(localFilePath)
-                    except FileNotFoundError:
-                        pass
-                    continue
-
-            try:
-                pktPtsLst = lastFrame["pkt_pts"]
-            except KeyError:
-                logger.error(
-                    "Last frame does not contain presentation timestamp (pkt_pts); trying the next"
-                )
-                lastFrame = videoInfo["frames"][-2]
-                try:
-                    pktPtsLst = lastFrame["pkt_pts"]
-                except KeyError:
-                    logger.error(
-                        "Frame does not contain presentation timestamp (pkt_pts); segment ignored"
-                    )
-                    logger.debug(json.dumps(videoInfo))
-                    try:
-                        if GLOBALS.onProd:
-                            os.remove(localFilePath)
-                    except FileNotFoundError:
-                        pass
-                    continue
-
-            toSort.append(
-                {
-                    "first": pktPts1st,
-                    "last": pktPtsLst,
-                    "file": aTsFile["file"],
-                    "hash": aTsFile["hash"]
-                }
-            )
+            continue
+        pktPts1st, pktPtsLst = thePts
+
+        toSort.append(
+            {
+                "first": pktPts1st,
+                "last": pktPtsLst,
+                "file": aTsFile["file"],
+                "hash": aTsFile["hash"]
+            }
+        )
 
     # Sort the files by the frame's presentation timestamp (pkt_pts; PTS)
     newSorted = sorted(toSort, key=lambda d: d["first"])
@@ -807,3 +1045,189 @@ def _fixTsFilesOrder(tsList):
         logger.info("Segments obtained in proper sequence")
 
     return toReturn
+
+
+def _probeTsPts(localFilePath):
+    # Returns the (first, last) presentation timestamps (pkt_pts) of the segment per ffprobe
+    # Returns None if the segment should be ignored
+    commandString = f"{config['ffprobe']} -hide_banner -show_frames -print_format json {localFilePath}".split()
+    # logger.debug(f"commandString: {commandString}")
+    ffprobeResult = subprocess.run(commandString, capture_output=True, text=True)
+
+    if ffprobeResult.returncode != 0:
+        logger.error(
+            f"Frame ignored {ffprobeResult.stderr} (ffprobeResult.returnCode={ffprobeResult.returncode})"
+        )
+        return None
+
+    videoInfo = json.loads(ffprobeResult.stdout)
+    # logger.debug(json.dumps(videoInfo)) # Print ffprobe's raw JSON result
+    try:
+        firstFrame = videoInfo["frames"][0]
+        lastFrame = videoInfo["frames"][-1]
+    except IndexError:
+        logger.error("FFprobe data does not contain frames; segment ignored")
+        logger.debug(videoInfo)
+        return None
+
+    try:
+        pktPts1st = firstFrame["pkt_pts"]
+    except KeyError:
+        logger.error(
+            "First frame does not contain presentation timestamp (pkt_pts); trying the next"
+        )
+        firstFrame = videoInfo["frames"][1]
+        try:
+            pktPts1st = firstFrame["pkt_pts"]
+        except KeyError:
+            logger.error(
+                "Second frame does not contain presentation timestamp (pkt_pts); segment ignored"
+            )
+            logger.debug(json.dumps(videoInfo))
+            return None
+
+    try:
+        pktPtsLst = lastFrame["pkt_pts"]
+    except KeyError:
+        logger.error(
+            "Last frame does not contain presentation timestamp (pkt_pts); trying the next"
+        )
+        lastFrame = videoInfo["frames"][-2]
+        try:
+            pktPtsLst = lastFrame["pkt_pts"]
+        except KeyError:
+            logger.error(
+                "Frame does not contain presentation timestamp (pkt_pts); segment ignored"
+            )
+            logger.debug(json.dumps(videoInfo))
+            return None
+
+    return pktPts1st, pktPtsLst
+
+
+
+def _scanTsPts(localFilePath):
+    """
+    Returns the (first, last) video presentation timestamps of an MPEG-TS segment
+    reading only the packets at the head and the tail of the file
+    Returns None if the file can't be parsed as MPEG-TS (e.g. fMP4, corrupted, no video)
+    """
+    try:
+        with open(localFilePath, "rb") as f:
+            head = f.read(TS_SCAN_WINDOW)
+            fileSize = os.fstat(f.fileno()).st_size
+            if fileSize > TS_SCAN_WINDOW:
+                f.seek(max(TS_SCAN_WINDOW, fileSize - TS_SCAN_WINDOW))
+                tail = f.read()
+            else:
+                tail = b""
+    except OSError as err:
+        logger.warning(f"Unable to read segment for PTS scan:::{err}")
+        return None
+
+    headPackets = list(_iterTsPackets(head))
+    videoPid = _findVideoPid(headPackets)
+    if videoPid is None:
+        return None
+
+    headPts = _collectPesPts(headPackets, videoPid)
+    if not headPts:
+        return None
+    tailPts = _collectPesPts(_iterTsPackets(tail), videoPid) or headPts
+
+    # Frames may be stored out of presentation order (B-frames); so smallest up front, largest at the end
+    return min(headPts), max(tailPts)
+
+
+def _iterTsPackets(data):
+    # Yields the 188-byte packets in data, starting at the first position where the sync byte repeats
+    start = None
+    for offset in range(min(TS_PACKET_SIZE, len(data))):
+        if all(
+            data[i] == TS_SYNC_BYTE
+            for i in range(offset, min(offset + TS_PACKET_SIZE * 3, len(data)), TS_PACKET_SIZE)
+        ):
+            start = offset
+            break
+    if start is None:
+        return
+
+    for i in range(start, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        if data[i] != TS_SYNC_BYTE:
+            # Lost sync; don't risk misreading whatever follows
+            return
+        yield data[i:i + TS_PACKET_SIZE]
+
+
+def _tsPayload(packet):
+    # Returns (pid, payloadUnitStart, payload) of a TS packet
+    pid = ((packet[1] & 0x1F) << 8) | packet[2]
+    payloadUnitStart = bool(packet[1] & 0x40)
+    adaptationCtrl = (packet[3] >> 4) & 0x03
+    if not adaptationCtrl & 0x01:
+        return pid, payloadUnitStart, b""
+    offset = 4
+    if adaptationCtrl & 0x02:
+        offset += 1 + packet[4]
+    return pid, payloadUnitStart, packet[offset:]
+
+
+def _psiSection(payload):
+    # Skip the pointer field; return the section and the end of its data (excluding CRC32)
+    if not payload:
+        return None, 0
+    section = payload[1 + payload[0]:]
+    if len(section) < 3:
+        return None, 0
+    sectionLength = ((section[1] & 0x0F) << 8) | section[2]
+    return section, min(len(section), 3 + sectionLength) - 4
+
+
+def _findVideoPid(packets):
+    # Use the Program Association Table to find the Program Map Table, and in it, the video stream
+    pmtPid = None
+    for packet in packets:
+        pid, payloadUnitStart, payload = _tsPayload(packet)
+        if not payloadUnitStart:
+            continue
+
+        if pid == 0x0000 and pmtPid is None:
+            section, dataEnd = _psiSection(payload)
+            if section is None or section[0] != 0x00:
+                continue
+            for i in range(8, dataEnd - 3, 4):
+                programNumber = (section[i] << 8) | section[i + 1]
+                if programNumber != 0:
+                    pmtPid = ((section[i + 2] & 0x1F) << 8) | section[i + 3]
+                    break
+
+        elif pmtPid is not None and pid == pmtPid:
+            section, dataEnd = _psiSection(payload)
+            if section is None or section[0] != 0x02 or dataEnd < 12:
+                continue
+            i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+            while i + 5 <= dataEnd:
+                streamType = section[i]
+                esPid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+                if streamType in TS_VIDEO_STREAM_TYPES:
+                    return esPid
+                i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+            return None
+
+    return None
+
+
+def _collectPesPts(packets, videoPid):
+    # Returns the PTS of every video PES header found in the packets
+    allPts = []
+    for packet in packets:
+        pid, payloadUnitStart, payload = _tsPayload(packet)
+        if pid != videoPid or not payloadUnitStart or len(payload) < 14:
+            continue
+        if payload[0:3] != b"\x00\x00\x01" or not payload[7] & 0x80:
+            continue
+        p = payload[9:14]
+        allPts.append(
+            ((p[0] >> 1) & 0x07) << 30 | p[1] << 22 | (p[2] >> 1) << 15 | p[3] << 7 | p[4] >> 1
+        )
+    return allPts
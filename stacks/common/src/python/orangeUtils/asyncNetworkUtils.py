@@ -0,0 +1,278 @@
+"""
+Asyncio sibling of networkUtils.NetworkUtils
+
+Same surface (get/post/options, proxy, cert fallback, manual 302 handling and user-agent
+rotation) but on an httpx.AsyncClient, which pools keep-alive connections and speaks
+HTTP/2 to servers that offer it; so many requests can be fanned out on one event loop.
+
+Example:
+    async with AsyncNetworkUtils(proxy=None, sessionHeaders={}, workDirectory="/tmp") as net:
+        responses = await net.getMany(listOfUrls)
+"""
+
+# External libraries import statements
+import ssl
+import json
+import httpx
+import asyncio
+import logging
+import urllib.parse
+from fake_useragent import UserAgent
+
+
+logger = logging.getLogger()
+
+class AsyncNetworkUtils:
+    """
+    Common async methods for network operations on many of our collection efforts
+    """
+
+    def __init__(self, **kwargs):
+        logger.debug("Initializing async network client ")
+
+        # These "allowedKeys" become part of the object as self.xxx
+        # transport is only meant for testing (e.g. an httpx.MockTransport)
+        allowedKeys = {"proxy", "sessionHeaders", "workDirectory", "verify",
+                       "maxConnections", "maxPerHost", "http2", "transport"}
+        self.proxy = None
+        self.verify = None
+        self.http2 = True
+        self.transport = None
+        self.maxPerHost = 6
+        self.maxConnections = 100
+        self.sessionHeaders = {}
+        self.workDirectory = None
+        self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowedKeys)
+
+        # Per-host connection limits; httpx only limits the pool as a whole
+        self.hostLimiters = {}
+        self.maxRedirects = 30
+
+        # Swapping the client is guarded so concurrent failures only swap it once
+        # Replaced clients may still have requests in flight; they're closed on close()
+        self.swapLock = asyncio.Lock()
+        self.retiredClients = []
+
+        # Single client object so connections are reused between calls
+        # If you want a different user agent string be sure to call switchAgentString()
+        self.sessionObj = self._newClient(True if self.verify is None else self.verify)
+        self.switchAgentString()
+
+
+    def _newClient(self, verify):
+        if self.proxy:
+            # requests accepts a bare "host:port"; httpx wants the scheme
+            proxy = self.proxy if "://" in self.proxy else f"http://{self.proxy}"
+            logger.debug(f"PROXY: {proxy}")
+        else:
+            proxy = None
+            logger.debug(f"PROXY: Not set")
+
+        return httpx.AsyncClient(
+            http2=self.http2,
+            proxy=proxy,
+            verify=verify,
+            transport=self.transport,
+            headers=self.sessionHeaders,
+            limits=httpx.Limits(
+                max_connections=self.maxConnections,
+                max_keepalive_connections=self.maxConnections
+            )
+        )
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+
+
+    async def close(self):
+        for aClient in self.retiredClients:
+            await aClient.aclose()
+        self.retiredClients = []
+        await self.sessionObj.aclose()
+
+
+    def _swapClient(self, verify):
+        # Don't aclose() the old client here; other coroutines may still be using it
+        self.retiredClients.append(self.sessionObj)
+        self.sessionObj = self._newClient(verify)
+        self.switchAgentString()
+
+
+    async def restartSessionObj(self):
+        logger.info("Reseting the network session object")
+        async with self.swapLock:
+            self._swapClient(True if self.verify is None else self.verify)
+
+
+    async def disableCertCheck(self):
+        # This disables cert checking for the entire session, not just one call
+        async with self.swapLock:
+            if self.verify is False:
+                logger.debug("SSL check already disabled")
+                return
+            logger.info("Disabling SSL (i.e. verify=False)")
+            self.verify = False
+            self._swapClient(False)
+
+
+    def switchAgentString(self):
+        newAgentString = self.getUserAgentString()
+        logger.debug(f"Switching user agent string: {newAgentString}")
+        self.sessionHeaders["User-Agent"] = newAgentString
+        self.sessionObj.headers.update(self.sessionHeaders)
+
+
+    def _hostLimiter(self, inUrl):
+        netloc = urllib.parse.urlparse(inUrl).netloc
+        if netloc not in self.hostLimiters:
+            self.hostLimiters[netloc] = asyncio.Semaphore(self.maxPerHost)
+        return self.hostLimiters[netloc]
+
+
+    async def _request(self, method, inUrl, timeout, **kwargs):
+        # requests' allow_redirects becomes httpx's follow_redirects; same default as requests
+        followRedirects = kwargs.pop("allow_redirects", True)
+        async with self._hostLimiter(inUrl):
+            return await self.sessionObj.request(
+                method, inUrl, timeout=timeout, follow_redirects=followRedirects, **kwargs
+            )
+
+
+    async def get(self, inUrl, timeout=20, **kwargs):
+        # For conditional requests (If-None-Match/If-Modified-Since) the caller can accept
+        # a 304 Not Modified response instead of having it raised as an error
+        notModifiedOk = kwargs.pop("notModifiedOk", False)
+
+        if kwargs.pop("useCurl", False):
+            logger.warning("pycurl is not available on the async client; using httpx")
+
+        logger.info(f"Trying GET access: '{inUrl}'")
+        try:
+            if "headers" in kwargs:
+                logger.debug("Will request using new headers")
+            response = await self._request("GET", inUrl, timeout, **kwargs)
+
+        except (ssl.SSLError, httpx.ConnectError) as err:
+            if not isinstance(err, ssl.SSLError) and "CERTIFICATE" not in str(err).upper():
+                response = await self._retryAfterError("GET", inUrl, timeout, err, **kwargs)
+            else:
+                logger.warning(err)
+                await self.disableCertCheck()
+                try:
+                    response = await self._request("GET", inUrl, timeout, **kwargs)
+                except Exception as e:
+                    logger.critical(f"Caught Exception twice while attempting {inUrl} ::{e}")
+                    logger.info("Giving up")
+                    raise
+
+        except Exception as e:
+            response = await self._retryAfterError("GET", inUrl, timeout, e, **kwargs)
+
+        # Handle re-directs ourselves when requested to circumvent any anti-scraping techniques
+        if response.status_code == 302:
+            logger.info(f"Re-direct response detected (HTTP 302)")
+            if "Location" in response.headers:
+                # Need to strip the headers out of the previous request for anti-scraping
+                # Seen on 08.04.23 for ivdeon.com
+                if "headers" in kwargs:
+                    del kwargs["headers"]
+                for i in range(self.maxRedirects):
+                    redirUrl = str(response.headers['Location'])
+                    logger.info(f"URL redirected to: '{redirUrl}'")
+                    response = await self._request("GET", redirUrl, timeout, **kwargs)
+                    if response.status_code != 302:
+                        break
+                    if not "Location" in response.headers:
+                        break
+
+        if response.status_code == 304 and notModifiedOk:
+            logger.info(f"Not modified since last request (HTTP 304): '{inUrl}'")
+            return response
+
+        if response.status_code !=200:
+            logger.warning(f"RESPONSE !=200: '{response}' attempting '{inUrl}'")
+            if str(response.request.url) != inUrl:
+                logger.debug("Response.request.url was different than Requested.url")
+                logger.debug(f"Requested URL in Response is '{response.request.url}'")
+                logger.debug(f'Request Headers:\n{json.dumps(dict(response.request.headers))}')
+                logger.debug(f'Response Headers:\n{json.dumps(dict(response.headers))}')
+            raise ConnectionError("NOT 200")
+
+        return response
+
+
+    async def _retryAfterError(self, method, inUrl, timeout, err, **kwargs):
+        logger.warning(f"Caught Exception while attempting {inUrl} ::{err}")
+        logger.info("Sleeping for 30s to see if we can recover")
+        await asyncio.sleep(30)
+        logger.info("Trying again...")
+
+        try:
+            return await self._request(method, inUrl, timeout, **kwargs)
+        except Exception as e:
+            logger.critical(f"Caught Exception twice while attempting {inUrl} ::{e}")
+            logger.info("Giving up")
+            raise
+
+
+    async def getMany(self, inUrls, **kwargs):
+        """
+        GETs all the given URLs concurrently; within the per-host and pool limits
+        Results come back in the same order as inUrls; failed requests return their exception
+        """
+        return await asyncio.gather(
+            *(self.get(aUrl, **kwargs) for aUrl in inUrls),
+            return_exceptions=True
+        )
+
+
+    async def post(self, inUrl, verify=True, timeout=20, **kwargs):
+        logger.info(f"Trying POST access: '{inUrl}'")
+        if not verify and self.verify is not False:
+            # httpx only handles verification per client, not per call
+            await self.disableCertCheck()
+
+        try:
+            if "headers" in kwargs:
+                logger.debug("Will request using new headers")
+            response = await self._request("POST", inUrl, timeout, **kwargs)
+
+        except Exception as e:
+            response = await self._retryAfterError("POST", inUrl, timeout, e, **kwargs)
+
+        if response.status_code !=200:
+            logger.warning(f"RESPONSE !=200: '{response}' attempting '{inUrl}'")
+            if str(response.request.url) != inUrl:
+                logger.debug("Response.request.url was different than Requested.url")
+                logger.debug(f"Requested URL in Response is '{response.request.url}'")
+            logger.debug(f'Request Headers:\n{json.dumps(dict(response.request.headers))}')
+            logger.debug(f'Response Headers:\n{json.dumps(dict(response.headers))}')
+            raise ConnectionError("NOT 200")
+
+        return response
+
+
+    async def options(self, inUrl, timeout=20, **kwargs):
+        logger.info(f"Trying OPTIONS access: '{inUrl}'")
+
+        try:
+            response = await self._request("OPTIONS", inUrl, timeout, **kwargs)
+        except Exception as e:
+            logger.warning(f'Caught Exception while attempting {inUrl} ::{e}')
+            raise ConnectionError(f"OPTIONS access failed: {e}") from None
+
+        if response.status_code !=200:
+            logger.warning(f"RESPONSE !=200: '{response}' attempting '{inUrl}'")
+            raise ConnectionError("NOT 200")
+
+        return response
+
+
+    def getUserAgentString(self):
+        ua = UserAgent(os=['linux', 'windows'], browsers=['chrome', 'firefox'])
+        return ua.random
@@ -14,9 +14,13 @@ import getpass
 import urllib3
 import requests
 import warnings
+import threading
+import collections
 import configparser
+import concurrent.futures
 import keyring.backends.SecretService as SS
 from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
 from botocore.exceptions import NoRegionError
 from botocore.exceptions import ParamValidationError
 from botocore.exceptions import CredentialRetrievalError
@@ -101,6 +105,151 @@ class SQSutils:
         return resp
 
 
+    def batchSender(self, theQueue, retries=2):
+        """
+        Return an SQSBatchSender for the queue; use it as a context manager so it's flushed at the end
+            with GLOBALS.sqsUtils.batchSender(queue) as sender:
+                sender.send(message, delay)
+        """
+        return SQSBatchSender(self.sqsClient, theQueue, retries)
+
+
+    def receiveMessages(self, theQueue, maxMessages=10, waitSecs=20):
+        # Long-polls the queue; returns an empty list when nothing arrived within waitSecs
+        try:
+            resp = self.sqsClient.receive_message(
+                QueueUrl=theQueue,
+                WaitTimeSeconds=waitSecs,
+                MaxNumberOfMessages=max(1, min(maxMessages, 10))
+            )
+        except Exception as e:
+            logger.error(f"EXCEPTION CAUGHT: {e} Using queue '{theQueue}")
+            return []
+
+        return resp.get("Messages", [])
+
+
+    def deleteMessage(self, theQueue, receiptHandle):
+        try:
+            self.sqsClient.delete_message(QueueUrl=theQueue, ReceiptHandle=receiptHandle)
+        except Exception as e:
+            logger.error(f"EXCEPTION CAUGHT: {e} Using queue '{theQueue}")
+            return False
+
+        return True
+
+
+    def releaseMessage(self, theQueue, receiptHandle, visibilitySecs=0):
+        # Makes a received message visible again after visibilitySecs, for another consumer to take
+        try:
+            self.sqsClient.change_message_visibility(
+                QueueUrl=theQueue, ReceiptHandle=receiptHandle, VisibilityTimeout=visibilitySecs
+            )
+        except Exception as e:
+            logger.error(f"EXCEPTION CAUGHT: {e} Using queue '{theQueue}")
+            return False
+
+        return True
+
+
+class SQSBatchSender:
+    """
+    Groups messages into send_message_batch requests, each entry keeping its own delay
+    Messages are serialized when added, so callers are free to modify them afterwards
+    Entries that fail for reasons other than the sender's are retried; safe to use from several threads
+    """
+    MAX_ENTRIES = 10            # SQS limit of entries per batch
+    MAX_BYTES = 256 * 1024      # SQS limit for the total payload of a batch
+
+    def __init__(self, sqsClient, theQueue, retries=2):
+        self.sqsClient = sqsClient
+        self.theQueue = theQueue
+        self.retries = retries
+
+        self.sent = 0
+        self.failed = 0
+        self.requests = 0
+
+        self._entries = []
+        self._entriesSize = 0
+        self._nextId = 0
+        self._lock = threading.Lock()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback):
+        self.flush()
+        return False
+
+
+    def send(self, message, delay=0):
+        body = json.dumps(message)
+        size = len(body.encode("utf-8"))
+
+        toSend = None
+        with self._lock:
+            if self._entries and self._entriesSize + size > self.MAX_BYTES:
+                toSend = self._takeEntries()
+            self._entries.append({"Id": str(self._nextId), "MessageBody": body, "DelaySeconds": int(delay)})
+            self._entriesSize += size
+            self._nextId += 1
+            if toSend is None and len(self._entries) == self.MAX_ENTRIES:
+                toSend = self._takeEntries()
+
+        # The request goes out of the lock so other threads can keep adding
+        if toSend:
+            self._sendBatch(toSend)
+
+
+    def flush(self):
+        with self._lock:
+            toSend = self._takeEntries()
+        if toSend:
+            self._sendBatch(toSend)
+
+
+    def _takeEntries(self):
+        entries = self._entries
+        self._entries = []
+        self._entriesSize = 0
+        return entries
+
+
+    def _sendBatch(self, entries):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(0.2 * 2 ** attempt)
+
+            try:
+                resp = self.sqsClient.send_message_batch(QueueUrl=self.theQueue, Entries=entries)
+                failed = resp.get("Failed", [])
+            except Exception as e:
+                logger.error(f"EXCEPTION CAUGHT: {e} Using queue '{self.theQueue}")
+                failed = [{"Id": x["Id"], "SenderFault": False} for x in entries]
+
+            # Sender faults (e.g. an invalid message) won't succeed on a retry
+            for aFailure in failed:
+                if aFailure.get("SenderFault"):
+                    logger.error(f"Message not sent to '{self.theQueue}': {aFailure.get('Code')} {aFailure.get('Message')}")
+            retryIds = {x["Id"] for x in failed if not x.get("SenderFault")}
+
+            with self._lock:
+                self.requests += 1
+                self.sent += len(entries) - len(failed)
+                self.failed += len(failed) - len(retryIds)
+
+            entries = [x for x in entries if x["Id"] in retryIds]
+            if not entries:
+                return
+
+        logger.warning(f"Failed to send {len(entries)} messages to '{self.theQueue}' after {self.retries} retries")
+        with self._lock:
+            self.failed += len(entries)
+
+
 class SecretsUtils:
     def __init__(self, profile=None):
         logger.debug("Initializing Secrets Manager")
@@ -175,6 +324,8 @@ class SNSutils:
 class S3utils:
     def __init__(self, accessKey, secretKey, bucketName, profile=None):
         logger.debug("Initializing S3 client ")
+        # Buckets already confirmed to exist; checked once per process, not on every write
+        self.knownBuckets = set()
         try:
             if profile:
                 logger.debug("Attempting connection using AWS profile")
@@ -190,6 +341,7 @@ class S3utils:
                 self.s3Client = boto3.client('s3', aws_access_key_id=accessKey, aws_secret_access_key=secretKey, use_ssl=False)
 
             self.s3Client.head_bucket(Bucket=bucketName)
+            self.knownBuckets.add(bucketName)
         except (ClientError, CredentialRetrievalError) as e:
             logger.critical("Error accessing S3; check credentials, tokens, and access permissions")
             logger.critical(e)
@@ -199,6 +351,26 @@ class S3utils:
         logger.debug("S3 client inited ")
 
 
+    def _bucketExists(self, bucketName):
+        if bucketName in self.knownBuckets:
+            return True
+
+        try:
+            self.s3Client.head_bucket(Bucket=bucketName)
+        except ClientError as e:
+            logger.critical("Error finding {} bucket!: {}".format(bucketName, e))
+            return False
+
+        self.knownBuckets.add(bucketName)
+        return True
+
+
+    def _recheckBucketOn(self, bucketName, err):
+        # Errors saying the bucket is gone (or we lost access) get it checked again on the next write
+        if any(x in str(err) for x in ("NoSuchBucket", "AccessDenied", "(403)", "(404)")):
+            self.knownBuckets.discard(bucketName)
+
+
     def getFileMetadata(self, bucketName, s3Key, mtdtKey):
         # Get any requested metadata such as the ETAG, LastModified, etc.
 
@@ -378,25 +550,27 @@ class S3utils:
                                 bucketName=bucketName) is not None
 
 
-    def getWildcardKey(self, wildcardKey, bucketName, limit=None, unique=False):
+    def getWildcardKey(self, wildcardKey, bucketName, limit=None, unique=False, asObjects=False):
         """
-        Returns a list of S3 objects matching the wildcard expression
+        Returns a list of S3 keys matching the wildcard expression
 
         :param wildcardKey: the path to the key
         :type wildcardKey: str
         :param bucketName: the name of the bucket
         :type bucketName: str
+        :param asObjects: return the listed S3 objects (Key, Size, ETag...) instead of their keys
+        :type asObjects: bool
         """
 
         prefix = re.split(r'[*]', wildcardKey, 1)[0]
         # logger.debug(f"Prefix searched: {prefix}")
-        kList = self.getFilesAsStrList(bucketName, prefix, limit, closedSearch=False, unique=unique)
-        if kList:
-            keyMatches = [k for k in kList if fnmatch.fnmatch(k, wildcardKey)]
-            if keyMatches:
-                logger.info(f"Total matching files: {len(keyMatches)}")
-                # logger.debug(f"WildcardKey Matches:{keyMatches}")
-                return keyMatches
+        objList = self.getFilesAsObjList(bucketName, prefix, limit, closedSearch=False, unique=unique)
+        if objList:
+            objMatches = [obj for obj in objList if fnmatch.fnmatch(obj["Key"], wildcardKey)]
+            if objMatches:
+                logger.info(f"Total matching files: {len(objMatches)}")
+                # logger.debug(f"WildcardKey Matches:{objMatches}")
+                return objMatches if asObjects else [obj["Key"] for obj in objMatches]
 
         return None
 
@@ -414,10 +588,7 @@ class S3utils:
 
 
     def pushDataToS3(self, bucketName, s3Key, theData):
-        try:
-            self.s3Client.head_bucket(Bucket=bucketName)
-        except ClientError as e:
-            logger.critical("Error finding {} bucket!: {}".format(bucketName, e))
+        if not self._bucketExists(bucketName):
             return False
 
         try:
@@ -425,6 +596,7 @@ class S3utils:
             # logger.info(f'Uploaded file:  {s3Key}')
 
         except ClientError as e:
+            self._recheckBucketOn(bucketName, e)
             logger.error(f'Upload failed:  {s3Key}')
             logger.error(f'Error:  {e}')
             logger.error(f'Error Response: {e.response}')
@@ -439,10 +611,7 @@ class S3utils:
         # e.g. extras={'Expires': expirationDate}
         #      extras={'ContentType': 'application/json'}
 
-        try:
-            self.s3Client.head_bucket(Bucket=bucketName)
-        except ClientError as e:
-            logger.critical("Error finding {} bucket!: {}".format(bucketName, e))
+        if not self._bucketExists(bucketName):
             return False
 
         if not s3BaseFileName:
@@ -468,7 +637,11 @@ class S3utils:
                                       )
 
             logger.info(f"Successful upload of '{s3Filename}'")
+        except S3UploadFailedError as e:
+            self._recheckBucketOn(bucketName, e)
+            raise
         except ClientError as e:
+            self._recheckBucketOn(bucketName, e)
             logger.error(f'File upload failed:  {localFilePath} -> {s3Filename}')
             logger.error(f'Error:  {e}')
             logger.error(f'Error Response: {e.response}')
@@ -490,6 +663,47 @@ class S3utils:
         return True
 
 
+    def pushFileObjToS3(self, fileObj, s3DirPrefix, bucketName, s3BaseFileName, **kwargs):
+        # Same as pushToS3() but from a file-like object; e.g. data that never touched the disk
+        # ExtraArgs for AWS's upload_fileobj() can be received in the 'extras' parameter
+        # e.g. extras={'ContentType': 'image/jpeg', 'Metadata': {'md5': theHash}}
+
+        if not self._bucketExists(bucketName):
+            return False
+
+        s3Filename = f"{s3DirPrefix}/{s3BaseFileName}"
+
+        # Don't forget the encryption stuff, or you'll get AccessDenied errors on Put
+        extraArgs={}
+        extraArgs["ServerSideEncryption"] = "AES256"
+
+        try:
+            # Add any additional ExtraArgs received, if any
+            extraArgs.update(kwargs['extras'])
+        except KeyError:
+            pass
+
+        try:
+            self.s3Client.upload_fileobj(Fileobj=fileObj,
+                                         Bucket=bucketName,
+                                         Key=s3Filename,
+                                         ExtraArgs=extraArgs
+                                         )
+
+            logger.info(f"Successful upload of '{s3Filename}'")
+        except S3UploadFailedError as e:
+            self._recheckBucketOn(bucketName, e)
+            raise
+        except ClientError as e:
+            self._recheckBucketOn(bucketName, e)
+            logger.error(f'Upload failed:  {s3Filename}')
+            logger.error(f'Error:  {e}')
+            logger.error(f'Error Response: {e.response}')
+            return False
+
+        return True
+
+
     def getFileFromS3(self, bucketName, key, localFilenameAndPath):
         # logger.debug(f"Requesting getFile with bucketName='{bucketName}' key='{key}'")
         try:
@@ -521,10 +735,91 @@ class S3utils:
         return True
 
 
+    def getFilesFromS3(self, bucketName, keys, localDir, maxThreads=8, retries=2, byteBudget=None):
+        """
+        Downloads the given keys into localDir concurrently; each file keeps its base name
+
+        :param keys: S3 keys; or S3 objects as returned by getFilesAsObjList() so their sizes are known
+        :param retries: times a failed download is tried again before leaving it out
+        :param byteBudget: optional cap on the total bytes downloaded (e.g. the room left in /tmp);
+                           files are admitted in input order and those that don't fit are left out
+
+        Returns the local paths of the files downloaded, in the same order as keys
+        Raises ValueError when two keys share a base name; they'd overwrite each other in localDir
+        """
+        keys = list(keys)
+        sizes = [aKey.get("Size") if isinstance(aKey, dict) else None for aKey in keys]
+        keys = [aKey["Key"] if isinstance(aKey, dict) else aKey for aKey in keys]
+
+        baseNames = collections.Counter(os.path.basename(aKey) for aKey in keys)
+        clashes = sorted(aKey for aKey in keys if baseNames[os.path.basename(aKey)] > 1)
+        if clashes:
+            raise ValueError(f"Keys with the same base name can't share '{localDir}': {clashes}")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=maxThreads) as executor:
+            admitted = range(len(keys))
+            if byteBudget is not None:
+                missing = [idx for idx, aSize in enumerate(sizes) if aSize is None]
+                for idx, aSize in zip(missing, executor.map(lambda idx: self._getSize(bucketName, keys[idx]), missing)):
+                    sizes[idx] = aSize
+
+                admitted = []
+                usedBytes = 0
+                for idx, aSize in enumerate(sizes):
+                    if usedBytes + aSize > byteBudget:
+                        logger.warning(f"Download budget of {byteBudget:,} bytes reached; leaving out {len(keys) - idx} files")
+                        break
+                    usedBytes += aSize
+                    admitted.append(idx)
+
+            paths = {idx: os.path.join(localDir, os.path.basename(keys[idx])) for idx in admitted}
+            results = executor.map(lambda idx: self._getFileWithRetries(bucketName, keys[idx], paths[idx], retries), admitted)
+            downloaded = [paths[idx] for idx, ok in zip(admitted, results) if ok]
+
+        if len(downloaded) != len(keys):
+            logger.warning(f"Downloaded {len(downloaded)} of {len(keys)} files")
+        return downloaded
+
+
+    def _getSize(self, bucketName, key):
+        try:
+            return self.s3Client.head_object(Bucket=bucketName, Key=key)["ContentLength"]
+        except ClientError as err:
+            # Left for the download to fail and report
+            logger.warning(f"Unable to get the size of '{key}': {err}")
+            return 0
+
+
+    def _getFileWithRetries(self, bucketName, key, localFilenameAndPath, retries):
+        for attempt in range(retries + 1):
+            if attempt:
+                logger.info(f"Retrying download of '{key}' ({attempt}/{retries})")
+                time.sleep(attempt)
+            if self.getFileFromS3(bucketName, key, localFilenameAndPath):
+                return True
+        logger.error(f"Giving up downloading '{key}'")
+        return False
+
+
+    def getFileStream(self, bucketName, key):
+        # The object's body to be read as it arrives; nothing is written to disk
+        return self.s3Client.get_object(Bucket=bucketName, Key=key)['Body']
+
+
+    def streamToS3(self, bucketName, s3Key, partSize=16 * 1024 * 1024, **kwargs):
+        # Returns a writable stream uploading to s3Key as a multipart upload; use it in a with-statement
+        # The upload is completed when the with-block ends, or aborted if it ends in an exception
+        # ExtraArgs for create_multipart_upload() can be received in the 'extras' parameter
+        if not self._bucketExists(bucketName):
+            raise ValueError(f"Bucket not found: {bucketName}")
+        return S3MultipartWriter(self.s3Client, bucketName, s3Key, partSize, kwargs.get('extras', {}))
+
+
     def readFileContent(self, bucketName, key, encoding="utf-8"):
         try:
             obj = self.s3Client.get_object(Bucket=bucketName, Key=key)
-            return obj['Body'].read().decode(encoding)
+            # No encoding returns the raw bytes
+            return obj['Body'].read().decode(encoding) if encoding else obj['Body'].read()
 
         except ClientError as e:
             # An S3 interface error; file may not be in S3 but we're thinking it is
@@ -550,6 +845,24 @@ class S3utils:
             return None
 
 
+    def readFileIfChanged(self, bucketName, key, etag=None, encoding="utf-8"):
+        """
+        Conditional readFileContent(); returns (content, ETag)
+        Content is None with the given ETag when the file hasn't changed, or with None when it can't be read
+        """
+        try:
+            kwargs = {"IfNoneMatch": etag} if etag else {}
+            obj = self.s3Client.get_object(Bucket=bucketName, Key=key, **kwargs)
+            content = obj['Body'].read()
+            return (content.decode(encoding) if encoding else content), obj['ETag']
+
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+                return None, etag
+            logger.warning(f"EXCEPTION CAUGHT Attempting read from '{key}': {e}")
+            return None, None
+
+
     def isFileInS3(self, bucket, key):
         try:
             self.s3Client.head_object(Bucket=bucket, Key=key)
@@ -586,19 +899,61 @@ class S3utils:
             return False
 
 
-    def deleteEntireKey(self, bucket, key):
+    def deleteEntireKey(self, bucket, key, dryRun=False):
+        """
+        Deletes every file under the key; similarly named keys are left alone
+        Returns (count, failed): the number of files deleted (or to be deleted, on a dryRun)
+        and the list of keys that could not be deleted; it used to return nothing
+        """
+        # Each listed page (up to 1000 keys) is deleted with a single delete_objects request
+        # while the next page is being listed
         logger.info(f"Looking for files to delete in '{key}'")
-        fileList = self.getFilesAsStrList(bucket, key)
-        # logger.debug(f"fileList:{fileList}")
 
+        # Same as getFilesAsStrList(); so similarly named directories are left alone
+        prefix = key if key.endswith("/") else f"{key}/"
+        pages = self.s3Client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix)
+
+        found = 0
+        failed = []
+        futures = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            try:
+                for page in pages:
+                    # Sometimes when the 'folder' is created it is counted as a file; we don't want that
+                    batch = [{"Key": obj["Key"]} for obj in page.get("Contents", []) if os.path.basename(obj["Key"])]
+                    found += len(batch)
+                    if batch and not dryRun:
+                        futures.append(executor.submit(self._deleteBatch, bucket, batch))
+            except ClientError as err:
+                logger.error(f"ClientError listing files to delete in '{key}'")
+                logger.error(err)
+
+            for aFuture in futures:
+                failed.extend(aFuture.result())
+
+        if dryRun:
+            logger.info(f"Dry run; would delete {found:,} files")
+            return found, failed
+
+        if failed:
+            logger.warning(f"Unable to delete {len(failed):,} of {found:,} files; e.g. '{failed[0]}'")
+        logger.info(f"Deleted {found - len(failed):,} files")
+        return found - len(failed), failed
+
+
+    def _deleteBatch(self, bucket, batch):
+        # Returns the keys that could not be deleted
         try:
-            for aFile in fileList:
-                if not self.deleteFileInS3(bucket, aFile):
-                    logger.warning(f"Unable to delete '{aFile}'")
-        except TypeError as err:
-            # In case fileList is empty
-            # logger.info(f"Unable to delete:::{err}")
-            pass
+            response = self.s3Client.delete_objects(Bucket=bucket, Delete={"Objects": batch, "Quiet": True})
+        except ClientError as err:
+            logger.error(f"ClientError deleting a batch of {len(batch)} files")
+            logger.error(err)
+            return [obj["Key"] for obj in batch]
+
+        errors = response.get("Errors", [])
+        for anError in errors:
+            logger.debug(f"Unable to delete '{anError['Key']}': {anError.get('Code')}")
+        return [anError["Key"] for anError in errors]
 
 
     def moveFileToDifferentKey(self, bucket, oldKey, newKey):
@@ -626,6 +981,26 @@ class S3utils:
         return True
 
 
+    def copyLargeFile(self, srcBucketName, srcObjKey, dstBucketName, dstObjKey):
+        # Same as copyFileToDifferentBucket() but as a managed (multipart) copy; needed over 5GB
+        # The copy is done by S3 itself; the data doesn't come through here
+        logger.info(f"Copying {srcBucketName}/{srcObjKey} to {dstBucketName}/{dstObjKey}")
+
+        try:
+            copySource = {
+                'Bucket': srcBucketName,
+                'Key': srcObjKey
+            }
+            self.s3Client.copy(copySource, dstBucketName, dstObjKey, ExtraArgs={"ServerSideEncryption": "AES256"})
+            logger.info(f"Copy successful")
+            return True
+
+        except ClientError as error:
+            logger.warning(f"Copy failed")
+            logger.warning(error.response['Error']['Message'])
+            return False
+
+
     def copyFileToDifferentBucket(self, srcBucketName, srcObjKey, dstBucketName, dstObjKey):
         logger.info(f"Copying {srcBucketName}/{srcObjKey} to {dstBucketName}/{dstObjKey}")
 
@@ -644,6 +1019,84 @@ class S3utils:
             return False
 
 
+class S3MultipartWriter:
+    """
+    Write-only file-like object that uploads what's written to S3 in parts
+    Not seekable; e.g. zipfile writes to it as a stream using data descriptors
+    """
+
+    def __init__(self, s3Client, bucketName, s3Key, partSize, extras):
+        self.s3Client = s3Client
+        self.bucketName = bucketName
+        self.s3Key = s3Key
+        # S3 requires at least 5MB for all parts but the last
+        self.partSize = max(partSize, 5 * 1024 * 1024)
+        self.buffer = bytearray()
+        self.parts = []
+        self.position = 0
+
+        # Don't forget the encryption stuff, or you'll get AccessDenied errors on Put
+        extraArgs = {"ServerSideEncryption": "AES256"}
+        extraArgs.update(extras)
+        response = self.s3Client.create_multipart_upload(Bucket=bucketName, Key=s3Key, **extraArgs)
+        self.uploadId = response["UploadId"]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType:
+            self.abort()
+        else:
+            self.close()
+
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.position += len(data)
+        while len(self.buffer) >= self.partSize:
+            self._uploadPart(bytes(self.buffer[:self.partSize]))
+            del self.buffer[:self.partSize]
+        return len(data)
+
+
+    def tell(self):
+        return self.position
+
+
+    def flush(self):
+        # Parts only go up once they're big enough; see close()
+        pass
+
+
+    def _uploadPart(self, data):
+        partNumber = len(self.parts) + 1
+        response = self.s3Client.upload_part(
+            Bucket=self.bucketName, Key=self.s3Key, UploadId=self.uploadId, PartNumber=partNumber, Body=data
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": partNumber})
+
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self._uploadPart(bytes(self.buffer))
+            self.buffer.clear()
+        self.s3Client.complete_multipart_upload(
+            Bucket=self.bucketName, Key=self.s3Key, UploadId=self.uploadId, MultipartUpload={"Parts": self.parts}
+        )
+        logger.info(f"Successful upload of '{self.s3Key}' ({self.position:,} bytes in {len(self.parts)} parts)")
+
+
+    def abort(self):
+        logger.error(f"Aborting upload of '{self.s3Key}'")
+        try:
+            self.s3Client.abort_multipart_upload(Bucket=self.bucketName, Key=self.s3Key, UploadId=self.uploadId)
+        except ClientError as err:
+            logger.warning(f"Unable to abort the upload: {err}")
+
+
 class AWScreds:
     def __init__(self, configFile):
         logger.debug("Initializing AWS creds ")
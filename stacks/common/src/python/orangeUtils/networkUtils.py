@@ -8,9 +8,11 @@ import time
 import json
 import shutil
 import pycurl
+import hashlib
 import logging
 import requests
 import ipaddress
+import requests.adapters
 import datetime as dt
 from io import BytesIO
 from typing import Optional
@@ -31,13 +33,16 @@ class NetworkUtils:
         logger.debug("Initializing network client ")
 
         # These "allowedKeys" become part of the object as self.xxx
-        allowedKeys = {"proxy", "sessionHeaders", "workDirectory", "verify"}
+        # poolHosts is how many different hosts keep their connections alive in the session;
+        # only needed by long-running processes that go after many hosts (requests keeps 10)
+        allowedKeys = {"proxy", "sessionHeaders", "workDirectory", "verify", "poolHosts"}
+        self.poolHosts = None
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowedKeys)
 
         # Set up our requests library session
         # Single session object so we don't have to reinstantiate every time
         # If you want a different user agent string be sure to call switchAgentString()
-        self.sessionObj = requests.Session()
+        self.sessionObj = self._newSession()
 
         # For cases where we're bundling our own CA files (e.g. for VPN)
         if self.verify:
@@ -64,7 +69,7 @@ class NetworkUtils:
         logger.info("Reseting the network session object")
         tmpProxies = self.sessionObj.proxies
 
-        self.sessionObj = requests.Session()
+        self.sessionObj = self._newSession()
         self.switchAgentString()
         self.sessionObj.proxies = tmpProxies
 
@@ -74,13 +79,22 @@ class NetworkUtils:
         logger.info("Disabling SSL (i.e. verify=False)")
 
         tmpProxies = self.sessionObj.proxies
-        self.sessionObj = requests.Session()
+        self.sessionObj = self._newSession()
         self.sessionObj.verify = False
 
         self.switchAgentString()
         self.sessionObj.proxies = tmpProxies
 
 
+    def _newSession(self):
+        sessionObj = requests.Session()
+        if self.poolHosts:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.poolHosts)
+            sessionObj.mount("http://", adapter)
+            sessionObj.mount("https://", adapter)
+        return sessionObj
+
+
     def switchAgentString(self):
         newAgentString = self.getUserAgentString()
         logger.debug(f"Switching user agent string: {newAgentString}")
@@ -88,15 +102,27 @@ class NetworkUtils:
         self.sessionObj.headers.update(self.sessionHeaders)
 
 
-    def downloadImage(self, fileName, inUrl):
+    def downloadImage(self, fileName, inUrl, validators=None):
+        # If given, validators is the caller's {"etag", "lastMod"} from the last download of inUrl
+        # The request is then conditional; a 304 Not Modified is returned with nothing written
+        # and on a 200 the validators are updated in place for the next call
         logger.info(f"Downloading image: {inUrl}")
 
-        response = requests.get(inUrl, stream=True)
+        condHeaders = self._conditionalHeaders(validators)
+        response = requests.get(inUrl, stream=True, headers=condHeaders)
+        if response.status_code == 304 and condHeaders:
+            logger.info(f"Image not modified since last request (HTTP 304): '{inUrl}'")
+            return response
+
         if response.status_code == 200:
             fullFilePath = os.path.join(self.workDirectory, fileName)
             # Create image file; open as binary
             with open(fullFilePath, 'wb') as f:
                 shutil.copyfileobj(response.raw, f)
+
+            if validators is not None:
+                validators["etag"] = response.headers.get("ETag")
+                validators["lastMod"] = response.headers.get("Last-Modified")
             return response
 
         else:
@@ -104,6 +130,44 @@ class NetworkUtils:
             raise ConnectionError(f"Received status '{response.status_code}' trying {inUrl}")
 
 
+    def downloadImageData(self, inUrl, validators=None, chunkSize=64 * 1024):
+        # Same as downloadImage() but keeps the image in memory, MD5-hashing it as it arrives
+        # Returns (response, imageBytes, md5Hexdigest); on a 304 the bytes and hash are None
+        # Goes through the session so concurrent callers share its pooled connections and proxy
+        logger.info(f"Downloading image: {inUrl}")
+
+        condHeaders = self._conditionalHeaders(validators)
+        response = self.sessionObj.get(inUrl, stream=True, headers=condHeaders, timeout=20)
+        if response.status_code == 304 and condHeaders:
+            logger.info(f"Image not modified since last request (HTTP 304): '{inUrl}'")
+            return response, None, None
+
+        if response.status_code != 200:
+            logger.warning(f"Received status '{response.status_code}' trying {inUrl}")
+            raise ConnectionError(f"Received status '{response.status_code}' trying {inUrl}")
+
+        md5 = hashlib.md5()
+        imageData = BytesIO()
+        for chunk in response.iter_content(chunk_size=chunkSize):
+            md5.update(chunk)
+            imageData.write(chunk)
+
+        if validators is not None:
+            validators["etag"] = response.headers.get("ETag")
+            validators["lastMod"] = response.headers.get("Last-Modified")
+        return response, imageData.getvalue(), md5.hexdigest()
+
+
+    def _conditionalHeaders(self, validators):
+        condHeaders = {}
+        if validators:
+            if validators.get("etag"):
+                condHeaders["If-None-Match"] = validators["etag"]
+            if validators.get("lastMod"):
+                condHeaders["If-Modified-Since"] = validators["lastMod"]
+        return condHeaders
+
+
     def getFileEtag(self, inUrl):
         substringPattern = "\"(.*?)\""      # to grab the string between the double-quotes
         r = self.sessionObj.head(inUrl)
@@ -200,6 +264,10 @@ class NetworkUtils:
 
 
     def get(self, inUrl, timeout=20, **kwargs):
+        # For conditional requests (If-None-Match/If-Modified-Since) the caller can accept
+        # a 304 Not Modified response instead of having it raised as an error
+        notModifiedOk = kwargs.pop("notModifiedOk", False)
+
         # Make request using pycurl library
         if kwargs.pop("useCurl", False):
             buffer = BytesIO()
@@ -311,6 +379,10 @@ class NetworkUtils:
                     if not "Location" in response.headers:
                         break
 
+        if response.status_code == 304 and notModifiedOk:
+            logger.info(f"Not modified since last request (HTTP 304): '{inUrl}'")
+            return response
+
         if response.status_code !=200:
             logger.warning(f"RESPONSE !=200: '{response}' attempting '{inUrl}'")
             if response.request.url != inUrl:
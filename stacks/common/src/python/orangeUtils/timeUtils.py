@@ -6,9 +6,12 @@ Time handling utility methods
 # External libraries import statements
 import os
 import re
+import json
 import time
+import bisect
 import logging
 import zoneinfo
+import functools
 import datetime as dt
 from random import shuffle
 from datetime import timezone
@@ -16,6 +19,10 @@ from datetime import timezone
 
 logger = logging.getLogger()
 
+# Time-of-day arithmetic is done in whole microseconds, so results are exact
+_US = 1000000
+_DAY_US = 86400 * _US
+
 
 def returnYMD(timestamp):
     inDate = dt.datetime.fromtimestamp(timestamp, tz=timezone.utc)
@@ -107,9 +114,44 @@ def getWorkHours(when=None, workHours=None):
     # TargetTime = 2023-09-12 03:04:25.447934+12:00
     # WorkHours  = ['0809-1000', '1300-1728']
 
+    # Randomization is done again on every call; the parsing isn't
+    schedule = compileWorkHours(workHours).randomized()
+
+    try:
+        targetTime = when.astimezone(schedule.tz)
+        # logger.debug(f"When: {when}")
+    except AttributeError as err:
+        when = dt.datetime.now()
+        targetTime = when.astimezone(schedule.tz)
+        # logger.debug(f"When: {when}")
+
+    logger.info(f"TargetTime:  {targetTime.strftime('%H%M (%Y-%m-%d)')} \"{schedule.tz}\"")
+    logger.info(f"WorkHours: {schedule.ranges}")
+    # A copy; without "rndm" the schedule is the cached one, shared by every aimpoint with the same spec
+    return targetTime, list(schedule.ranges)
+
+
+def compileWorkHours(workHours=None):
+    """
+    Return the WorkHours for an aimpoint's "hours" spec, e.g.
+        {"tz": "Pacific/Auckland", "hrs": ["0800-0955", "1300-1730"], "rndm": 15}
+    Compiled once per distinct spec and kept; missing values get the defaults (UTC, all day)
+    """
+    try:
+        key = json.dumps(workHours, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return _compileWorkHours(workHours)
+    return _compiledWorkHours(key)
+
+
+@functools.lru_cache(maxsize=4096)
+def _compiledWorkHours(key):
+    return _compileWorkHours(json.loads(key))
+
+
+def _compileWorkHours(workHours):
     try:
-        targetTz = workHours['tz']
-        targetTz = zoneinfo.ZoneInfo(targetTz)
+        targetTz = zoneinfo.ZoneInfo(workHours['tz'])
     except (KeyError, TypeError) as err:
         logger.warning(f"Working Hours parameter missing; using default values: {err}")
         targetTz = zoneinfo.ZoneInfo("UTC")
@@ -122,22 +164,108 @@ def getWorkHours(when=None, workHours=None):
         theRanges = ['0000-2359']
 
     try:
-        targetTime = when.astimezone(targetTz)
-        # logger.debug(f"When: {when}")
-    except AttributeError as err:
-        when = dt.datetime.now()
-        targetTime = when.astimezone(targetTz)
-        # logger.debug(f"When: {when}")
-
-    try:
-        theRanges = randomizeTimeRanges(theRanges, workHours['rndm'])
+        randomFactor = workHours['rndm']
     except (KeyError, TypeError):
         # Don't randomize
-        pass
+        randomFactor = None
+
+    return WorkHours(targetTz, theRanges, randomFactor)
 
-    logger.info(f"TargetTime:  {targetTime.strftime('%H%M (%Y-%m-%d)')} \"{targetTz}\"")
-    logger.info(f"WorkHours: {theRanges}")
-    return targetTime, theRanges
+
+class WorkHours:
+    """
+    Working hours in a time zone; the ranges are kept as time-of-day intervals so that the
+    questions below are answered with interval arithmetic instead of checking times one by one
+    Same semantics as isTimeInRange(): a range's start and end minutes are both inside it
+    """
+
+    def __init__(self, tz, ranges, randomFactor=None):
+        self.tz = tz
+        self.ranges = list(ranges)
+        self.randomFactor = randomFactor
+        self.intervals = [_rangeInterval(aRange) for aRange in self.ranges]
+
+
+    def randomized(self):
+        """Returns a copy with the ranges randomized; see randomizeTimeRanges()"""
+        if self.randomFactor is None:
+            return self
+        return WorkHours(self.tz, randomizeTimeRanges(self.ranges, self.randomFactor))
+
+
+    def isActive(self, when=None):
+        """Whether the time (default now) is within any of the ranges"""
+        tod = _timeOfDay((when or dt.datetime.now()).astimezone(self.tz))
+        return any(start <= tod <= end for start, end in self.intervals)
+
+
+    def activeWindows(self, theTime, first, last, aRange=None):
+        """
+        Returns the (from, to) whole-second offsets within [first, last] that, added to theTime,
+        land inside the ranges (or inside aRange, if given)
+        """
+        tod = _timeOfDay(theTime.astimezone(self.tz))
+        intervals = [_rangeInterval(aRange)] if aRange else self.intervals
+
+        windows = []
+        for start, end in intervals:
+            if start > end:
+                # Same as isTimeInRange(); ranges going past midnight never match
+                continue
+            # The offsets landing in the interval on day k are [start-tod+k*DAY, end-tod+k*DAY]
+            firstDay = -((end - tod - first * _US) // _DAY_US)
+            lastDay = (last * _US - start + tod) // _DAY_US
+            for k in range(firstDay, lastDay + 1):
+                lo = max(first, -((tod - start - k * _DAY_US) // _US))
+                hi = min(last, (end - tod + k * _DAY_US) // _US)
+                if lo <= hi:
+                    windows.append((lo, hi))
+
+        return sorted(windows)
+
+
+    def offsetsIn(self, offsets, theTime, aRange=None):
+        """Returns the offsets (in whole seconds) that, added to theTime, land inside the ranges; order is kept"""
+        offsets = list(offsets)
+        if not offsets:
+            return []
+
+        ordered = sorted(offsets)
+        kept = set()
+        for lo, hi in self.activeWindows(theTime, ordered[0], ordered[-1], aRange):
+            kept.update(ordered[bisect.bisect_left(ordered, lo):bisect.bisect_right(ordered, hi)])
+
+        return [x for x in offsets if x in kept]
+
+
+    def secondsUntilClose(self, targetTime, normalWorktime):
+        """
+        Seconds between targetTime and the end of its range, when less than normalWorktime (minutes)
+        Raises ValueError when targetTime isn't in a range closing that soon
+        """
+        tod = _timeOfDay(targetTime)
+        # Only hours and minutes count, the same as replacing them in targetTime
+        todMins = tod - tod % (60 * _US)
+        for start, end in self.intervals:
+            if start <= tod <= end:
+                timeLeft = (end - todMins) // _US
+                if timeLeft < int(normalWorktime) * 60:
+                    return timeLeft
+
+        raise ValueError
+
+
+def _timeOfDay(aTime):
+    # Microseconds since midnight, wall-clock
+    return ((aTime.hour * 60 + aTime.minute) * 60 + aTime.second) * _US + aTime.microsecond
+
+
+@functools.lru_cache(maxsize=1024)
+def _rangeInterval(aRange):
+    # "HHMM-HHMM" to (start, end) in microseconds since midnight; raises ValueError on bad ranges
+    start = dt.time(int(aRange[0:2]), int(aRange[2:4]), 0)
+    end = dt.time(int(aRange[5:7]), int(aRange[7:9]), 0)
+    return _timeOfDay(start), _timeOfDay(end)
 
 
 def randomizeTimeRanges(timeRanges: list, randomFactor: int):
@@ -218,16 +346,7 @@ def getReducedSegmentsRange(rangeList: list, theTime: dt, tz: str, aRange: str):
     # newRangeList=[120, 130, 140, 150, 160, 170, 180, 190, 200, 210, 220, 230, 240, 250, 260,
     #              270, 280, 290, 300, 310, 320, 330, 340, 350, 360, 370, 380, 390, 400, 410, 420]
 
-    newRangeList = []
-    targetTz = zoneinfo.ZoneInfo(tz)
-    baseTime = theTime.astimezone(targetTz)
-    # logger.debug(f"baseTime: {baseTime}")
-    for x in rangeList:
-        newTime = baseTime + dt.timedelta(seconds=x)
-        # logger.debug(f"newTime: {newTime}")
-
-        if isTimeInRange(newTime, aRange):
-            newRangeList.append(x)
+    newRangeList = WorkHours(zoneinfo.ZoneInfo(tz), []).offsetsIn(rangeList, theTime, aRange)
 
     # logger.debug(f"rangeList\n {rangeList}")
     # logger.debug(f"newRangeList\n {newRangeList}")
@@ -248,24 +367,8 @@ def closeShopSecsLeft(timeRanges: list, targetTime: dt, normalWorktime: int):
     # 300
     # i.e.: there are 300 seconds left between 1155 and 1200; could be time to close shop
 
-    for aRange in timeRanges:
-        # Determine what working range are we on
-        if isTimeInRange(targetTime, aRange):
-            # targtHr = int(targetTime.strftime('%H%M'))
-            # logger.debug(f"******targtHr  {targtHr}")
-
-            rangeTime = targetTime.replace(hour=int(aRange[5:7]), minute=int(aRange[7:9]))
-            # rangeHr = int(rangeTime.strftime('%H%M'))
-            # logger.debug(f"******rangeHr  {rangeHr}")
-
-            timeLeft = rangeTime - targetTime
-            # logger.debug(f"timeLeft = {timeLeft}")
-
-            # Notice we are only interested in the range of time within
-            # the normalWorktime, anything larger means we run normally
-            # and don't need to close shop early
-            if timeLeft < dt.timedelta(minutes=int(normalWorktime)):
-                return int(timeLeft.total_seconds())
-
-    # Raising instead of returning 0 or None just to save the caller processing logic
-    raise ValueError
+    # Notice we are only interested in the range of time within
+    # the normalWorktime, anything larger means we run normally
+    # and don't need to close shop early
+    # Raises ValueError instead of returning 0 or None just to save the caller processing logic
+    return WorkHours(targetTime.tzinfo, timeRanges).secondsUntilClose(targetTime, normalWorktime)
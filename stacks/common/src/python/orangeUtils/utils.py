@@ -279,6 +279,47 @@ def getHashFromData(data):
     return md5
 
 
+def getFastHashObj():
+    # BLAKE2b with a 128-bit digest; faster than MD5 on 64-bit machines and without its collisions
+    return hashlib.blake2b(digest_size=16)
+
+
+def getFastHashFromData(data):
+    hashObj = getFastHashObj()
+    hashObj.update(data)
+    return hashObj.hexdigest()
+
+
+def getFastHashFromFile(workDir, fileName, chunkSize=1024 * 1024):
+    hashObj = getFastHashObj()
+    fullFilePath = os.path.join(workDir, fileName)
+    with open(fullFilePath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkSize), b''):
+            hashObj.update(chunk)
+
+    return hashObj.hexdigest()
+
+
+def writeChunksToFile(chunks, fullFilePath, prefix=None, hashObj=None):
+    # Writes an iterable of byte chunks to file, hashing them along the way
+    # Only one chunk is held in memory at a time; returns the hash and the bytes written
+    # Hashes with MD5 unless a different hashlib object is given (e.g. getFastHashObj())
+    # The optional prefix (e.g. an fMP4 segment initializer) is written first but is NOT hashed
+    if hashObj is None:
+        hashObj = hashlib.md5()
+    size = 0
+    with open(fullFilePath, 'wb') as f:
+        if prefix:
+            f.write(prefix)
+        for chunk in chunks:
+            if chunk:   # filter out keep-alive new chunks
+                hashObj.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+    return hashObj.hexdigest(), size
+
+
 def getHashFromFile(workDir, fileName):
     fullFilePath = os.path.join(workDir, fileName)
     with open(fullFilePath, 'rb') as f:
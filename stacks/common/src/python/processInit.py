@@ -169,10 +169,11 @@ def initialize():
     return True
 
 
-def initSessionObject(sessionHeaders, verify=None):
+def initSessionObject(sessionHeaders, verify=None, poolHosts=None):
     try:
         GLOBALS.netUtils = NetworkUtils(
             verify=verify,
+            poolHosts=poolHosts,
             proxy=config['proxy'],
             sessionHeaders=sessionHeaders,
             workDirectory=config['workDirectory']
@@ -181,6 +182,7 @@ def initSessionObject(sessionHeaders, verify=None):
         GLOBALS.netUtils = NetworkUtils(
             proxy=False,
             verify=verify,
+            poolHosts=poolHosts,
             sessionHeaders=sessionHeaders,
             workDirectory=config['workDirectory']
             )
@@ -41,6 +41,56 @@ netUtils = None
 # Number of parallel threads to use when uploading segments to S3
 upThreads = 4
 
+# Number of parallel threads to use when downloading segments from a target
+# Can be overriden by the aimpoint's "dnThreads" key; a value of 1 downloads sequentially
+dnThreads = 4
+
+# Number of parallel threads to use when downloading many files from S3 (e.g. transcoder inputs)
+s3DnThreads = 16
+
+# Maximum simultaneous connections to any single target host
+# Can be overriden by the aimpoint's "hostConns" key
+hostConns = 4
+
+# Number of parallel threads the Scheduler uses to read aimpoints and send their taskings
+schedulerThreads = 16
+
+# Size in bytes of the chunks used when streaming downloaded segments to disk
+segChunkSize = 256 * 1024
+
+# Maximum number of aimpoints sent together to one Collector invocation
+# Same-schedule aimpoints going to the same Collector lambda, proxy and regions are grouped
+# by the Scheduler and then run concurrently by the Collector; a value of 1 disables grouping
+collectorBatch = 1
+
+# Whether the Scheduler and Monitor send aimpoint references instead of whole aimpoints
+# References are resolved from S3 by the Dispatcher and Collector; see hPatrolUtils.resolveAimpoint()
+# Off until the Enabler/Disabler moving aimpoint files is handled; a moved file can't be resolved
+dispatchRefs = False
+
+# Sizing of the Collector daemon's pool (EC2 host mode; see collectorDaemon.py)
+# Collections mostly wait on the network so several run per core; when the host's bandwidth
+# is given, the pool is also capped to that bandwidth over the estimated Mbps per collection
+daemonThreadsPerCore = 8
+daemonMbpsPerCollection = 4
+
+# Seconds an order the Collector daemon can't serve (other proxy or a VPN) stays hidden in its queue
+# Long-polling daemons would otherwise take it straight back; see collectorDaemon.SqsSource
+daemonReleaseSecs = 60
+
+# Number of recently kept stills each new still is compared against for near-duplicates
+# Only used by aimpoints with "nearDupThreshold"; can be overriden by the aimpoint's "nearDupHistory"
+nearDupHistory = 1
+
+# Aimpoints with "stillsArchive" add their stills to a local tar uploaded every archiveImages
+# images or archiveSecs seconds, whichever comes first; instead of one S3 object per image
+# Can be overriden by the aimpoint's "archiveImages" and "archiveSecs" keys
+# Requires "singleCollector"; archives don't outlive the run
+archiveImages = 200
+archiveSecs = 600      # 600s == 10m
+# Upload attempts per archive before its images are given up on; see stillsGrabber._StillsArchive
+archiveRetries = 3
+
 # Default FFMPEG deduplication mechanism
 ffmpegDedup = None
 
@@ -53,6 +103,10 @@ disablerLookBack = 1800      # 1800s == 30m
 # Frequency in hours to process aimpoints set to "monitor" status
 monitorFrequency = 12
 
+# Length in seconds of each partition of the per-device segment dedup index
+# The current and the previous partitions are checked; see hPatrolUtils.DedupIndex
+dedupWindow = 3600      # 3600s == 1h
+
 # AWS S3 bucket key-prefixes; some are used as inputs, some as outputs
 selectTrgts = 'selections'  # individual devices selected; used for the aimpoint producers
 targetFiles = 'aimpoints'   # config files indicating what we're going after
@@ -65,6 +119,7 @@ s3Hashfiles = 'hashfiles'   # md5 hash files of collected data for deduplication
 mtdtReports = '0_Metadata'  # available devices' historical data and reports
 hpResources = 'resources'   # resources to aid in system execution (e.g. mitmproxy-ca.pem file)
 aimpointSts = 'aimpointStatus' # collection status for all aimpoints (success/fail)
+aimpointMfst = 'manifests'  # consolidated aimpoint manifests; one per aimpoint prefix
 
 # PEM Certificate Authority filename for the MITM proxy for VPNs
 # File is created on first run of MITM; then it can be reused every time
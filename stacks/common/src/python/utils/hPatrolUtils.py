@@ -6,10 +6,14 @@ General HPatrol utilities
 # External libraries import statements
 import os
 import re
+import copy
 import time
 import json
 import logging
+import threading
 import datetime as dt
+import concurrent.futures
+from io import BytesIO
 from enum import IntEnum
 
 
@@ -38,6 +42,15 @@ except ModuleNotFoundError as err:
 
 logger = logging.getLogger()
 
+# Per-host connection limiters shared by all the collection threads; see getHostLimiter()
+_hostLimiters = {}
+_hostLimitersLock = threading.Lock()
+
+# Parsed aimpoints kept across warm lambda invocations; see AimpointFiles.readAimpoint()
+# {s3Key: (ETag, aimpoint)} and {manifestKey: (ETag, manifest)}
+_aimpointCache = {}
+_manifestCache = {}
+
 
 def formatNameBase(nameTemplate, devId):
     formattedBase = nameTemplate.format(deviceID=devId)
@@ -241,6 +254,203 @@ def pushAimpointToS3(newConfig: dict, s3Dir: str) -> None:
     )
 
 
+def _manifestKey(s3Dir: str) -> str:
+    # One manifest per top-level aimpoint prefix (i.e. aimpoints/ and monitored/)
+    return f"{GLOBALS.aimpointMfst}/{s3Dir.strip('/').split('/')[0]}.json"
+
+
+def readAimpointManifest(s3Dir: str) -> dict:
+    """Return the manifest of the aimpoint prefix s3Dir is in; empty if there's none"""
+    key = _manifestKey(s3Dir)
+    cachedEtag, cached = _manifestCache.get(key, (None, None))
+
+    # Warm containers only download the manifest again when it changed
+    contents, etag = GLOBALS.S3utils.readFileIfChanged(config["defaultWrkBucket"], key, cachedEtag)
+    if contents is None and etag and cached:
+        return cached
+
+    try:
+        manifest = json.loads(contents)
+    except (TypeError, ValueError):
+        _manifestCache.pop(key, None)
+        return {"version": 0, "entries": {}}
+
+    _manifestCache[key] = (etag, manifest)
+    return manifest
+
+
+def updateAimpointManifests(prefixes: list = None) -> None:
+    """
+    Rebuild the aimpoint manifests from what's currently in S3
+    Entries of files that didn't change (same ETag) are kept; only new or changed files are read
+    Meant to be called once after a batch of aimpoint changes (e.g. at the end of a generator run)
+    """
+    for aPrefix in prefixes or [GLOBALS.targetFiles, GLOBALS.monitorTrgt]:
+        try:
+            _updateManifest(aPrefix)
+        except Exception as err:
+            # Readers fall back to the individual files; never fail the caller because of this
+            logger.warning(f"Unable to update the '{aPrefix}' manifest:::{err}")
+
+
+def _updateManifest(prefix: str) -> None:
+    bucket = config["defaultWrkBucket"]
+    oldManifest = readAimpointManifest(prefix)
+    oldEntries = oldManifest["entries"]
+
+    entries = {}
+    toRead = []
+    for obj in GLOBALS.S3utils.getFilesAsObjList(bucket, prefix) or []:
+        oldEntry = oldEntries.get(obj["Key"])
+        if oldEntry and oldEntry["etag"] == obj["ETag"]:
+            entries[obj["Key"]] = oldEntry
+        else:
+            toRead.append(obj)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=GLOBALS.s3DnThreads) as executor:
+        allContents = executor.map(lambda obj: GLOBALS.S3utils.readFileContent(bucket, obj["Key"]), toRead)
+        for obj, contents in zip(toRead, allContents):
+            try:
+                content = json.dumps(json.loads(contents), separators=(",", ":"))
+            except (TypeError, ValueError) as err:
+                logger.warning(f"Not adding '{obj['Key']}' to the manifest:::{err}")
+                continue
+            entries[obj["Key"]] = {"etag": obj["ETag"], "content": content}
+
+    manifest = {"version": oldManifest["version"] + 1, "created": int(time.time()), "entries": entries}
+    GLOBALS.S3utils.pushFileObjToS3(
+        BytesIO(json.dumps(manifest).encode("utf-8")),
+        GLOBALS.aimpointMfst,
+        bucket,
+        os.path.basename(_manifestKey(prefix)),
+        extras={"ContentType": "application/json"}
+    )
+    logger.info(f"Manifest for '{prefix}' at version {manifest['version']}: {len(entries)} aimpoints, {len(toRead)} read")
+
+
+class AimpointFiles:
+    """
+    The aimpoint files under an S3 prefix, read through the prefix's manifest
+
+    The prefix is still listed (one request per 1,000 files) so nothing depends on the manifest
+    being current; files without an entry, or whose ETag changed since, are read by themselves
+
+    Parsed aimpoints are also kept for the life of the process; on a warm lambda, aimpoints whose
+    ETag didn't change since the last invocation cost nothing beyond the listing
+    """
+
+    def __init__(self, s3Dir: str):
+        self.s3Dir = s3Dir
+        self.bucket = config["defaultWrkBucket"]
+        objs = GLOBALS.S3utils.getFilesAsObjList(self.bucket, s3Dir) or []
+        self.etags = {obj["Key"]: obj["ETag"] for obj in objs}
+
+        # Same as getFilesAsStrList(); None when no files are found
+        self.fileList = list(self.etags) or None
+        self._entries = None
+        self.fileReads = 0
+
+        # Forget the aimpoints that are no longer under this prefix
+        prefix = f"{s3Dir.strip('/')}/"
+        for aKey in list(_aimpointCache):
+            if aKey.startswith(prefix) and aKey not in self.etags:
+                _aimpointCache.pop(aKey, None)
+
+
+    @property
+    def entries(self) -> dict:
+        # The manifest is only needed when something isn't cached already
+        if self._entries is None:
+            self._entries = readAimpointManifest(self.s3Dir)["entries"] if self.fileList else {}
+        return self._entries
+
+
+    def readAimpoint(self, key: str) -> dict:
+        """
+        Return the parsed aimpoint; a copy, so callers are free to modify it
+        Raises the same errors as json.loads() when the file can't be read or parsed
+        """
+        etag = self.etags.get(key)
+        cachedEtag, aimpoint = _aimpointCache.get(key, (None, None))
+        if etag is None or cachedEtag != etag:
+            aimpoint = json.loads(self.readFileContent(key))
+            if etag:
+                _aimpointCache[key] = (etag, aimpoint)
+
+        return copy.deepcopy(aimpoint)
+
+
+    def readFileContent(self, key: str) -> str:
+        entry = self.entries.get(key)
+        if entry and entry["etag"] == self.etags.get(key):
+            return entry["content"]
+
+        self.fileReads += 1
+        return GLOBALS.S3utils.readFileContent(self.bucket, key)
+
+
+def aimpointRef(key: str, etag: str, overrides: dict = None) -> dict:
+    """
+    Compact dispatch message standing for the aimpoint file in S3; see resolveAimpoint()
+    Overrides are applied on top of the aimpoint when it's resolved
+    """
+    ref = {"aimpointRef": key, "etag": etag}
+    if overrides:
+        ref["overrides"] = overrides
+    return ref
+
+
+def resolveAimpoint(msg: dict) -> dict:
+    """
+    Return the aimpoint a dispatch message stands for; messages with the whole aimpoint come back as they are
+    Read from the process cache when the reference's ETag matches; otherwise from S3
+    Raises HPatrolError when the aimpoint can't be read
+    """
+    if "aimpointRef" not in msg:
+        return msg
+
+    key = msg["aimpointRef"]
+    cachedEtag, aimpoint = _aimpointCache.get(key, (None, None))
+    if cachedEtag is None or cachedEtag != msg.get("etag"):
+        contents, etag = GLOBALS.S3utils.readFileIfChanged(config["defaultWrkBucket"], key)
+        if contents is None:
+            # Likely moved or deleted since it was scheduled (e.g. by the Disabler)
+            raise HPatrolError(f"Unable to read aimpoint '{key}'")
+        try:
+            aimpoint = json.loads(contents)
+        except (TypeError, ValueError) as err:
+            raise HPatrolError(f"Unable to resolve aimpoint '{key}':::{err}")
+
+        if etag != msg.get("etag"):
+            logger.info(f"Aimpoint '{key}' changed since it was scheduled; using its current version")
+        _aimpointCache[key] = (etag, aimpoint)
+
+    aimpoint = copy.deepcopy(aimpoint)
+    aimpoint.update(msg.get("overrides", {}))
+    return aimpoint
+
+
+def resolveDispatch(msg: dict) -> dict:
+    """
+    Same as resolveAimpoint(), for messages that can also be a batch of aimpoints
+    Aimpoints of a batch that can't be resolved are left out; raises HPatrolError only when none can
+    """
+    if "aimpoints" not in msg:
+        return resolveAimpoint(msg)
+
+    resolved = []
+    for aMsg in msg["aimpoints"]:
+        try:
+            resolved.append(resolveAimpoint(aMsg))
+        except HPatrolError as err:
+            # One aimpoint moved or regenerated since it was scheduled mustn't cost the others
+            logger.error(f"Leaving aimpoint out of the batch:::{err}")
+
+    if not resolved:
+        raise HPatrolError(f"None of the batch's {len(msg['aimpoints'])} aimpoints could be resolved")
+    return dict(msg, aimpoints=resolved)
+
+
 def _handleSettings(mergeTemplate, configTemplate: dict) -> dict:
     """Handles simple settings for the selections file"""
     if mergeTemplate == "on":
@@ -287,6 +497,164 @@ def pickBestBucket(jsonConfig: dict, bucketKey: str) -> str:
     return bucketName
 
 
+def collectorFunction(ap: dict) -> str:
+    """Return the name of the Collector lambda that serves the given aimpoint"""
+
+    # To VPN or not pn...that is the question
+    proxyStr = ""
+    if ap.get("vpn"):
+        proxyStr = "VPN"
+    elif ap.get("proxy"):
+        # Determine which proxy to use
+        # Right now only includes whirl, but more may be added
+        if "whirl" in ap["proxy"]:
+            proxyStr = "VPC"
+
+    if ap["collectionType"] in ("IMAGEINJSON", "STILLS", "FSTLLS", "ISTLLS"):
+        return f"{GLOBALS.baseStackName}_Stills{proxyStr}"
+    elif ap["collectionType"] == "PLAYWRIGHT":
+        return f"{GLOBALS.baseStackName}_Playwright"
+    return f"{GLOBALS.baseStackName}_Videos{proxyStr}"
+
+
+def collectorBatchKey(ap: dict):
+    """
+    Return the grouping key of aimpoints that can share one Collector invocation
+    Aimpoints share only when they go to the same lambda, through the same proxy or VPN
+    and on the same candidate regions; None means the aimpoint must be sent by itself
+    """
+    if ap.get("collectionType") == "PLAYWRIGHT":
+        # A browser per aimpoint is already all a Playwright container can take
+        return None
+
+    return (
+        collectorFunction(ap),
+        ap.get("vpn") or None,
+        ap.get("proxy") or None,
+        tuple(sorted(ap.get("collRegions", [])))
+    )
+
+
+def getHostLimiter(netloc: str, maxHostConns: int):
+    # One limiter per target host, shared by every download thread in this process
+    # Aimpoints on the same host asking for different "hostConns" all get the smallest of them;
+    # in a warm process or the daemon it holds no matter which aimpoint reached the host first
+    maxHostConns = max(1, maxHostConns)
+    with _hostLimitersLock:
+        if netloc not in _hostLimiters:
+            _hostLimiters[netloc] = HostLimiter(maxHostConns)
+        elif maxHostConns < _hostLimiters[netloc].limit:
+            logger.info(f"Lowering connections to '{netloc}' from {_hostLimiters[netloc].limit} to {maxHostConns}")
+            _hostLimiters[netloc].lower(maxHostConns)
+        return _hostLimiters[netloc]
+
+
+class HostLimiter:
+    """
+    Caps the connections open to one host at the same time; used in a with-statement
+    Works like a semaphore whose size can be lowered while in use
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.cond = threading.Condition()
+
+
+    def lower(self, limit):
+        with self.cond:
+            self.limit = min(self.limit, limit)
+
+
+    def __enter__(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+
+class DedupIndex:
+    """
+    Per-device index of the content hashes already collected; for system-wide deduplication
+
+    The index is partitioned by device and by time window (GLOBALS.dedupWindow) and kept in
+    S3 as one small JSON object per partition under the hashfiles prefix, whose lifecycle
+    rule expires it. It's loaded once per invocation, checked in memory, and the new hashes
+    are written back in a single update with flush().
+    """
+
+    def __init__(self, bucketName, deviceID, windowSecs=None, now=None):
+        self.bucketName = bucketName
+        self.deviceID = deviceID
+        self.windowSecs = windowSecs or GLOBALS.dedupWindow
+        if not now:
+            now = time.time()
+        self.windowStart = int(now // self.windowSecs * self.windowSecs)
+
+        self.known = set()
+        self.added = set()
+        self.lock = threading.Lock()    # uploads check and add from several threads
+
+
+    def _windowKey(self, windowStart):
+        return f"{GLOBALS.s3Hashfiles}/{self.deviceID}/{windowStart}.json"
+
+
+    def _readWindow(self, windowStart):
+        content = GLOBALS.S3utils.readFileContent(self.bucketName, self._windowKey(windowStart))
+        if not content:
+            return set()
+        try:
+            return set(json.loads(content)["hashes"])
+        except (ValueError, KeyError, TypeError) as err:
+            logger.warning(f"Ignoring unreadable dedup index '{self._windowKey(windowStart)}':::{err}")
+            return set()
+
+
+    def load(self):
+        # Look into the previous window as well so there's always at least a full window of history
+        for windowStart in (self.windowStart - self.windowSecs, self.windowStart):
+            self.known |= self._readWindow(windowStart)
+        logger.info(f"Dedup index loaded with {len(self.known)} hashes for '{self.deviceID}'")
+        return self
+
+
+    def __contains__(self, theHash):
+        with self.lock:
+            return theHash in self.known
+
+
+    def add(self, theHash):
+        with self.lock:
+            self.known.add(theHash)
+            self.added.add(theHash)
+
+
+    def flush(self):
+        with self.lock:
+            if not self.added:
+                return True
+            # Merge with whatever other collectors on this device wrote meanwhile
+            allHashes = self._readWindow(self.windowStart) | self.added
+            success = GLOBALS.S3utils.pushDataToS3(
+                self.bucketName,
+                self._windowKey(self.windowStart),
+                json.dumps({"hashes": sorted(allHashes)})
+            )
+            if success:
+                logger.info(f"Dedup index updated with {len(self.added)} new hashes")
+                self.added = set()
+            else:
+                logger.warning("Could not update the dedup index; ignoring")
+            return success
+
+
 class FFMPEGType(IntEnum):
     """
     Doing this only to speed up comparison statements (ints instead of strings)
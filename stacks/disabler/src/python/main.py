@@ -102,22 +102,25 @@ def execute(timestamp: int):
     # Select aimpoints that are on collection
     s3Dir = GLOBALS.targetFiles
     logger.info(f"Looking for files in S3: '{s3Dir}/'")
-    fileList = GLOBALS.S3utils.getFilesAsStrList(config['defaultWrkBucket'], s3Dir)
+    aimpoints = hput.AimpointFiles(s3Dir)
+    fileList = aimpoints.fileList
 
     try:
         logger.info(f"Total aimpoints found:{len(fileList)}")
     except TypeError:
         return 0
 
+    # Aimpoints moved between prefixes; the manifests are updated once at the end
+    moved = 0
+
     for idx, aFile in enumerate(fileList, start=1):
         if not GLOBALS.onProd and idx == 2:
             logger.debug(f"Not running on PROD; exiting before processing file #{idx}")
             break
 
         logger.info(f"Processing file '{aFile}'")
-        contents = GLOBALS.S3utils.readFileContent(config["defaultWrkBucket"], aFile)
         try:
-            targetConfig = json.loads(contents)
+            targetConfig = aimpoints.readAimpoint(aFile)
         except Exception as e:
             logger.warning(f"Error reading content of file {aFile}; skipping:::{e}")
             continue
@@ -133,6 +136,7 @@ def execute(timestamp: int):
             logger.info(f"Aimpoint {aFile} failed to collect for 30 minutes, switching to monitor status")
             try:
                 _disableAimpoint(aFile)
+                moved += 1
             except HPatrolError as e:
                 logger.error(f"Unexpected error copying aimpoint {aFile} from active to monitored:::{e}")
                 continue
@@ -145,6 +149,9 @@ def execute(timestamp: int):
             except HPatrolError:
                 pass
 
+    if moved:
+        hput.updateAimpointManifests()
+
     return len(fileList)
 
 
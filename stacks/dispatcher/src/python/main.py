@@ -7,6 +7,7 @@ import logging
 import argparse
 import threading
 import datetime as dt
+import concurrent.futures
 from random import sample
 
 
@@ -15,6 +16,7 @@ try:
     # These are for when running in an EC2
     import processInit
     import systemSettings
+    from exceptions import *
     import superGlblVars as GLOBALS
     from superGlblVars import config
     from orangeUtils import auditUtils
@@ -27,6 +29,7 @@ except ModuleNotFoundError as err:
     # These are for when running in a Lambda
     print(f"Loading module for lambda execution: {__name__}")
     from src.python import processInit
+    from src.python.exceptions import *
     from src.python import systemSettings
     from src.python.superGlblVars import config
     from src.python.orangeUtils import auditUtils
@@ -38,6 +41,10 @@ except ModuleNotFoundError as err:
 
 logger = logging.getLogger()
 
+# Lambda clients per region; kept across warm invocations
+_lambdaClients = {}
+_lambdaClientsLock = threading.Lock()
+
 
 def lambdaHandler(event, context):
     upSince = processInit.preFlightSetup()
@@ -49,29 +56,32 @@ def lambdaHandler(event, context):
     # Capture our ARN for later use
     GLOBALS.myArn = context.invoked_function_arn
 
-    # Grab input
     try:
-        body = json.loads(event['Records'][0]['body'])
-        test = body['collRegions']
+        records = event['Records']
     except KeyError as err:
-            logger.error(f'Invalid message received: {err}')
-            logger.debug(f"Message received is:{event}")
-            return {"status": False}
+        logger.error(f'Invalid event received: {err}')
+        logger.debug(f"Event received is:{event}")
+        return {"status": False}
 
     try:
         # Pre-set values in case execution is interrupted
         dataLevel = AuditLogLevel.INFO
         systemLevel = AuditLogLevel.INFO
         exitMessage = "Exit with errors"
+        failedIds = []
 
         # Execute!
-        trueOrFalse = execute(body)
+        failedIds = executeRecords(records)
+        trueOrFalse = not failedIds
         exitMessage = "Normal execution"
 
     except Exception as e:
         logger.exception(f"UNHANDLED EXCEPTION CAUGHT:::{e}")
         systemLevel = AuditLogLevel.CRITICAL
         dataLevel = None
+        trueOrFalse = False
+        # Nothing is known to have been dispatched; otherwise SQS would delete them all
+        failedIds = [aRecord.get('messageId') for aRecord in records]
 
     finally:
         nownow = int(time.time())
@@ -100,10 +110,50 @@ def lambdaHandler(event, context):
     logger.info(f"= {toPrint} =")
     logger.info(f"=={'=' * len(toPrint)}==")
 
-    return {"status": trueOrFalse}
+    # Partial batch response; only these messages go back to the queue
+    return {"status": trueOrFalse, "batchItemFailures": [{"itemIdentifier": x} for x in failedIds]}
+
+
+def executeRecords(records):
+    """
+    Dispatch all the SQS records at the same time; returns the message IDs to be tried again
+    Only messages for which nothing was dispatched are retried; otherwise Collectors would be duplicated
+    """
+    def runOne(aRecord):
+        # Aimpoints are either whole or a reference to their file
+        try:
+            body = json.loads(aRecord['body'])
+            if 'aimpoints' in body:
+                test = [ap.get('aimpointRef') or ap['collRegions'] for ap in body['aimpoints']]
+            else:
+                test = body.get('aimpointRef') or body['collRegions']
+        except (KeyError, ValueError) as err:
+            # Retrying won't fix it
+            logger.error(f'Invalid message received: {err}')
+            logger.debug(f"Message received is:{aRecord}")
+            return True
+
+        try:
+            return execute(body)
+        except Exception as e:
+            logger.exception(f"UNHANDLED EXCEPTION CAUGHT dispatching message '{aRecord['messageId']}':::{e}")
+            return False
+
+    logger.info(f"Received {len(records)} message(s)")
+    if not records:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(records)) as executor:
+        results = list(executor.map(runOne, records))
 
+    return [aRecord['messageId'] for aRecord, ok in zip(records, results) if not ok]
 
-def execute(targetConfig):
+
+def execute(theMsg):
+    """
+    Invoke the Collector(s) for one dispatch message
+    Returns False only when it's worth trying again: nothing in the message was dispatched
+    """
     # Identify ourselves for the audit logs
     GLOBALS.taskName = "Dispatcher"
 
@@ -113,30 +163,20 @@ def execute(targetConfig):
     # This line is not used; just kept here for info
     # ourRegion = GLOBALS.myArn.split(":")[3]
 
-    # To VPN or not pn...that is the question
-    proxyStr = ""
-    if targetConfig.get("vpn"):
-        proxyStr = "VPN"
-    elif targetConfig.get("proxy"):
-        # Determine which proxy to use
-        # Right now only includes whirl, but more may be added
-        if "whirl" in targetConfig["proxy"]:
-            proxyStr = "VPC"
+    if "aimpoints" in theMsg:
+        # Batch of aimpoints; see GLOBALS.collectorBatch
+        return _dispatchBatch(accntId, theMsg["aimpoints"])
+
+    # The aimpoint is needed to pick the Collector; the message is passed on as it came
+    try:
+        targetConfig = hput.resolveAimpoint(theMsg)
+    except HPatrolError as err:
+        # Aimpoint gone or broken; retrying won't fix it
+        logger.error(f"Not dispatching:::{err}")
+        return True
 
     # Compose the name of the function to call
-    if(
-        targetConfig["collectionType"] == "IMAGEINJSON" or 
-        targetConfig["collectionType"] == "STILLS" or 
-        targetConfig["collectionType"] == "FSTLLS" or 
-        targetConfig["collectionType"] == "ISTLLS"
-        ):
-        funcToCall = f"{GLOBALS.baseStackName}_Stills{proxyStr}"
-    elif(
-        targetConfig["collectionType"] == "PLAYWRIGHT"
-        ):
-        funcToCall = f"{GLOBALS.baseStackName}_Playwright"
-    else:
-        funcToCall = f"{GLOBALS.baseStackName}_Videos{proxyStr}"
+    funcToCall = hput.collectorFunction(targetConfig)
 
     # Randomly select just one of any stated Collectors in the region for this aimpoint
     # It was confirmed that if the order is sent to 2 regions we don't get duplicate
@@ -144,22 +184,73 @@ def execute(targetConfig):
     aRegion = sample(targetConfig["collRegions"], 1)[0]
     aRegion = ut.getRegionCode(aRegion)
 
+    return _invokeCollector(
+        accntId, aRegion, funcToCall, theMsg,
+        f"'{hput.formatNameBase(targetConfig['filenameBase'], targetConfig['deviceID'])}'"
+    )
+
+
+def _dispatchBatch(accntId, messages):
+    # The batch is re-grouped here in case the sender mixed aimpoints that can't share a Collector
+    groups = {}
+    for aMsg in messages:
+        try:
+            ap = hput.resolveAimpoint(aMsg)
+        except HPatrolError as err:
+            logger.error(f"Not dispatching:::{err}")
+            continue
+
+        key = hput.collectorBatchKey(ap)
+        if key is None:
+            # Send it by itself; same as any single aimpoint message
+            key = ("single", len(groups))
+        groups.setdefault(key, []).append((ap, aMsg))
+
+    invoked = 0
+    failed = 0
+    for key, group in groups.items():
+        groupAps = [ap for ap, notUsed in group]
+        if len(group) == 1:
+            payload = group[0][1]
+        else:
+            # Aimpoints in a group share the proxy/VPN; the Collector sets it up once for all
+            payload = {"aimpoints": [aMsg for notUsed, aMsg in group]}
+            for proxyKey in ("vpn", "proxy"):
+                if groupAps[0].get(proxyKey):
+                    payload[proxyKey] = groupAps[0][proxyKey]
+
+        # All aimpoints in the group have the same collRegions
+        aRegion = sample(groupAps[0]["collRegions"], 1)[0]
+        aRegion = ut.getRegionCode(aRegion)
+
+        names = [hput.formatNameBase(ap["filenameBase"], ap["deviceID"]) for ap in groupAps]
+        if _invokeCollector(
+            accntId, aRegion, hput.collectorFunction(groupAps[0]), payload, f"{len(names)} aimpoint(s) {names}"
+        ):
+            invoked += 1
+        else:
+            failed += 1
+
+    if failed and invoked:
+        # Retrying the message would run the others twice
+        logger.warning(f"{failed} of {invoked + failed} Collector invocations failed; not retrying")
+
+    return not failed or invoked > 0
+
+
+def _invokeCollector(accntId, aRegion, funcToCall, payload, description):
     # Create the ARN for the Collector lambda
     collectorArn = 'arn:aws:lambda:' + aRegion + ':' + accntId + ':function:' + funcToCall
 
-    # Create a lambda client
-    logger.info(f"Creating boto3 lambda client on '{aRegion}'")
-    awsLambda = boto3.client(service_name='lambda', region_name=aRegion)
+    awsLambda = _lambdaClient(aRegion)
 
-    logger.info(f"Invoking lambda '{collectorArn}' "
-        f"for '{hput.formatNameBase(targetConfig['filenameBase'], targetConfig['deviceID'])}'"
-    )
-    # logger.debug(f"Payload:{targetConfig}")
+    logger.info(f"Invoking lambda '{collectorArn}' for {description}")
+    # logger.debug(f"Payload:{payload}")
 
     try:
         resp = awsLambda.invoke(FunctionName=collectorArn,
                                 InvocationType='Event',
-                                Payload=json.dumps(targetConfig))
+                                Payload=json.dumps(payload))
     except Exception as e:
         logger.critical(f'Caught Exception attempting to invoke lambda ::{e}')
         return False
@@ -174,6 +265,15 @@ def execute(targetConfig):
     return True
 
 
+def _lambdaClient(aRegion):
+    # Clients are thread-safe once created; creating them isn't
+    with _lambdaClientsLock:
+        if aRegion not in _lambdaClients:
+            logger.info(f"Creating boto3 lambda client on '{aRegion}'")
+            _lambdaClients[aRegion] = boto3.client(service_name='lambda', region_name=aRegion)
+        return _lambdaClients[aRegion]
+
+
 if __name__ == '__main__':
     # Obtain test file name, if given
     parser = argparse.ArgumentParser(prog="Dispatcher", 
@@ -235,7 +235,8 @@ def execute(taskConfig, s3Dir=None):
     if not s3Dir:
         s3Dir = GLOBALS.targetFiles
     logger.info(f"Looking for files in '{s3Dir}'")
-    fileList = GLOBALS.S3utils.getFilesAsStrList(config['defaultWrkBucket'], s3Dir)
+    aimpoints = hput.AimpointFiles(s3Dir)
+    fileList = aimpoints.fileList
     # logger.debug(f"fileList:{fileList}")
     try:
         logger.info(f"Total aimpoints found:{len(fileList)}")
@@ -259,10 +260,16 @@ def execute(taskConfig, s3Dir=None):
     elif taskConfig["task"] == "audio":
         theTask = DroverTask.TAKEAUDIO
 
-    _sendTaskings(theTask, fileList, now)
+    _sendTaskings(theTask, fileList, now, aimpoints)
 
 
-def _sendTaskings(theTask, fileList, now:dt.datetime):
+def _sendTaskings(theTask, fileList, now:dt.datetime, aimpoints=None):
+    # Taskings go out in batches; whatever is left is sent once all aimpoints are processed
+    with GLOBALS.sqsUtils.batchSender(config['tcdQueue']) as sender:
+        _taskAimpoints(theTask, fileList, now, aimpoints, sender)
+
+
+def _taskAimpoints(theTask, fileList, now:dt.datetime, aimpoints, sender):
     # Set default transcoder interval
     # Notice we start to focus on files as if we were "15 minutes ago".
     # This is because the Collector can overlap 15minute segments, and may still be collecting
@@ -293,12 +300,14 @@ def _sendTaskings(theTask, fileList, now:dt.datetime):
             break
 
         logger.debug(f"Processing file '{aFile}'")
-        contents = GLOBALS.S3utils.readFileContent(config["defaultWrkBucket"], aFile)
         try:
-            targetConfig = json.loads(contents)
+            if aimpoints:
+                targetConfig = aimpoints.readAimpoint(aFile)
+            else:
+                targetConfig = json.loads(GLOBALS.S3utils.readFileContent(config["defaultWrkBucket"], aFile))
         except Exception as e:
             logger.warning(f"Error processing input file; skipping:::{e}")
-            logger.warning(f"Processing file '{contents}'")
+            logger.warning(f"Processing file '{aFile}'")
             continue
 
         # Check if transcodeExt is null
@@ -467,13 +476,13 @@ def _sendTaskings(theTask, fileList, now:dt.datetime):
             theMsg["dstPrefix"] = f"{aDeliveryKey}/{resolvedTemplate}"
             if theTask == DroverTask.TRANSCODE or theTask == DroverTask.TAKEAUDIO:
                 logger.debug(f"Message: {json.dumps(theMsg)}")
-                GLOBALS.sqsUtils.sendMessage(config['tcdQueue'], theMsg)
+                sender.send(theMsg)
 
             elif theTask == DroverTask.TIMELAPSE:
-                _sendTimelapseMessages(theMsg, targetConfig, videoBuffer)
+                _sendTimelapseMessages(theMsg, targetConfig, videoBuffer, sender)
 
 
-def _sendTimelapseMessages(theMessage, targetConfig, videoBuffer):
+def _sendTimelapseMessages(theMessage, targetConfig, videoBuffer, sender):
     systemPeriodicity = config['systemPeriodicity'] * 60
 
     # Add timelapse parameter (not used for transcoding)
@@ -512,7 +521,7 @@ def _sendTimelapseMessages(theMessage, targetConfig, videoBuffer):
             f"to run at {(now + dt.timedelta(seconds=theDelay)).strftime('%m/%d %H:%M:%S')}"
         )
         logger.debug(f"Message: {theMessage}")
-        GLOBALS.sqsUtils.sendMessage(config['tcdQueue'], theMessage, theDelay)
+        sender.send(theMessage, theDelay)
 
 
 if __name__ == '__main__':
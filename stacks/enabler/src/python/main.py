@@ -102,12 +102,16 @@ def execute(timestamp: int):
     # Select aimpoints that are currently being monitored
     s3Dir = GLOBALS.monitorTrgt
     logger.info(f"Looking for files in S3: '{s3Dir}/'")
-    fileList = GLOBALS.S3utils.getFilesAsStrList(config['defaultWrkBucket'], s3Dir)
+    aimpoints = hput.AimpointFiles(s3Dir)
+    fileList = aimpoints.fileList
     try:
         logger.info(f"Total aimpoints being monitored found:{len(fileList)}")
     except TypeError:
         return 0
 
+    # Aimpoints moved between prefixes; the manifests are updated once at the end
+    moved = 0
+
     for idx, aFile in enumerate(fileList, start=1):
         # Don't go through everything if we're not on PROD
         if not GLOBALS.onProd and idx == 2:
@@ -115,9 +119,8 @@ def execute(timestamp: int):
             break
 
         logger.info(f"Processing file '{aFile}'")
-        contents = GLOBALS.S3utils.readFileContent(config["defaultWrkBucket"], aFile)
         try:
-            targetConfig = json.loads(contents)
+            targetConfig = aimpoints.readAimpoint(aFile)
         except Exception as e:
             logger.warning(f"Error processing input file; skipping:::{e}")
             continue
@@ -134,6 +137,7 @@ def execute(timestamp: int):
             logger.info(f"Successful collection found; moving {aFile} from monitored to active")
             try:
                 _enableAimpoint(aFile)
+                moved += 1
             except HPatrolError as err:
                 logger.error(f"Unexpected error copying {aFile} from monitored to active: {err}")
                 continue
@@ -148,6 +152,9 @@ def execute(timestamp: int):
         else:
             logger.info(f"No recent successful collections found for {aFile}")
 
+    if moved:
+        hput.updateAimpointManifests()
+
     return len(fileList)
 
 
@@ -409,6 +409,8 @@ def lambdaHandler(event, context):
         if execute(upSince, False):
             trueOrFalse = True
             exitMessage = "Normal execution"
+            # Readers load the aimpoint manifests; bring them up to date with what was written
+            hput.updateAimpointManifests()
 
     except Exception as e:
         logger.exception(f"UNHANDLED EXCEPTION CAUGHT:::{e}")
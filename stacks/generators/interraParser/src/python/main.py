@@ -28,6 +28,7 @@ try:
     from superGlblVars import config
     from orangeUtils import auditUtils
     from orangeUtils import utils as ut
+    from utils import hPatrolUtils as hput
     from ec2_metadata import ec2_metadata as ec2
     from orangeUtils.auditUtils import AuditLogLevel
 
@@ -41,6 +42,7 @@ except ModuleNotFoundError as err:
     from src.python.superGlblVars import config
     from src.python.orangeUtils import auditUtils
     from src.python.orangeUtils import utils as ut
+    from src.python.utils import hPatrolUtils as hput
     from src.python import superGlblVars as GLOBALS
     from src.python.orangeUtils.auditUtils import AuditLogLevel
 
@@ -70,6 +72,8 @@ def lambdaHandler(event, context):
         if execute(upSince, writeAimpoints=True):
             trueOrFalse = True
             exitMessage = "Normal execution"
+            # Readers load the aimpoint manifests; bring them up to date with what was written
+            hput.updateAimpointManifests()
 
     except Exception as e:
         logger.exception(f"UNHANDLED EXCEPTION CAUGHT:::{e}")
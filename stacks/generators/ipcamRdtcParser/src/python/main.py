@@ -69,6 +69,8 @@ def lambdaHandler(event: dict, context: dict) -> dict:
         if execute(upSince):
             trueOrFalse = True
             exitMessage = "Normal Execution"
+            # Readers load the aimpoint manifests; bring them up to date with what was written
+            hput.updateAimpointManifests()
 
     except Exception as e:
         logger.exception(f"UNHANDLED EXCEPTION CAUGHT:::{e}")
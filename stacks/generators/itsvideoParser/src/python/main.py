@@ -173,6 +173,8 @@ if __name__ == '__main__':
 
     try:
         trueOrFalse = execute()
+        # Readers load the aimpoint manifests; bring them up to date with what was written
+        hput.updateAimpointManifests()
     except Exception as err:
         logger.exception(err)
 
@@ -105,7 +105,8 @@ def execute():
                 # Not aimpoints
                 continue
     else:
-        allFiles = GLOBALS.S3utils.getFilesAsStrList(config['defaultWrkBucket'], GLOBALS.targetFiles)
+        aimpoints = hput.AimpointFiles(GLOBALS.targetFiles)
+        allFiles = aimpoints.fileList
         for idx, aimpoint in enumerate(allFiles, start=1):
             # Don't go through everything if we're not on PROD
             if not GLOBALS.onProd and idx == 5:
@@ -114,8 +115,7 @@ def execute():
 
             logger.info(f"Processing file '{aimpoint}'")
             try:
-                contents = GLOBALS.S3utils.readFileContent(config["defaultWrkBucket"], aimpoint)
-                aimpointData = json.loads(contents)
+                aimpointData = aimpoints.readAimpoint(aimpoint)
             except Exception as e:
                 logger.warning(f"Error processing input file; skipping:::{e}")
                 continue
@@ -139,51 +139,12 @@ def execute():
             if(aimpointData["collectionType"] == "IMAGEINJSON"):
                 stillsAimpoints.append(aimpointData)
 
-    logger.info(f"Stills aimpoints to work on: {len(stillsAimpoints)}")
-    for aimpoint in stillsAimpoints:
-        aimpoint = _checkValues(aimpoint)
-        deviceID = aimpoint["deviceID"]
-
-        # As default, the system uses the yr/mnth/day/filenameBase/ construct for the stills working area
-        fnBase = hput.formatNameBase(aimpoint["filenameBase"], deviceID)
-        logger.info(f"Sending: {fnBase}")
-        filenameBase = f"{fnBase}.zip"
-
-        defaultLz = "{year}/{month}/{day}/{fnBase}".format(year=year, month=month, day=day, fnBase=fnBase)
-        bucketPrefix = aimpoint["bucketPrefixTemplate"].format(year=year, month=month, day=day, deviceID=deviceID)
-        zipFileName = hput.formatNameSuffix(filenameBase, aimpoint["finalFileSuffix"], dayToWorkOn)
-
-        # Handle single-string input in the deliveryKey field
-        if type(aimpoint["deliveryKey"]) is str:
-            aimpoint["deliveryKey"] = aimpoint["deliveryKey"].split()
-
-        theMsg = {
-            "bagAndZip": {
-                "selected": fnBase,
-                "zipFileName": zipFileName,
-                "bucketPrefix" : bucketPrefix,
-                "wrkBucket": aimpoint["wrkBucket"],
-                "dstBucket": aimpoint["dstBucket"],
-                "deliveryKey": aimpoint["deliveryKey"],
-                "filesLocation": f"{GLOBALS.stillImages}/{defaultLz}"
-                }
-        }
-        logger.debug(f"Message: {json.dumps(theMsg)}")
-        resp = GLOBALS.sqsUtils.sendMessage(config['bagQueue'], theMsg)
-        # logger.debug(f"SQS response: {resp}")
-
-    logger.info(f"Multi-stills aimpoints to work on: {len(mstllsAimpoints)}")
-    for aimpoint in mstllsAimpoints:
-        aimpoint = _checkValues(aimpoint)
-        stationId = aimpoint['deviceID']
-        idList  = aimpoint["deviceIdList"]
-        urlList = aimpoint['accessUrlList']
-        fnbList = aimpoint['filenameBaseList']
-        for id, url, fNamBas in zip(idList, urlList, fnbList):
-            deviceID = id
-            aimpoint['deviceID'] = id
-            aimpoint['accessUrl'] = url
-            aimpoint['filenameBase'] = fNamBas
+    # Taskings go out in batches; whatever is left is sent at the end
+    with GLOBALS.sqsUtils.batchSender(config['bagQueue']) as sender:
+        logger.info(f"Stills aimpoints to work on: {len(stillsAimpoints)}")
+        for aimpoint in stillsAimpoints:
+            aimpoint = _checkValues(aimpoint)
+            deviceID = aimpoint["deviceID"]
 
             # As default, the system uses the yr/mnth/day/filenameBase/ construct for the stills working area
             fnBase = hput.formatNameBase(aimpoint["filenameBase"], deviceID)
@@ -210,12 +171,51 @@ def execute():
                     }
             }
             logger.debug(f"Message: {json.dumps(theMsg)}")
-            resp = GLOBALS.sqsUtils.sendMessage(config['bagQueue'], theMsg)
-            # logger.debug(f"SQS response: {resp}")
+            sender.send(theMsg)
+
+        logger.info(f"Multi-stills aimpoints to work on: {len(mstllsAimpoints)}")
+        for aimpoint in mstllsAimpoints:
+            aimpoint = _checkValues(aimpoint)
+            stationId = aimpoint['deviceID']
+            idList  = aimpoint["deviceIdList"]
+            urlList = aimpoint['accessUrlList']
+            fnbList = aimpoint['filenameBaseList']
+            for id, url, fNamBas in zip(idList, urlList, fnbList):
+                deviceID = id
+                aimpoint['deviceID'] = id
+                aimpoint['accessUrl'] = url
+                aimpoint['filenameBase'] = fNamBas
+
+                # As default, the system uses the yr/mnth/day/filenameBase/ construct for the stills working area
+                fnBase = hput.formatNameBase(aimpoint["filenameBase"], deviceID)
+                logger.info(f"Sending: {fnBase}")
+                filenameBase = f"{fnBase}.zip"
+
+                defaultLz = "{year}/{month}/{day}/{fnBase}".format(year=year, month=month, day=day, fnBase=fnBase)
+                bucketPrefix = aimpoint["bucketPrefixTemplate"].format(year=year, month=month, day=day, deviceID=deviceID)
+                zipFileName = hput.formatNameSuffix(filenameBase, aimpoint["finalFileSuffix"], dayToWorkOn)
+
+                # Handle single-string input in the deliveryKey field
+                if type(aimpoint["deliveryKey"]) is str:
+                    aimpoint["deliveryKey"] = aimpoint["deliveryKey"].split()
+
+                theMsg = {
+                    "bagAndZip": {
+                        "selected": fnBase,
+                        "zipFileName": zipFileName,
+                        "bucketPrefix" : bucketPrefix,
+                        "wrkBucket": aimpoint["wrkBucket"],
+                        "dstBucket": aimpoint["dstBucket"],
+                        "deliveryKey": aimpoint["deliveryKey"],
+                        "filesLocation": f"{GLOBALS.stillImages}/{defaultLz}"
+                        }
+                }
+                logger.debug(f"Message: {json.dumps(theMsg)}")
+                sender.send(theMsg)
 
-        aimpoint['accessUrl'] = None
-        aimpoint['filenameBase'] = None
-        aimpoint['deviceID'] = stationId
+            aimpoint['accessUrl'] = None
+            aimpoint['filenameBase'] = None
+            aimpoint['deviceID'] = stationId
 
     return True
 
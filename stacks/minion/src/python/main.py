@@ -17,12 +17,14 @@ Can use the following event for testing as a lambda:
 # External libraries import statements
 import os
 import time
-import uuid
 import json
+import tarfile
 import zipfile
 import logging
 import threading
+import concurrent.futures
 import datetime as dt
+from collections import deque
 
 
 # This application's import statements
@@ -52,67 +54,65 @@ except ModuleNotFoundError as err:
 logger = logging.getLogger()
 
 
-def _sendToBucket(bucketKeyPickup, localFile, s3fileName, deleteOrig, dstBucket):
-    logger.info("Sending file to S3")
-
-    fileNamePath = os.path.join(config['workDirectory'], localFile)
-
-    try:
-        if os.path.isfile(fileNamePath):
-            result = GLOBALS.S3utils.pushToS3(fileNamePath,
-                                                bucketKeyPickup,
-                                                dstBucket,
-                                                s3BaseFileName=s3fileName,
-                                                deleteOrig=deleteOrig)
-            if result:
-                logger.info(f"Pushed {localFile} as {bucketKeyPickup}/{s3fileName}")
-                # Success...exit function
-                return
-            else:
-                logger.error(f"File {localFile} was not pushed to S3!")
-        else:
-            logger.warning(f"Unable to push {localFile}; file not found: {fileNamePath}")
-    except:
-        logger.warning(f"Unknown error trying to push {localFile}: {fileNamePath}")
-
-    raise HPatrolError("S3 push error")
-
-
-def _bagNZip(wrkBucket, fileList, wantedExt):
-    logger.info("Getting files from S3 to zip")
-    downloadedList = []
+def _streamZip(wrkBucket, fileList, wantedExt, dstBucket, s3filePath):
+    # Zips the wanted files straight from the working bucket into the destination object
+    # Nothing is staged on disk; entries are stored as-is (JPEGs don't compress) and
+    # ZIP64 records are used once the zip outgrows 4GB or 65,535 entries
+    logger.info(f"Zipping files from S3 into '{s3filePath}'")
     wantedExt = wantedExt.upper()
+    wantedFiles = [f for f in fileList if os.path.splitext(f)[1].upper() == wantedExt]
+    # Rolling archives from the collector ("stillsArchive" aimpoints)
+    archives = [f for f in fileList if os.path.splitext(f)[1].upper() == ".TAR"]
+
+    def readFile(s3File):
+        return GLOBALS.S3utils.readFileContent(wrkBucket, s3File, encoding=None)
+
+    def writeEntry(s3File, future):
+        data = future.result()
+        if data is None:
+            # Raised inside the upload so it's aborted; a zip missing files would never be redone
+            raise HPatrolError(f"Unable to read '{s3File}'")
+        zipObj.writestr(os.path.basename(s3File), data)
+        return 1
+
+    zipped = 0
     try:
-        for f in fileList:
-            # logger.debug(f)
-            fileName = f.split(os.path.sep)[-1]
-            # Filter the file list by the wanted extension
-            if os.path.splitext(f)[1].upper() == wantedExt:
-                # logger.debug(f"would be dowloading:{fileToGet}")
-                GLOBALS.S3utils.getFileFromS3(wrkBucket, f, os.path.join(config['workDirectory'], fileName))
-                downloadedList.append(fileName)
-    except Exception as e:
-        logger.exception(e)
-        raise HPatrolError("Error getting files to zip")
-    # logger.debug(f"downloadedList:{downloadedList}")
-
-    # Compose a random filename as input to zip
-    logger.info("Zipping up the files")
-    zipFilename = str(uuid.uuid4()) + ".zip"
-    try:
-        with zipfile.ZipFile(os.path.join(config['workDirectory'], zipFilename), "w") as zipObj:
-            for fName in downloadedList:
-                zipObj.write(os.path.join(config['workDirectory'], fName), fName)
+        with GLOBALS.S3utils.streamToS3(dstBucket, s3filePath, extras={"ContentType": "application/zip"}) as stream:
+            with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zipObj:
+                # Files are read a few ahead of the one being written; in order, with bounded memory
+                with concurrent.futures.ThreadPoolExecutor(max_workers=GLOBALS.s3DnThreads) as executor:
+                    pending = deque()
+                    for f in wantedFiles:
+                        pending.append((f, executor.submit(readFile, f)))
+                        if len(pending) >= GLOBALS.s3DnThreads * 2:
+                            zipped += writeEntry(*pending.popleft())
+                    while pending:
+                        zipped += writeEntry(*pending.popleft())
+
+                for f in archives:
+                    zipped += _zipArchive(zipObj, wrkBucket, f, wantedExt)
     except Exception as e:
         logger.exception(e)
         raise HPatrolError("Error zipping files")
 
-    # Cleanup file from working area; important for when in lambda execution
-    logger.info("Deleting downloaded files...")
-    for f in downloadedList:
-        os.remove(os.path.join(config['workDirectory'], f))
+    logger.info(f"Zipped {zipped} files")
+    return zipped
+
+
+def _zipArchive(zipObj, wrkBucket, s3File, wantedExt):
+    # Adds the archive's wanted files to the zip; the archive is read as a stream
+    added = 0
+    with tarfile.open(fileobj=GLOBALS.S3utils.getFileStream(wrkBucket, s3File), mode="r|") as tarObj:
+        for member in tarObj:
+            # Names are flattened, same as for the loose files
+            memberName = os.path.basename(member.name)
+            if not member.isfile() or os.path.splitext(memberName)[1].upper() != wantedExt:
+                continue
+            zipObj.writestr(memberName, tarObj.extractfile(member).read())
+            added += 1
 
-    return zipFilename
+    logger.info(f"Added {added} files from {os.path.basename(s3File)}")
+    return added
 
 
 def execute(selection):
@@ -136,34 +136,35 @@ def execute(selection):
     # Process each selection in turn
     logger.info(f"Received order to process '{selectionID}' to bucket '{dstBucket}' for {deliveryKeys}")
 
-    # In this minion we're only interested in .JPG files
-    filterBy = ".JPG"
-    for idx, aDeliveryKey in enumerate(deliveryKeys, start=1):
-        # Get the data only once
-        if idx == 1:
-            try:
-                zipName = _bagNZip(wrkBucket, fileList, filterBy)
-            except HPatrolError:
-                return False
-
-        logger.info(f"Processing '{selectionID}' to '{aDeliveryKey}'")
+    s3filePaths = []
+    for aDeliveryKey in deliveryKeys:
         s3filePath = os.path.join(f"{aDeliveryKey}/{dstKey}", s3fileName)
         if GLOBALS.S3utils.isFileInS3(dstBucket, s3filePath):
             logger.warning(f"File already exists in S3: {s3filePath}; NOT over-writing it.")
             continue
+        s3filePaths.append(s3filePath)
+
+    if not s3filePaths:
+        return True
+
+    # In this minion we're only interested in .JPG files
+    filterBy = ".JPG"
 
-        try:
-            # Don't delete the zip file until we've gone through all deliveryKeys
-            if idx == len(deliveryKeys):
-                _sendToBucket(f"{aDeliveryKey}/{dstKey}", zipName, s3fileName, GLOBALS.onProd, dstBucket)
-            else:
-                _sendToBucket(f"{aDeliveryKey}/{dstKey}", zipName, s3fileName, False, dstBucket)
+    # Zip only once, straight into the first destination; the others get server-side copies
+    logger.info(f"Processing '{selectionID}' to '{s3filePaths[0]}'")
+    try:
+        _streamZip(wrkBucket, fileList, filterBy, dstBucket, s3filePaths[0])
+    except HPatrolError:
+        return False
 
-        except HPatrolError:
-            # Ignore; error has been printed; keep trying the others
-            pass
+    allCopied = True
+    for s3filePath in s3filePaths[1:]:
+        logger.info(f"Processing '{selectionID}' to '{s3filePath}'")
+        # Error has been printed; keep trying the others
+        if not GLOBALS.S3utils.copyLargeFile(dstBucket, s3filePaths[0], dstBucket, s3filePath):
+            allCopied = False
 
-    return True
+    return allCopied
 
 
 def lambdaHandler(event, context):
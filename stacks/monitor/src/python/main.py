@@ -110,7 +110,8 @@ def execute():
     # Select aimpoints that are currently being monitored
     s3Dir = GLOBALS.monitorTrgt
     logger.info(f"Looking for files in S3: '/{s3Dir}'")
-    fileList = GLOBALS.S3utils.getFilesAsStrList(config["defaultWrkBucket"], s3Dir)
+    aimpoints = hput.AimpointFiles(s3Dir)
+    fileList = aimpoints.fileList
     # logger.debug(f"fileList:{fileList}")
     try:
         logger.info(f"Total aimpoints found:{len(fileList)}")
@@ -119,60 +120,66 @@ def execute():
 
     monitorOneDomains = set()
     processedDomains = set()
-    # For each aimpoint file, check its status
-    for idx, aFile in enumerate(fileList, start=1):
-        # Don't go through everything if we're not on PROD
-        if not GLOBALS.onProd and idx == 2:
-            logger.debug(f"Not running on PROD; exiting before processing file #{idx}")
-            break
-
-        # If an entire domain is down, only monitor one device per run
-        # from that domain; otherwise monitor all devices per domain
-        monitorDomain = os.path.dirname(aFile)
-        if monitorDomain in monitorOneDomains:
-            # Already looked into this domain as being fully down; ignore the rest
-            continue
-        if monitorDomain not in processedDomains:
-            activeDomain = monitorDomain.replace(GLOBALS.monitorTrgt, GLOBALS.targetFiles)
-            activeDevices = GLOBALS.S3utils.getFilesAsStrList(config["defaultWrkBucket"], activeDomain)
-            if not activeDevices:
-                # None found as active; therefore all are in monitoring status
-                monitorOneDomains.add(monitorDomain)
-                disabledDevices = GLOBALS.S3utils.getFilesAsStrList(config["defaultWrkBucket"], monitorDomain)
-                aFile = random.choice(disabledDevices)  # select one aimpoint to test at random
-            else:
-                processedDomains.add(monitorDomain)
-
-        logger.info(f"Processing file '{aFile}'")
-        contents = GLOBALS.S3utils.readFileContent(config["defaultWrkBucket"], aFile)
-        try:
-            targetConfig = json.loads(contents)
-        except Exception as e:
-            logger.warning(f"Error processing input file; skipping:::{e}")
-            continue
-
-        try:
-            if not targetConfig["enabled"]:
-                logger.info("Aimpoint disabled; skipping")
+    # For each aimpoint file, check its status; taskings go out in batches
+    with GLOBALS.sqsUtils.batchSender(config["disQueue"]) as sender:
+        for idx, aFile in enumerate(fileList, start=1):
+            # Don't go through everything if we're not on PROD
+            if not GLOBALS.onProd and idx == 2:
+                logger.debug(f"Not running on PROD; exiting before processing file #{idx}")
+                break
+
+            # If an entire domain is down, only monitor one device per run
+            # from that domain; otherwise monitor all devices per domain
+            monitorDomain = os.path.dirname(aFile)
+            if monitorDomain in monitorOneDomains:
+                # Already looked into this domain as being fully down; ignore the rest
+                continue
+            if monitorDomain not in processedDomains:
+                activeDomain = monitorDomain.replace(GLOBALS.monitorTrgt, GLOBALS.targetFiles)
+                activeDevices = GLOBALS.S3utils.getFilesAsStrList(config["defaultWrkBucket"], activeDomain)
+                if not activeDevices:
+                    # None found as active; therefore all are in monitoring status
+                    monitorOneDomains.add(monitorDomain)
+                    disabledDevices = GLOBALS.S3utils.getFilesAsStrList(config["defaultWrkBucket"], monitorDomain)
+                    aFile = random.choice(disabledDevices)  # select one aimpoint to test at random
+                else:
+                    processedDomains.add(monitorDomain)
+
+            logger.info(f"Processing file '{aFile}'")
+            try:
+                targetConfig = aimpoints.readAimpoint(aFile)
+            except Exception as e:
+                logger.warning(f"Error processing input file; skipping:::{e}")
                 continue
-        except KeyError:
-            pass
 
-        try:
-            monitorFrequency = targetConfig["monitorFrequency"]
-        except KeyError:
-            monitorFrequency = GLOBALS.monitorFrequency
-        currentHour = now.hour
-        # Process aimpoint based on its monitorFrequency
-        if not currentHour % monitorFrequency == 0:
-            continue
+            try:
+                if not targetConfig["enabled"]:
+                    logger.info("Aimpoint disabled; skipping")
+                    continue
+            except KeyError:
+                pass
+
+            try:
+                monitorFrequency = targetConfig["monitorFrequency"]
+            except KeyError:
+                monitorFrequency = GLOBALS.monitorFrequency
+            currentHour = now.hour
+            # Process aimpoint based on its monitorFrequency
+            if not currentHour % monitorFrequency == 0:
+                continue
     
-        _processAndTaskIt(now, targetConfig)
+            # The Dispatcher and Collector can rebuild the aimpoint from a reference to its file
+            if GLOBALS.dispatchRefs and aFile in aimpoints.etags:
+                theMsg = hput.aimpointRef(aFile, aimpoints.etags[aFile])
+            else:
+                theMsg = targetConfig
+
+            _processAndTaskIt(now, targetConfig, sender, theMsg)
 
     return len(fileList)
 
 
-def _processAndTaskIt(now, targetConfig):
+def _processAndTaskIt(now, targetConfig, sender, theMsg):
     systemPeriodicity = config['systemPeriodicity'] * 60  # convert to seconds
     systemTimeLimit = systemPeriodicity + 30
     # We add 30secs of overlap to the queue orders so as to not lose anything
@@ -227,10 +234,10 @@ def _processAndTaskIt(now, targetConfig):
                 addPlural = 's' if len(delayList) > 1 else ''                
                 logger.info(f"Will request every {frequency} seconds; {len(delayList)} request{addPlural} total")
 
-            _sendTasks(now, delayList, targetConfig)
+            _sendTasks(now, delayList, targetConfig, sender, theMsg)
 
 
-def _sendTasks(now, delayList, targetConfig):
+def _sendTasks(now, delayList, targetConfig, sender, theMsg):
     for idx, theDelay in enumerate(delayList, start=1):
         # Don't go through everything if we're not on PROD
         if not GLOBALS.onProd and idx == 5:
@@ -244,7 +251,7 @@ def _sendTasks(now, delayList, targetConfig):
             f"to run at {(now + dt.timedelta(seconds=theDelay)).strftime('%m/%d %H:%M:%S')}"
         )
         # logger.debug(f"Message: {json.dumps(targetConfig)}")
-        GLOBALS.sqsUtils.sendMessage(config["disQueue"], targetConfig, theDelay)
+        sender.send(theMsg, theDelay)
 
 
 if __name__ == '__main__':
@@ -215,7 +215,8 @@ class HPatrolProcessingStack(Stack):
 
     def _createDispatcherLambda(self) -> None:
         #Create an SQS event source for Lambda
-        sqsEventSource = SqsEventSource(self._dispatchQueue, batch_size=1)
+        # Full batches; the Dispatcher reports the messages that failed so only those are retried
+        sqsEventSource = SqsEventSource(self._dispatchQueue, batch_size=10, report_batch_item_failures=True)
 
         theLambda = PythonFunction(self, "dispatcherLambda",
             description="Invokes the Collector lambdas based on instructions received",
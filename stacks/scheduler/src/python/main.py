@@ -7,6 +7,7 @@ import logging
 import argparse
 import threading
 import datetime as dt
+import concurrent.futures
 
 
 # This application's import statements
@@ -108,45 +109,85 @@ def execute():
     # Obtain current time before we start looping and processing files,
     # so we get an accurate time of the "now" on the targets
     now = dt.datetime.now()
+    timings = {}
 
     # Select all currently tasked aimpoints
+    phaseStart = time.time()
     s3Dir = GLOBALS.targetFiles
     logger.info(f"Looking for files in S3: '/{s3Dir}'")
-    fileList = GLOBALS.S3utils.getFilesAsStrList(config['defaultWrkBucket'], s3Dir)
+    aimpoints = hput.AimpointFiles(s3Dir)
+    fileList = aimpoints.fileList
+    timings["list"] = time.time() - phaseStart
     # logger.debug(f"fileList:{fileList}")
     try:
         logger.info(f"Total aimpoints found:{len(fileList)}")
     except TypeError:
         return 0
 
-    # For each aimpoint file, task out the collectors
-    for idx, aFile in enumerate(fileList, start=1):
-        # Don't go through everything if we're not on PROD
-        if not GLOBALS.onProd and idx == 2:
-            logger.debug(f"Not running on PROD; exiting before processing file #{idx}")
-            break
+    # Don't go through everything if we're not on PROD
+    toProcess = fileList
+    if not GLOBALS.onProd:
+        logger.debug("Not running on PROD; processing only the first file")
+        toProcess = fileList[:1]
+
+    # Aimpoints are read and their delays worked out concurrently; mostly waiting on S3
+    phaseStart = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=GLOBALS.schedulerThreads) as executor:
+        planned = list(executor.map(lambda aFile: _loadAndPlan(now, aimpoints, aFile), toProcess))
+    timings["load"] = time.time() - phaseStart
+
+    # Taskings for aimpoints that can share a Collector are held here and sent together
+    batched = {} if GLOBALS.collectorBatch > 1 else None
+
+    toSend = []
+    for targetConfig, delayLists, theMsg in filter(None, planned):
+        for delayList in delayLists:
+            _sendTasks(now, delayList, targetConfig, batched, toSend, theMsg)
+
+    if batched:
+        _sendBatches(now, batched, toSend)
+
+    phaseStart = time.time()
+    _sendAll(toSend)
+    timings["send"] = time.time() - phaseStart
+
+    logger.info(
+        f"Tasked {sum(1 for x in planned if x)} aimpoints with {len(toSend)} messages; "
+        f"listing {timings['list']:.2f}s, loading {timings['load']:.2f}s, sending {timings['send']:.2f}s "
+        f"(files read: {aimpoints.fileReads})"
+    )
 
-        logger.info(f"Processing file '{aFile}'")
-        contents = GLOBALS.S3utils.readFileContent(config["defaultWrkBucket"], aFile)
-        try:
-            targetConfig = json.loads(contents)
-        except Exception as e:
-            logger.warning(f"Error processing input file; skipping:::{e}")
-            continue
+    return len(fileList)
 
-        try:
-            if not targetConfig["enabled"]:
-                logger.info("Aimpoint disabled; skipping")
-                continue
-        except KeyError:
-            pass
 
-        _processAndTaskIt(now, targetConfig)
+def _loadAndPlan(now, aimpoints, aFile):
+    # Returns the aimpoint, its delay lists and the message to send; None when it's skipped
+    logger.info(f"Processing file '{aFile}'")
+    try:
+        targetConfig = aimpoints.readAimpoint(aFile)
+    except Exception as e:
+        logger.warning(f"Error processing input file '{aFile}'; skipping:::{e}")
+        return None
 
-    return len(fileList)
+    try:
+        if not targetConfig["enabled"]:
+            logger.info(f"Aimpoint '{aFile}' disabled; skipping")
+            return None
+    except KeyError:
+        pass
+
+    # The Dispatcher and Collector can rebuild the aimpoint from a reference to its file
+    if GLOBALS.dispatchRefs:
+        theMsg = hput.aimpointRef(aFile, aimpoints.etags[aFile])
+    else:
+        theMsg = targetConfig
+
+    return targetConfig, _processAndTaskIt(now, targetConfig), theMsg
 
 
 def _processAndTaskIt(now, targetConfig):
+    # Returns the delay lists for the aimpoint's tasks; one per working-hours range
+    delayLists = []
     systemPeriodicity = config['systemPeriodicity'] * 60  # convert to seconds
     systemTimeLimit = systemPeriodicity + 30
     # We add 30secs of overlap to the queue orders so as to not lose anything
@@ -201,17 +242,24 @@ def _processAndTaskIt(now, targetConfig):
                 addPlural = 's' if len(delayList) > 1 else ''                
                 logger.info(f"Will request every {frequency} seconds; {len(delayList)} request{addPlural} total")
 
-            _sendTasks(now, delayList, targetConfig)
+            delayLists.append(delayList)
+
+    return delayLists
+
 
+def _sendTasks(now, delayList, targetConfig, batched, toSend, theMsg):
+    batchKey = hput.collectorBatchKey(targetConfig) if batched is not None else None
 
-def _sendTasks(now, delayList, targetConfig):
     for idx, theDelay in enumerate(delayList, start=1):
         # Don't go through everything if we're not on PROD
         if not GLOBALS.onProd and idx == 5:
             logger.debug(f"Not running on PROD; exiting at request #{idx}")
             break
 
-        theMsg = targetConfig
+        if batchKey is not None:
+            # Held until all aimpoints are processed; see _sendBatches()
+            batched.setdefault((theDelay, batchKey), []).append((targetConfig, theMsg))
+            continue
 
         baseName = hput.formatNameBase(targetConfig['filenameBase'], targetConfig['deviceID'])
         logger.info(f"Sending '{baseName}' "
@@ -220,7 +268,38 @@ def _sendTasks(now, delayList, targetConfig):
             f"to run at {(now + dt.timedelta(seconds=theDelay)).strftime('%m/%d %H:%M:%S')}"
         )
         # logger.debug(f"Message: {json.dumps(theMsg)}")
-        GLOBALS.sqsUtils.sendMessage(config['disQueue'], theMsg, theDelay)
+        toSend.append((theMsg, theDelay))
+
+
+def _sendBatches(now, batched, toSend):
+    # Aimpoints with the same delay and same Collector needs go out in groups of up to
+    # GLOBALS.collectorBatch; the Dispatcher sends each group to a single Collector invocation
+    for (theDelay, notUsed), aimpoints in batched.items():
+        for start in range(0, len(aimpoints), GLOBALS.collectorBatch):
+            chunk = aimpoints[start:start + GLOBALS.collectorBatch]
+            if len(chunk) == 1:
+                theMsg = chunk[0][1]
+            else:
+                theMsg = {"aimpoints": [aMsg for notUsed, aMsg in chunk]}
+
+            baseNames = [hput.formatNameBase(ap['filenameBase'], ap['deviceID']) for ap, notUsed in chunk]
+            logger.info(f"Sending {baseNames} "
+                f"to {config['disQueue']} queue "
+                f"with a delay of {str(dt.timedelta(seconds=theDelay))}, "
+                f"to run at {(now + dt.timedelta(seconds=theDelay)).strftime('%m/%d %H:%M:%S')}"
+            )
+            toSend.append((theMsg, theDelay))
+
+
+def _sendAll(toSend):
+    # Messages go out in batches of 10; several batch requests are in flight at once
+    with GLOBALS.sqsUtils.batchSender(config['disQueue']) as sender:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=GLOBALS.schedulerThreads) as executor:
+            list(executor.map(lambda x: sender.send(*x), toSend))
+
+    logger.info(f"Sent {sender.sent} messages in {sender.requests} requests to {config['disQueue']}")
+    if sender.failed:
+        logger.warning(f"{sender.failed} of {len(toSend)} messages failed to send to {config['disQueue']}")
 
 
 if __name__ == '__main__':
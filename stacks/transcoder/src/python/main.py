@@ -11,6 +11,7 @@ import os
 import time
 import json
 import uuid
+import shutil
 import logging
 import argparse
 import threading
@@ -75,6 +76,7 @@ def _sendToBucket(dstBucket, dstPrefix, filename):
 def _getRangeOfFiles(bucket, prefix, clipStart):
     # Obtain a large set of files bounded by the epoch times of clipStart. The files
     # are later downselected to the interested ones, but for now, just get the bunch.
+    # Returned as S3 listing objects; their sizes spare _getFiles() a HEAD per file
 
     # Notice we cut off the last 4 digits of epoch to do our search. Then
     # increase the least significant digit by one to grab the next chunk.
@@ -89,8 +91,8 @@ def _getRangeOfFiles(bucket, prefix, clipStart):
     searchFor = f'{prefix}{epochFirstSearch}*'
     # logger.debug(f"searchFor: '{searchFor}'")
     try:
-        firstList = GLOBALS.S3utils.getWildcardKey(searchFor, bucket, unique=True)
-        firstList.sort(key=hput.naturalKeys)
+        firstList = GLOBALS.S3utils.getWildcardKey(searchFor, bucket, unique=True, asObjects=True)
+        firstList.sort(key=lambda obj: hput.naturalKeys(obj["Key"]))
     except Exception:
         # Ignore; there may not be any files
         logger.warning("No files found...strange")
@@ -101,8 +103,8 @@ def _getRangeOfFiles(bucket, prefix, clipStart):
     searchFor = f'{prefix}{epochSecndSearch}*'
     # logger.debug(f"searchFor: '{searchFor}'")
     try:
-        secndList = GLOBALS.S3utils.getWildcardKey(searchFor, bucket, unique=True)
-        secndList.sort(key=hput.naturalKeys)
+        secndList = GLOBALS.S3utils.getWildcardKey(searchFor, bucket, unique=True, asObjects=True)
+        secndList.sort(key=lambda obj: hput.naturalKeys(obj["Key"]))
     except Exception:
         # Ignore; there may not be any files
         logger.warning("No files found...strange")
@@ -117,7 +119,7 @@ def _getRangeOfFiles(bucket, prefix, clipStart):
 
 
 def _focusFileList(sortedFiles, clipStart, clipEnd, ext):
-    # Note that function assumes it receives a sorted list
+    # Note that function assumes it receives a sorted list of S3 listing objects
     logger.info("Reducing file list to within the requested timeframe")
 
     clipStart = int(clipStart)
@@ -126,7 +128,7 @@ def _focusFileList(sortedFiles, clipStart, clipEnd, ext):
     cleanedList = []
     for idx, aFile in enumerate(sortedFiles):
         # Using float because some filenames have additional indices (i.e.: _<epoch>.idx.ts)
-        fileEpoch = float(aFile.replace(ext, '').split('_')[-1])
+        fileEpoch = float(aFile["Key"].replace(ext, '').split('_')[-1])
         if fileEpoch < clipStart or fileEpoch > clipEnd:
             continue
         # print(f'{idx}: {aFile} {fileEpoch}')
@@ -136,7 +138,7 @@ def _focusFileList(sortedFiles, clipStart, clipEnd, ext):
         raise HPatrolError("No files to process")
 
     # Checks if the interval requested is longer than the files returned by _getRangeOfFiles
-    if clipEnd > float(sortedFiles[-1].replace(ext, '').split('_')[-1]):
+    if clipEnd > float(sortedFiles[-1]["Key"].replace(ext, '').split('_')[-1]):
         logger.warning("Requested clip end time is beyond the last identified file in the list - list may be incomplete")
 
     # print(f'clipStart: {clipStart}  clipEnd: {clipEnd}')
@@ -254,20 +256,26 @@ def _goodSplit(downloadedList, mp4Filename):
 
 
 def _getFiles(fileList, srcBucket):
-    downloadedList = []
     try:
-        for fileToGet in fileList:
-            logger.debug(fileToGet)
-            fileName = fileToGet.split(os.path.sep)[-1]
-            # logger.debug(f"would be dowloading:{fileToGet}")
-            GLOBALS.S3utils.getFileFromS3(srcBucket, fileToGet, os.path.join(config['workDirectory'], fileName))
-            downloadedList.append(fileName)
+        # Leave half of the working area for the transcoded output
+        localPaths = GLOBALS.S3utils.getFilesFromS3(srcBucket,
+                                                    fileList,
+                                                    config['workDirectory'],
+                                                    maxThreads=GLOBALS.s3DnThreads,
+                                                    byteBudget=shutil.disk_usage(config['workDirectory']).free // 2)
     except Exception as err:
         logger.exception(err)
         raise HPatrolError("Error downloading")
     # logger.debug(f"downloadedList:{downloadedList}")
 
-    return downloadedList
+    if len(localPaths) != len(fileList):
+        # Files left out (failed or past the byte budget) would make a shorter, gapped output
+        # Fail the task instead so it can be tried again; nothing is left behind in the working area
+        for aPath in localPaths:
+            os.remove(aPath)
+        raise HPatrolError(f"Only {len(localPaths)} of {len(fileList)} files downloaded")
+
+    return [os.path.basename(aPath) for aPath in localPaths]
 
 
 # Allow for advanced ffmpeg processing features
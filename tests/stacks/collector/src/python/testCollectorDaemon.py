@@ -0,0 +1,155 @@
+# External libraries import statements
+import os
+import sys
+import json
+import signal
+import shutil
+import os.path
+import logging
+import unittest
+import tempfile
+from moto import mock_aws
+from unittest.mock import patch
+
+
+# This is necessary in order for the tests to recognize local utilities
+testdir = os.path.dirname(__file__)
+srcdir = "../../../../../stacks/collector/src/python"
+absolute = os.path.abspath(os.path.join(testdir, srcdir))
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+# This application's import statements
+import collectorDaemon
+import superGlblVars as GLOBALS
+import orangeUtils.awsUtils as awsUtils
+from utils import hPatrolUtils as hput
+
+
+class TestCollectorDaemon(unittest.TestCase):
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(format = "%(asctime)s %(module)s %(levelname)s: %(message)s",
+                datefmt = "%m/%d/%Y %I:%M:%S %p", level = logging.INFO)
+
+
+    def setUp(self):
+        self.spoolDir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.spoolDir)
+
+
+    # Spooled orders only show up once their delay is over, like SQS's DelaySeconds
+    def test_spoolDelay(self):
+        collectorDaemon.spoolMessage(self.spoolDir, {"deviceID": "now"})
+        collectorDaemon.spoolMessage(self.spoolDir, {"deviceID": "later"}, delay=600)
+
+        source = collectorDaemon.SpoolSource(self.spoolDir, waitSecs=0)
+        received = source.receive(10)
+        self.assertEqual([body["deviceID"] for body, handle in received], ["now"])
+
+        source.delete(received[0][1])
+        self.assertEqual(source.receive(10), [])
+        self.assertEqual(len(os.listdir(self.spoolDir)), 1)
+
+
+    # Every aimpoint in an order is run; orders for a different proxy are left alone
+    @patch.dict(GLOBALS.config, {"proxy": False})
+    def test_serve(self):
+        collectorDaemon.spoolMessage(self.spoolDir, {"aimpoints": [
+            {"filenameBase": "a_{deviceID}", "deviceID": 1},
+            {"filenameBase": "b_{deviceID}", "deviceID": 2}
+        ]})
+        collectorDaemon.spoolMessage(self.spoolDir, {"filenameBase": "c_{deviceID}", "deviceID": 3, "vpn": "elsewhere"})
+
+        ran = []
+        def runAimpoint(ap):
+            ran.append(ap["deviceID"])
+            if len(ran) == 2:
+                os.kill(os.getpid(), signal.SIGINT)
+            return True
+
+        source = collectorDaemon.SpoolSource(self.spoolDir, waitSecs=1)
+        collectorDaemon.serve(source, runAimpoint, workers=4)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        self.assertEqual(sorted(ran), [1, 2])
+        # The VPN order is still waiting for a consumer that can take it
+        self.assertEqual(len(os.listdir(self.spoolDir)), 1)
+
+
+    # A batched order runs the aimpoints that can be resolved; one gone from S3 doesn't drop the rest
+    @mock_aws
+    @patch.dict(GLOBALS.config, {"proxy": False, "defaultWrkBucket": "test"})
+    def test_serveRefs(self):
+        s3Client = awsUtils.boto3.client("s3", region_name="us-east-1")
+        s3Client.create_bucket(Bucket="test")
+        GLOBALS.S3utils = awsUtils.S3utils(None, None, "test")
+        aimpoint = {"filenameBase": "{deviceID}", "deviceID": "good"}
+        goodEtag = s3Client.put_object(Bucket="test", Key="aimpoints/good.json", Body=json.dumps(aimpoint))["ETag"]
+        s3Client.put_object(Bucket="test", Key="aimpoints/stale.json", Body=json.dumps(dict(aimpoint, deviceID="regenerated")))
+        collectorDaemon.spoolMessage(self.spoolDir, {"aimpoints": [
+            hput.aimpointRef("aimpoints/good.json", goodEtag),
+            hput.aimpointRef("aimpoints/gone.json", goodEtag),
+            hput.aimpointRef("aimpoints/stale.json", '"scheduled-version"')
+        ]})
+
+        ran = []
+        def runAimpoint(ap):
+            ran.append(ap["deviceID"])
+            if len(ran) == 2:
+                os.kill(os.getpid(), signal.SIGINT)
+            return True
+
+        try:
+            collectorDaemon.serve(collectorDaemon.SpoolSource(self.spoolDir, waitSecs=1), runAimpoint, workers=4)
+        finally:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            hput._aimpointCache.clear()
+            GLOBALS.S3utils = None
+
+        self.assertEqual(sorted(ran), ["good", "regenerated"])
+        self.assertEqual(os.listdir(self.spoolDir), [])
+
+
+    # Malformed orders are deleted instead of taking the daemon down; released ones stay hidden a while
+    @mock_aws
+    def test_sqsSource(self):
+        GLOBALS.sqsUtils = awsUtils.SQSutils(regionName="us-east-1")
+        sqsClient = GLOBALS.sqsUtils.sqsClient
+        queueUrl = sqsClient.create_queue(QueueName="daemon")["QueueUrl"]
+        for body in ("not json", "[1, 2]", '{"deviceID": "cam"}'):
+            sqsClient.send_message(QueueUrl=queueUrl, MessageBody=body)
+
+        source = collectorDaemon.SqsSource(queueUrl, waitSecs=0)
+        received = []
+        for i in range(3):
+            received += source.receive(10)
+        self.assertEqual([body for body, handle in received], [{"deviceID": "cam"}])
+
+        source.release(received[0][1])
+        self.assertEqual(source.receive(10), [])
+        attributes = sqsClient.get_queue_attributes(QueueUrl=queueUrl, AttributeNames=["All"])["Attributes"]
+        self.assertEqual((attributes["ApproximateNumberOfMessages"], attributes["ApproximateNumberOfMessagesNotVisible"]), ("0", "1"))
+
+
+    # Spool files that aren't orders are skipped instead of taking the daemon down
+    def test_spoolMalformed(self):
+        badFiles = {"a.json": "not json", "b.json": "[1, 2]", "c.json": '{"delay": 0}',
+                    "d.json": '{"body": [1]}', "e.json": '{"body": {}, "delay": "soon"}'}
+        for aFile, contents in badFiles.items():
+            with open(os.path.join(self.spoolDir, aFile), "w") as f:
+                f.write(contents)
+        collectorDaemon.spoolMessage(self.spoolDir, {"deviceID": "cam"})
+
+        source = collectorDaemon.SpoolSource(self.spoolDir, waitSecs=0)
+        received = source.receive(10)
+        self.assertEqual([body for body, handle in received], [{"deviceID": "cam"}])
+        self.assertEqual(source.skipped, {os.path.join(self.spoolDir, aFile) for aFile in badFiles})
+
+
+    def test_poolSize(self):
+        self.assertEqual(collectorDaemon.poolSize(workers=3), 3)
+        self.assertEqual(collectorDaemon.poolSize(mbps=10), 10 // GLOBALS.daemonMbpsPerCollection)
@@ -0,0 +1,88 @@
+# External libraries import statements
+import sys
+import json
+import boto3
+import os.path
+import logging
+import threading
+import unittest
+from moto import mock_aws
+from unittest.mock import patch, MagicMock
+
+# This is necessary in order for the tests to recognize local utilities
+testdir = os.path.dirname(__file__)
+srcdir = "../../../../../stacks/collector/src/python"
+absolute = os.path.abspath(os.path.join(testdir, srcdir))
+sys.path.insert(0, absolute)
+
+# This application's import statements
+import main as collector
+import superGlblVars as GLOBALS
+import orangeUtils.awsUtils as awsUtils
+from utils import hPatrolUtils as hput
+
+
+class TestMain(unittest.TestCase):
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(format = "%(asctime)s %(module)s %(levelname)s: %(message)s",
+                    datefmt = "%m/%d/%Y %I:%M:%S %p", level = logging.INFO)
+
+
+    # Every aimpoint in a batch runs in its own thread and gets its own audit entry
+    @patch("main.auditUtils.logFromLambda")
+    @patch("main.execute")
+    def test_executeBatch(self, mocked_execute, mocked_logFromLambda):
+        threads = {}
+        def helperExecute(ap, lambdaContext):
+            threads[ap["deviceID"]] = threading.current_thread().name
+            if ap["deviceID"] == "bad":
+                raise RuntimeError("collection blew up")
+            return "Normal execution", True
+        mocked_execute.side_effect = helperExecute
+
+        aimpoints = [{"deviceID": x, "filenameBase": "cam_{deviceID}", "collectionType": "STILLS"} for x in ("a", "b")]
+        self.assertTrue(collector.executeBatch(aimpoints))
+        self.assertEqual(threads, {"a": "cam_a", "b": "cam_b"})
+        audited = {aCall.kwargs["event"]["deviceID"]: aCall.kwargs["subtaskName"] for aCall in mocked_logFromLambda.call_args_list}
+        self.assertEqual(audited, {"a": "Still", "b": "Still"})
+
+        # One failing aimpoint fails the batch, not the others
+        mocked_logFromLambda.reset_mock()
+        aimpoints.append({"deviceID": "bad", "filenameBase": "{deviceID}", "collectionType": "M3U"})
+        self.assertFalse(collector.executeBatch(aimpoints))
+        self.assertEqual(mocked_logFromLambda.call_count, 3)
+        self.assertFalse(collector.executeBatch([]))
+
+
+    # A batch referencing a file that's gone still collects the aimpoints that can be read
+    @mock_aws
+    @patch.dict(collector.config, {"defaultWrkBucket": "test", "proxy": False})
+    @patch("main.executeBatch")
+    @patch("main.processInit")
+    def test_lambdaHandlerRefs(self, mocked_processInit, mocked_executeBatch):
+        s3Client = boto3.client("s3", region_name="us-east-1")
+        s3Client.create_bucket(Bucket="test")
+        GLOBALS.S3utils = awsUtils.S3utils(None, None, "test")
+        goodEtag = s3Client.put_object(Bucket="test", Key="aimpoints/good.json", Body=json.dumps({"deviceID": "good"}))["ETag"]
+        s3Client.put_object(Bucket="test", Key="aimpoints/stale.json", Body=json.dumps({"deviceID": "regenerated"}))
+        mocked_processInit.preFlightSetup.return_value = 0
+        mocked_processInit.initialize.return_value = True
+        mocked_executeBatch.return_value = True
+        event = {"aimpoints": [
+            hput.aimpointRef("aimpoints/good.json", goodEtag),
+            hput.aimpointRef("aimpoints/gone.json", goodEtag),
+            hput.aimpointRef("aimpoints/stale.json", '"scheduled-version"')
+        ]}
+
+        try:
+            self.assertEqual(collector.lambdaHandler(event, MagicMock()), {"status": True})
+            self.assertEqual([x["deviceID"] for x in mocked_executeBatch.call_args.args[0]], ["good", "regenerated"])
+
+            # Nothing to collect at all
+            mocked_executeBatch.reset_mock()
+            event = {"aimpoints": [hput.aimpointRef("aimpoints/gone.json", goodEtag)]}
+            self.assertEqual(collector.lambdaHandler(event, MagicMock()), {"status": False})
+            mocked_executeBatch.assert_not_called()
+        finally:
+            hput._aimpointCache.clear()
+            GLOBALS.S3utils = None
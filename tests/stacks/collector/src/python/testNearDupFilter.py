@@ -0,0 +1,63 @@
+# External libraries import statements
+import sys
+import os.path
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+# This is necessary in order for the tests to recognize local utilities
+testdir = os.path.dirname(__file__)
+srcdir = "../../../../../stacks/collector/src/python"
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+# This application's import statements
+import nearDupFilter as ndf
+
+
+class TestNearDupFilter(unittest.TestCase):
+
+    # Helper builds a JPEG of a gradient scene with optional text overlay
+    def helperJpeg(self, overlay=None, flip=False):
+        x = np.linspace(0, 255, 320)
+        pixels = np.outer(np.linspace(0, 1, 240), x).astype(np.uint8)
+        if flip:
+            pixels = pixels[:, ::-1]
+        img = Image.fromarray(pixels).convert("RGB")
+        if overlay:
+            ImageDraw.Draw(img).text((5, 5), overlay, fill=(255, 255, 255))
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=85)
+        return out.getvalue()
+
+
+    # A new timestamp overlay is a near-duplicate; a different scene is not
+    def test_nearDuplicates(self):
+        for method in ("dct", "average"):
+            nearFilter = ndf.NearDupFilter(threshold=6, history=2, method=method)
+            isDup, firstHash = nearFilter.check(self.helperJpeg("2024-01-01 10:00:00"))
+            self.assertFalse(isDup)
+            nearFilter.keep(firstHash)
+
+            isDup, _ = nearFilter.check(self.helperJpeg("2024-01-01 10:00:05"))
+            self.assertTrue(isDup, method)
+
+            isDup, _ = nearFilter.check(self.helperJpeg("2024-01-01 10:00:10", flip=True))
+            self.assertFalse(isDup, method)
+
+        # Undecodable data is kept
+        self.assertEqual(nearFilter.check(b"not an image"), (False, None))
+
+
+    # Only aimpoints with a threshold get a filter, one per device
+    def test_filterFor(self):
+        filters = {}
+        self.assertIsNone(ndf.filterFor({}, filters, "cam.JPG"))
+
+        ap = {"nearDupThreshold": 4, "nearDupHistory": 3}
+        nearFilter = ndf.filterFor(ap, filters, "cam.JPG")
+        self.assertIs(ndf.filterFor(ap, filters, "cam.JPG"), nearFilter)
+        self.assertEqual(nearFilter.recent.maxlen, 3)
+        self.assertEqual(ndf.hammingDistance(0b1011, 0b0010), 2)
@@ -3,11 +3,12 @@ import sys
 import json
 import time
 import logging
+import tarfile
 import os.path
 import pathlib
 import unittest
 from moto import mock_aws
-from unittest.mock import mock_open, patch, MagicMock
+from unittest.mock import patch, MagicMock
 
 
 # This is necessary in order for the tests to recognize local utilities
@@ -52,10 +53,10 @@ class TestStillsGrabber(unittest.TestCase):
     # when collection fails due to ConnectionError
     @patch.dict(GLOBALS.config, {"statusQueue": "test"})
     @patch("utils.hPatrolUtils.itsTimeToBail")
-    @patch.object(GLOBALS.netUtils, "downloadImage")
-    def test_collectStillConnectionError(self, mocked_downloadImage, mocked_itsTimeToBail) -> None:
+    @patch.object(GLOBALS.netUtils, "downloadImageData")
+    def test_collectStillConnectionError(self, mocked_downloadImageData, mocked_itsTimeToBail) -> None:
         self.logger.info("Running test_collectStillConnectionError...")
-        mocked_downloadImage.side_effect = ConnectionError
+        mocked_downloadImageData.side_effect = ConnectionError
         mocked_itsTimeToBail.return_value = True
         prefixBase = self._getPrefixBase(self.stillsAimpointNotFound)
         
@@ -68,31 +69,200 @@ class TestStillsGrabber(unittest.TestCase):
         self.assertEqual(msg["aimpoint"], self.stillsAimpointNotFound)
 
 
-    # Test successful collection for _collectStill; lots of patch's for external deps
-    # so we don't do things like reach out to the web or read/write files
+    # Test successful collection for _collectStill; patch's for external deps
+    # so we don't do things like reach out to the web or write to S3
     @patch("stillsGrabber._pushHashInContent")            
     @patch("stillsGrabber._saveWasSuccessful")
     @patch("stillsGrabber._isSameImage")
-    @patch.object(GLOBALS.netUtils, "downloadImage")
-    @patch("os.rename")
-    @patch("builtins.open", new_callable=mock_open, read_data="mock data")
-    @patch("orangeUtils.utils.makeHashFileFromData")
-    def test_collectStillSuccess(self, mocked_makeHash, mocked_file, mocked_rename, mocked_downloadImage, mocked_isSameImage, mocked_saveWasSuccessful, mocked_pushHashInContent) -> None:
+    @patch.object(GLOBALS.netUtils, "downloadImageData")
+    def test_collectStillSuccess(self, mocked_downloadImageData, mocked_isSameImage, mocked_saveWasSuccessful, mocked_pushHashInContent) -> None:
         self.logger.info("Running test_collectStillSuccess...")
         mocked_response = MagicMock()
         mocked_response.status_code = 200
-        mocked_downloadImage.return_value = mocked_response
+        mocked_downloadImageData.return_value = (mocked_response, b"imageBytes", "theHash")
         mocked_isSameImage.return_value = False
+        mocked_saveWasSuccessful.return_value = True
         aimpoint = self.stillsAimpointSuccess
         prefixBase = self._getPrefixBase(aimpoint)
 
-        stillsGrabber._collectStill(prefixBase, aimpoint, None, aimpoint["collectionType"])
-        
-        mocked_rename.assert_called_once()
-        mocked_makeHash.assert_called_once()
-        mocked_pushHashInContent.assert_called_once()
-        mocked_saveWasSuccessful.assert_called_once()
-        self.assertTrue(mocked_saveWasSuccessful.return_value)
+        try:
+            stillsGrabber._collectStill(prefixBase, aimpoint, None, aimpoint["collectionType"])
+            ourFilename = mocked_isSameImage.call_args.args[1]
+            self.assertEqual(stillsGrabber._lastHashes[ourFilename], "theHash")
+        finally:
+            stillsGrabber._lastHashes.clear()
+            stillsGrabber._unflushedHashes.clear()
+
+        # Image and hash go straight from memory to the upload
+        self.assertEqual(mocked_isSameImage.call_args.args[2], "theHash")
+        self.assertEqual(mocked_saveWasSuccessful.call_args.args[5:], (b"imageBytes", "theHash"))
+        mocked_pushHashInContent.assert_called_once_with(ourFilename)
+
+
+    # The device's last hash is asked to S3 once per run, then kept; it's written back once per run
+    @patch.dict(GLOBALS.config, {"defaultWrkBucket": "test"})
+    def test_lastHashCache(self) -> None:
+        GLOBALS.S3utils = MagicMock()
+        GLOBALS.S3utils.readFileContent.return_value = "oldHash"
+        try:
+            self.assertTrue(stillsGrabber._isSameImage("test", "cam.JPG", "oldHash"))
+            self.assertFalse(stillsGrabber._isSameImage("test", "cam.JPG", "newHash"))
+            GLOBALS.S3utils.readFileContent.assert_called_once()
+
+            stillsGrabber._pushHashInContent("cam.JPG")
+            GLOBALS.S3utils.pushFileObjToS3.assert_not_called()
+
+            stillsGrabber._lastHashes["cam.JPG"] = "newHash"
+            stillsGrabber._unflushedHashes.add("cam.JPG")
+            stillsGrabber._pushHashInContent("cam.JPG")
+            self.assertEqual(GLOBALS.S3utils.pushFileObjToS3.call_args.args[0].getvalue(), b"newHash")
+            self.assertEqual(stillsGrabber._unflushedHashes, set())
+
+            # The next run reads the hash file again; another container may have written it
+            stillsGrabber._forgetLastHash("cam.JPG")
+            GLOBALS.S3utils.readFileContent.return_value = "otherHash"
+            self.assertTrue(stillsGrabber._isSameImage("test", "cam.JPG", "otherHash"))
+            self.assertEqual(GLOBALS.S3utils.readFileContent.call_count, 2)
+        finally:
+            stillsGrabber._lastHashes.clear()
+            GLOBALS.S3utils = None
+
+
+    # An image that didn't change since the last one saved comes back as a 304; nothing is saved
+    @patch("stillsGrabber._saveWasSuccessful")
+    @patch.object(GLOBALS.netUtils, "downloadImageData")
+    def test_collectStillNotModified(self, mocked_downloadImageData, mocked_saveWasSuccessful) -> None:
+        self.logger.info("Running test_collectStillNotModified...")
+        mocked_response = MagicMock()
+        mocked_response.status_code = 304
+        mocked_downloadImageData.return_value = (mocked_response, None, None)
+        aimpoint = self.stillsAimpointSuccess
+        stillsGrabber._imageValidators[aimpoint["accessUrl"]] = {"etag": '"abc"', "lastMod": None}
+
+        try:
+            stillsGrabber._collectStill(self._getPrefixBase(aimpoint), aimpoint, None, aimpoint["collectionType"])
+        finally:
+            stillsGrabber._imageValidators.clear()
+
+        self.assertEqual(mocked_downloadImageData.call_args.args[1], {"etag": '"abc"', "lastMod": None})
+        mocked_saveWasSuccessful.assert_not_called()
+
+
+    # FSTLLS polls all its cameras on each tick with a single sleep between ticks
+    @patch("stillsGrabber._keepCollecting")
+    @patch("stillsGrabber._pushHashInContent")
+    @patch("stillsGrabber._pollStill")
+    def test_sweepStills(self, mocked_pollStill, mocked_pushHashInContent, mocked_keepCollecting) -> None:
+        self.logger.info("Running test_sweepStills...")
+        mocked_pollStill.return_value = True
+        mocked_keepCollecting.side_effect = [True, False]
+        aimpoint = dict(self.stillsAimpointSuccess, collectionType="FSTLLS",
+                        deviceIdList=["cam1", "cam2", "cam3"],
+                        accessUrlList=[f"https://example.com/cam{i}.jpg" for i in range(1, 4)],
+                        filenameBaseList=["{deviceID}"] * 3)
+
+        stillsGrabber._sweepStills(self._getPrefixBase(aimpoint), aimpoint)
+
+        self.assertEqual(mocked_pollStill.call_count, 6)
+        self.assertEqual(mocked_keepCollecting.call_count, 2)
+        polled = sorted(aCall.args[1]["deviceID"] for aCall in mocked_pollStill.call_args_list)
+        self.assertEqual(polled, ["cam1", "cam1", "cam2", "cam2", "cam3", "cam3"])
+        self.assertTrue(mocked_pollStill.call_args.args[0].endswith(mocked_pollStill.call_args.args[1]["deviceID"]))
+        self.assertEqual(mocked_pushHashInContent.call_count, 3)
+
+
+    # Cameras still down when a singleCollector run ends are reported, whichever tick they failed on
+    @patch.dict(GLOBALS.config, {"statusQueue": "test"})
+    @patch("utils.hPatrolUtils.itsTimeToBail")
+    @patch("stillsGrabber._keepCollecting")
+    @patch("stillsGrabber._pushHashInContent")
+    @patch("stillsGrabber._pollStill")
+    def test_sweepStillsDown(self, mocked_pollStill, mocked_pushHashInContent, mocked_keepCollecting, mocked_itsTimeToBail) -> None:
+        # cam1 is fine, cam2 fails on the first tick only and cam3 stops answering after the first one
+        results = {"cam1": [True, True, True], "cam2": [False, True, True], "cam3": [True, False, False]}
+        mocked_pollStill.side_effect = lambda camPrefix, camAp, collType: results[camAp["deviceID"]].pop(0)
+        mocked_keepCollecting.side_effect = [True, True, False]
+        mocked_itsTimeToBail.return_value = False
+        aimpoint = dict(self.stillsAimpointSuccess, collectionType="FSTLLS", singleCollector=True,
+                        deviceIdList=["cam1", "cam2", "cam3"],
+                        accessUrlList=[f"https://example.com/cam{i}.jpg" for i in range(1, 4)],
+                        filenameBaseList=["{deviceID}"] * 3)
+
+        with patch.object(GLOBALS.sqsUtils, "sendMessage") as mocked_sendMessage:
+            stillsGrabber._sweepStills(self._getPrefixBase(aimpoint), aimpoint)
+
+        reported = [(aCall.args[1]["aimpoint"]["deviceID"], aCall.args[1]["isCollecting"]) for aCall in mocked_sendMessage.call_args_list]
+        self.assertEqual(reported, [("cam3", False)])
+
+
+    # Archived stills go up together in one tar, with an index of their capture epochs
+    # The device's last hash only changes once the tar is in S3; failed tars are retried
+    @patch.dict(GLOBALS.config, {"statusQueue": "test"})
+    @patch.object(GLOBALS, "archiveRetries", 2)
+    def test_stillsArchive(self) -> None:
+        GLOBALS.S3utils = MagicMock()
+        os.makedirs(GLOBALS.config["workDirectory"], exist_ok=True)
+        uploaded = []
+        s3Down = []
+
+        def helperPushToS3(localFilePath, s3DirPrefix, bucketName, deleteOrig=False, **kwargs):
+            if s3Down:
+                return False
+            with tarfile.open(localFilePath) as tarObj:
+                uploaded.append((tarObj.getnames(), json.load(tarObj.extractfile("index.json"))))
+            os.remove(localFilePath)
+            return True
+
+        def helperAdd(name, data, theHash, epoch):
+            return stillsGrabber._archiveWasSuccessful(archive, "test", "stillsLz/cam", name, ap, data, theHash, epoch)
+
+        GLOBALS.S3utils.pushToS3.side_effect = helperPushToS3
+        ap = dict(self.stillsAimpointSuccess, stillsArchive=True, archiveImages=2, singleCollector=True)
+        try:
+            self.assertIsNone(stillsGrabber._archiveFor(dict(ap, singleCollector=False), "cam.JPG"))
+            archive = stillsGrabber._archiveFor(ap, "cam.JPG")
+            self.assertTrue(helperAdd("cam_100.JPG", b"one", "h1", 100))
+            GLOBALS.S3utils.pushToS3.assert_not_called()
+            self.assertNotIn("cam.JPG", stillsGrabber._lastHashes)
+            self.assertTrue(stillsGrabber._isSameImage("test", "cam.JPG", "h1", archive))
+            self.assertTrue(helperAdd("cam_102.JPG", b"two", "h2", 102))
+            GLOBALS.S3utils.pushToS3.assert_called_once()
+            self.assertEqual(stillsGrabber._lastHashes["cam.JPG"], "h2")
+
+            # A failed upload leaves the last hash as it was and keeps the tar for the next flush
+            s3Down.append(True)
+            self.assertTrue(helperAdd("cam_104.JPG", b"three", "h3", 104))
+            self.assertFalse(helperAdd("cam_106.JPG", b"four", "h4", 106))
+            self.assertEqual(stillsGrabber._lastHashes["cam.JPG"], "h2")
+            self.assertTrue(stillsGrabber._isSameImage("test", "cam.JPG", "h4", archive))
+            self.assertEqual(len(archive.pending), 1)
+
+            s3Down.clear()
+            self.assertTrue(helperAdd("cam_108.JPG", b"five", "h5", 108))
+            self.assertTrue(helperAdd("cam_110.JPG", b"six", "h6", 110))
+            self.assertEqual(archive.pending, [])
+            self.assertEqual(stillsGrabber._lastHashes["cam.JPG"], "h6")
+
+            # The end of the run gives up after archiveRetries attempts, dropping the tar
+            s3Down.append(True)
+            self.assertTrue(helperAdd("cam_112.JPG", b"seven", "h7", 112))
+            pushes = GLOBALS.S3utils.pushToS3.call_count
+            stillsGrabber._flushArchive("cam.JPG")
+            self.assertEqual(GLOBALS.S3utils.pushToS3.call_count - pushes, 2)
+            self.assertFalse(os.path.isfile(archive.localPath))
+            self.assertEqual(stillsGrabber._lastHashes["cam.JPG"], "h6")
+        finally:
+            stillsGrabber._archives.clear()
+            stillsGrabber._lastHashes.clear()
+            stillsGrabber._unflushedHashes.clear()
+            GLOBALS.S3utils = None
+
+        self.assertEqual([names for names, index in uploaded], [
+            ["cam_100.JPG", "cam_102.JPG", "index.json"],
+            ["cam_104.JPG", "cam_106.JPG", "index.json"],
+            ["cam_108.JPG", "cam_110.JPG", "index.json"]
+        ])
+        self.assertEqual([x["epoch"] for x in uploaded[1][1]["images"]], [104, 106])
 
 
     def _getAimpointDict(self, fileName):
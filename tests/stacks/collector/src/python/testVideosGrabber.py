@@ -1,11 +1,12 @@
 # External libraries import statements
 import sys
 import time
+import hashlib
 import os.path
 import logging
 import unittest
-from unittest.mock import patch
-from random import randrange, getrandbits
+from unittest.mock import patch, MagicMock
+from random import random, randrange, getrandbits
 
 
 # This is necessary in order for the tests to recognize local utilities
@@ -26,7 +27,7 @@ class TestVideosGrabber(unittest.TestCase):
                     datefmt = "%m/%d/%Y %I:%M:%S %p", level = logging.DEBUG)
 
     # Helper function returns true 90% of the time
-    def helperWasSaveSuccessful(self,a,b,c,d,e):   
+    def helperWasSaveSuccessful(self,a,b,c,d,e,f=None):
         self.logger.info(f"working on {d}")
         time.sleep(randrange(5)+1)
         self.logger.info(f"completed working on {d}")
@@ -56,3 +57,178 @@ class TestVideosGrabber(unittest.TestCase):
         self.assertEqual(len(tsFiles),100)
         self.assertNotEqual(len(finalList),100)
         self.logger.info(finalList)
+
+
+    # Helper returns a response whose content identifies the requested URL, after a random delay
+    def helperSlowGet(self, url, **kwargs):
+        time.sleep(random() / 4)
+        self.assertTrue(kwargs["stream"])
+        response = MagicMock()
+        response.iter_content.return_value = [url.encode("utf-8")]
+        return response
+
+
+    # Segments downloaded in parallel must still be handed over in playlist order
+    @patch.object(superGlblVars, "onProd", True)
+    @patch.object(superGlblVars, "netUtils")
+    def test_getTsFilesKeepsPlaylistOrder(self, mocked_netUtils):
+        mocked_netUtils.get.side_effect = self.helperSlowGet
+        os.makedirs(superGlblVars.config["workDirectory"], exist_ok=True)
+
+        ap = {"filenameBase": "orderTest_{deviceID}", "deviceID": getrandbits(32), "dnThreads": 8}
+        tsList = [f"segment{i:02d}.ts" for i in range(12)]
+        playlistUrl = "https://example.com/live/index.m3u8"
+        tsDurations = [1] * len(tsList)
+
+        try:
+            m3u8List = videosGrabber._getTsFiles(ap, playlistUrl, tsList, None, [], tsDurations)
+        finally:
+            for aFile in os.listdir(superGlblVars.config["workDirectory"]):
+                if aFile.startswith(f"orderTest_{ap['deviceID']}"):
+                    os.remove(os.path.join(superGlblVars.config["workDirectory"], aFile))
+
+        expected = [
+            hashlib.blake2b(f"https://example.com/live/{x}".encode("utf-8"), digest_size=16).hexdigest() for x in tsList
+        ]
+        self.assertEqual([x["hash"] for x in m3u8List], expected)
+        self.assertEqual(len(set(x["file"] for x in m3u8List)), len(tsList))
+
+
+    # Helper to build the playlist sequence information the way _getPlaylist() does
+    def helperSeqInfo(self, mediaSeq, tsList, discontinuities=None, discontinuitySeq=None):
+        return {
+            "mediaSequence": mediaSeq,
+            "discontinuitySequence": discontinuitySeq,
+            "discontinuities": discontinuities or [False] * len(tsList)
+        }
+
+
+    # Playlist refreshes should only request segments not retrieved before
+    def test_segmentTrackerSlidingWindow(self):
+        tracker = videosGrabber._SegmentTracker()
+        tsList = ["seg100.ts", "seg101.ts", "seg102.ts"]
+        newIdxs = tracker.selectNew(tsList, self.helperSeqInfo(100, tsList))
+        self.assertEqual(newIdxs, [0, 1, 2])
+        # The last one failed to download; it must be asked for again
+        for idx in newIdxs[:-1]:
+            tracker.markRetrieved(tsList[idx])
+
+        tsList = ["seg101.ts", "seg102.ts", "seg103.ts"]
+        self.assertEqual(tracker.selectNew(tsList, self.helperSeqInfo(101, tsList)), [1, 2])
+
+
+    # Sequence resets, discontinuities and missing sequences fall back to requesting everything
+    def test_segmentTrackerFallbacks(self):
+        tracker = videosGrabber._SegmentTracker()
+        tsList = ["seg100.ts", "seg101.ts"]
+        for idx in tracker.selectNew(tsList, self.helperSeqInfo(100, tsList)):
+            tracker.markRetrieved(tsList[idx])
+
+        self.assertEqual(tracker.selectNew(tsList, self.helperSeqInfo(None, tsList)), [0, 1])
+        for idx in tracker.selectNew(tsList, self.helperSeqInfo(100, tsList)):
+            tracker.markRetrieved(tsList[idx])
+
+        tsList = ["seg7.ts", "seg8.ts"]
+        self.assertEqual(tracker.selectNew(tsList, self.helperSeqInfo(7, tsList)), [0, 1])
+        for idx in [0, 1]:
+            tracker.markRetrieved(tsList[idx])
+
+        tsList = ["seg8.ts", "other9.ts"]
+        self.assertEqual(tracker.selectNew(tsList, self.helperSeqInfo(8, tsList, [False, True])), [0, 1])
+
+
+    # Helper builds a 188-byte TS packet carrying the given payload
+    def helperTsPacket(self, pid, payload, payloadUnitStart=True):
+        header = bytes([0x47, (0x40 if payloadUnitStart else 0x00) | (pid >> 8), pid & 0xFF, 0x10])
+        return header + payload + b"\xff" * (188 - 4 - len(payload))
+
+
+    # Helper encodes a PES header carrying a PTS
+    def helperPesHeader(self, pts):
+        ptsBytes = bytes([
+            0x21 | ((pts >> 29) & 0x0E),
+            (pts >> 22) & 0xFF,
+            ((pts >> 14) & 0xFE) | 0x01,
+            (pts >> 7) & 0xFF,
+            ((pts << 1) & 0xFE) | 0x01
+        ])
+        return b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + ptsBytes
+
+
+    # Helper builds a small MPEG-TS segment with a PAT, a PMT (video in PID 0x100) and video PES packets
+    def helperTsSegment(self, ptsList):
+        pat = b"\x00" + bytes([0x00, 0xB0, 0x0D, 0x00, 0x01, 0xC1, 0x00, 0x00, 0x00, 0x01, 0xF0, 0x00]) + b"\x00" * 4
+        pmt = b"\x00" + bytes([0x02, 0xB0, 0x12, 0x00, 0x01, 0xC1, 0x00, 0x00, 0xE1, 0x00, 0xF0, 0x00,
+                               0x1B, 0xE1, 0x00, 0xF0, 0x00]) + b"\x00" * 4
+        packets = [self.helperTsPacket(0x0000, pat), self.helperTsPacket(0x1000, pmt)]
+        for pts in ptsList:
+            packets.append(self.helperTsPacket(0x100, self.helperPesHeader(pts)))
+            packets.append(self.helperTsPacket(0x100, b"\x00" * 50, payloadUnitStart=False))
+        return b"".join(packets)
+
+
+    # The native scanner should find the PTS bounds, including across head and tail windows
+    def test_scanTsPts(self):
+        os.makedirs(superGlblVars.config["workDirectory"], exist_ok=True)
+        tsFile = os.path.join(superGlblVars.config["workDirectory"], f"ptsTest_{getrandbits(32)}.ts")
+        try:
+            with open(tsFile, "wb") as f:
+                f.write(self.helperTsSegment([903000, 900000, 906000]))
+            self.assertEqual(videosGrabber._scanTsPts(tsFile), (900000, 906000))
+
+            # Large enough for the tail to be read separately from the head
+            with open(tsFile, "wb") as f:
+                f.write(self.helperTsSegment([2 ** 32 + 900000 + 3000 * i for i in range(1500)]))
+            self.assertEqual(videosGrabber._scanTsPts(tsFile), (2 ** 32 + 900000, 2 ** 32 + 900000 + 3000 * 1499))
+
+            # fMP4 and other non-TS content is left to ffprobe
+            with open(tsFile, "wb") as f:
+                f.write(b"\x00\x00\x00\x20ftypisom" + b"\x00" * 1000)
+            self.assertIsNone(videosGrabber._scanTsPts(tsFile))
+        finally:
+            os.remove(tsFile)
+
+
+    # Refreshes should follow the playlist's target duration and back off while it doesn't change
+    def test_playlistPollerCadence(self):
+        poller = videosGrabber._PlaylistPoller({"adaptivePoll": True}, 30000)
+        self.assertEqual(poller.nextSleep(), 30000)
+
+        poller.targetDuration = 6
+        poller.windowDuration = 36
+        poller.conditionalHeaders("https://example.com/index.m3u8")
+        poller.recordIteration(True)
+        self.assertAlmostEqual(poller.nextSleep(), 6000, delta=100)
+
+        sleeps = []
+        for _ in range(4):
+            poller.recordIteration(False)
+            sleeps.append(poller.nextSleep())
+        self.assertEqual(sleeps, [3000, 6000, 12000, 18000])
+
+        poller = videosGrabber._PlaylistPoller({}, 30000)
+        poller.targetDuration = 6
+        self.assertEqual(poller.nextSleep(), 30000)
+
+
+    # An unchanged playlist should be requested conditionally and reported as not modified
+    @patch.object(superGlblVars, "netUtils")
+    def test_getPlaylistNotModified(self, mocked_netUtils):
+        playlist = b"#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:5\n#EXTINF:6.0,\nseg5.ts\n#EXTINF:6.0,\nseg6.ts\n"
+        firstResp = MagicMock(status_code=200, content=playlist, headers={"ETag": '"abc"'})
+        secondResp = MagicMock(status_code=304, content=b"", headers={})
+        mocked_netUtils.get.side_effect = [firstResp, secondResp]
+
+        url = "https://example.com/live/index.m3u8"
+        poller = videosGrabber._PlaylistPoller({}, 30000)
+        tsList, segIniter, tsDurations, seqInfo = videosGrabber._getPlaylist(url, {}, None, poller)
+        self.assertFalse(poller.notModified)
+        self.assertEqual(poller.targetDuration, 6)
+
+        tsList2, segIniter, tsDurations, seqInfo = videosGrabber._getPlaylist(url, {}, None, poller)
+        self.assertTrue(poller.notModified)
+        self.assertEqual(tsList2, tsList)
+        self.assertEqual(seqInfo["mediaSequence"], 5)
+        kwargs = mocked_netUtils.get.call_args.kwargs
+        self.assertEqual(kwargs["headers"]["If-None-Match"], '"abc"')
+        self.assertTrue(kwargs["notModifiedOk"])
@@ -0,0 +1,94 @@
+# External libraries import statements
+import httpx
+import asyncio
+import unittest
+
+
+# This application's import statements
+from stacks.common.src.python.orangeUtils.asyncNetworkUtils import AsyncNetworkUtils
+
+
+
+class TestAsyncNetworkUtils(unittest.TestCase):
+
+    # Mock server: echoes the path back; "/moved" does a 302 and "/cached" honors If-None-Match
+    def helperHandler(self, request):
+        path = request.url.path
+        if path == "/moved":
+            return httpx.Response(302, headers={"Location": "https://example.com/landed"})
+        if path == "/cached":
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, headers={"ETag": '"v1"'}, content=b"cached")
+        if path == "/missing":
+            return httpx.Response(404)
+        return httpx.Response(200, content=path.encode("utf-8"))
+
+
+    def helperNet(self):
+        return AsyncNetworkUtils(
+            sessionHeaders={}, transport=httpx.MockTransport(self.helperHandler), maxPerHost=2
+        )
+
+
+    # Concurrent GETs come back in the order requested; failures are returned, not raised
+    def test_getMany(self):
+        async def run():
+            async with self.helperNet() as net:
+                urls = [f"https://example.com/seg{i}.ts" for i in range(10)]
+                urls.append("https://example.com/missing")
+                return await net.getMany(urls)
+
+        results = asyncio.run(run())
+        self.assertEqual([r.content for r in results[:-1]], [f"/seg{i}.ts".encode() for i in range(10)])
+        self.assertIsInstance(results[-1], ConnectionError)
+
+
+    # Redirects are followed by hand and conditional requests may accept a 304
+    def test_redirectAndNotModified(self):
+        async def run():
+            async with self.helperNet() as net:
+                landed = await net.get("https://example.com/moved", allow_redirects=False)
+                notModified = await net.get(
+                    "https://example.com/cached", headers={"If-None-Match": '"v1"'}, notModifiedOk=True
+                )
+                return landed, notModified
+
+        landed, notModified = asyncio.run(run())
+        self.assertEqual(landed.content, b"/landed")
+        self.assertEqual(notModified.status_code, 304)
+
+
+    # Concurrent cert failures swap the client once and don't close it under the others
+    def test_disableCertCheckConcurrently(self):
+        async def run():
+            net = None
+
+            async def handler(request):
+                await asyncio.sleep(0.01)
+                if net.verify is not False:
+                    raise httpx.ConnectError("[SSL: CERTIFICATE_VERIFY_FAILED]", request=request)
+                return httpx.Response(200, content=request.url.path.encode("utf-8"))
+
+            net = AsyncNetworkUtils(sessionHeaders={}, transport=httpx.MockTransport(handler))
+            async with net:
+                urls = [f"https://example.com/seg{i}.ts" for i in range(6)]
+                results = await net.getMany(urls)
+                swaps = len(net.retiredClients)
+            return net, results, swaps
+
+        net, results, swaps = asyncio.run(run())
+        self.assertEqual([r.content for r in results], [f"/seg{i}.ts".encode() for i in range(6)])
+        self.assertEqual(swaps, 1)
+        self.assertEqual(net.retiredClients, [])
+        self.assertIs(net.verify, False)
+
+
+    # A bare "host:port" proxy is accepted like the requests-based NetworkUtils does
+    def test_proxyWithoutScheme(self):
+        async def run():
+            net = AsyncNetworkUtils(proxy="127.0.0.1:8080", sessionHeaders={})
+            await net.close()
+            return net
+
+        self.assertEqual(asyncio.run(run()).proxy, "127.0.0.1:8080")
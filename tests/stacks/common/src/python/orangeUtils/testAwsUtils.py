@@ -0,0 +1,155 @@
+# External libraries import statements
+import os
+import json
+import boto3
+import zipfile
+import tempfile
+import unittest
+from io import BytesIO
+from moto import mock_aws
+from unittest.mock import patch
+
+
+# This application's import statements
+from stacks.common.src.python.orangeUtils.awsUtils import S3utils, SQSutils
+
+
+
+class TestS3utils(unittest.TestCase):
+
+    def setUp(self):
+        self.mockAws = mock_aws()
+        self.mockAws.start()
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="test")
+        self.s3 = S3utils(None, None, "test")
+
+
+    def tearDown(self):
+        self.mockAws.stop()
+
+
+    # The bucket is checked once; a "gone" error has it checked again on the next write
+    def test_bucketCheckedOnce(self):
+        headBuckets = []
+        self.s3.s3Client.meta.events.register("before-call.s3.HeadBucket", lambda **kwargs: headBuckets.append(1))
+
+        for i in range(3):
+            self.assertTrue(self.s3.pushDataToS3("test", f"key{i}", b"data"))
+            self.assertTrue(self.s3.pushFileObjToS3(BytesIO(b"data"), "prefix", "test", f"obj{i}"))
+        self.assertEqual(len(headBuckets), 0)
+
+        self.assertFalse(self.s3.pushDataToS3("missing", "key", b"data"))
+        self.assertFalse(self.s3.pushDataToS3("missing", "key", b"data"))
+        self.assertEqual(len(headBuckets), 2)
+
+        self.s3.knownBuckets.add("gone")
+        self.assertFalse(self.s3.pushDataToS3("gone", "key", b"data"))
+        self.assertNotIn("gone", self.s3.knownBuckets)
+
+
+    # Prefixes are deleted a page at a time; similarly named prefixes are left alone
+    def test_deleteEntireKey(self):
+        for i in range(1500):
+            self.s3.s3Client.put_object(Bucket="test", Key=f"aimpoints/ap{i}.json", Body=b"{}")
+        self.s3.s3Client.put_object(Bucket="test", Key="aimpointsOld/ap.json", Body=b"{}")
+
+        self.assertEqual(self.s3.deleteEntireKey("test", "aimpoints", dryRun=True), (1500, []))
+        self.assertEqual(len(self.s3.getFilesAsStrList("test", "aimpoints")), 1500)
+
+        self.assertEqual(self.s3.deleteEntireKey("test", "aimpoints"), (1500, []))
+        self.assertIsNone(self.s3.getFilesAsStrList("test", "aimpoints"))
+        self.assertEqual(self.s3.getFilesAsStrList("test", "aimpointsOld"), ["aimpointsOld/ap.json"])
+        self.assertEqual(self.s3.deleteEntireKey("test", "aimpoints"), (0, []))
+        self.assertEqual(self.s3.deleteEntireKey("test", ""), (0, []))
+
+
+    # Downloads come back in input order; files past the byte budget are left out
+    # Listed objects already carry their sizes; only bare keys need a HEAD each for the budget
+    # (download_file() does one of its own per file downloaded either way)
+    def test_getFilesFromS3(self):
+        keys = [f"lz/seg{i:02d}.ts" for i in range(20)]
+        for aKey in keys:
+            self.s3.s3Client.put_object(Bucket="test", Key=aKey, Body=b"x" * 100)
+
+        with tempfile.TemporaryDirectory() as localDir:
+            paths = self.s3.getFilesFromS3("test", keys + ["lz/missing.ts"], localDir, retries=0)
+            self.assertEqual(paths, [os.path.join(localDir, os.path.basename(x)) for x in keys])
+
+            headObjects = []
+            self.s3.s3Client.meta.events.register("before-call.s3.HeadObject", lambda **kwargs: headObjects.append(1))
+            objs = self.s3.getWildcardKey("lz/seg*", "test", asObjects=True)
+            paths = self.s3.getFilesFromS3("test", objs, localDir, byteBudget=550)
+            self.assertEqual([os.path.basename(x) for x in paths], [f"seg{i:02d}.ts" for i in range(5)])
+            self.assertEqual(len(headObjects), 5)
+            self.assertEqual(len(self.s3.getFilesFromS3("test", keys, localDir, byteBudget=250)), 2)
+            self.assertEqual(len(headObjects), 5 + 20 + 2)
+
+            # Same base name under two prefixes would be the same local file
+            self.s3.s3Client.put_object(Bucket="test", Key="other/seg00.ts", Body=b"y")
+            with self.assertRaises(ValueError):
+                self.s3.getFilesFromS3("test", keys + ["other/seg00.ts"], localDir)
+            self.assertEqual(len(headObjects), 27)
+
+
+    # A zip streamed into a multipart upload reads back whole; copies are done by S3
+    def test_streamToS3(self):
+        images = {f"cam_{i}.JPG": os.urandom(1024 * 1024) for i in range(12)}
+        with self.s3.streamToS3("test", "up/day.zip", partSize=5 * 1024 * 1024) as stream:
+            with zipfile.ZipFile(stream, "w") as zipObj:
+                for name, data in images.items():
+                    zipObj.writestr(name, data)
+        self.assertTrue(self.s3.copyLargeFile("test", "up/day.zip", "test", "other/day.zip"))
+
+        zipData = self.s3.readFileContent("test", "other/day.zip", encoding=None)
+        with zipfile.ZipFile(BytesIO(zipData)) as zipObj:
+            self.assertEqual({x: zipObj.read(x) for x in zipObj.namelist()}, images)
+
+        # Nothing is left behind when the writing fails
+        with self.assertRaises(RuntimeError):
+            with self.s3.streamToS3("test", "up/broken.zip") as stream:
+                stream.write(b"partial")
+                raise RuntimeError
+        self.assertFalse(self.s3.isFileInS3("test", "up/broken.zip"))
+
+
+class TestSQSutils(unittest.TestCase):
+
+    def setUp(self):
+        self.mockAws = mock_aws()
+        self.mockAws.start()
+        self.sqs = SQSutils(regionName="us-east-1")
+        self.queueUrl = self.sqs.sqsClient.create_queue(QueueName="test")["QueueUrl"]
+
+
+    def tearDown(self):
+        self.mockAws.stop()
+
+
+    # Messages go out 10 to a request, each with its own delay; failures not of our own doing are retried
+    def test_batchSender(self):
+        message = {"deviceID": "cam"}
+        with self.sqs.batchSender(self.queueUrl) as sender:
+            for i in range(25):
+                message["idx"] = i
+                sender.send(message, delay=0 if i % 2 else 60)
+        self.assertEqual((sender.sent, sender.failed, sender.requests), (25, 0, 3))
+
+        attributes = self.sqs.sqsClient.get_queue_attributes(QueueUrl=self.queueUrl, AttributeNames=["All"])["Attributes"]
+        self.assertEqual(attributes["ApproximateNumberOfMessages"], "12")
+        self.assertEqual(attributes["ApproximateNumberOfMessagesDelayed"], "13")
+        received = self.sqs.receiveMessages(self.queueUrl, waitSecs=0)
+        self.assertTrue(all(json.loads(x["Body"])["idx"] % 2 for x in received))
+
+        realSend = self.sqs.sqsClient.send_message_batch
+        def helperFlakySend(QueueUrl, Entries):
+            # First attempt: the first entry is throttled and the second one is malformed
+            if len(Entries) == 3:
+                realSend(QueueUrl=QueueUrl, Entries=Entries[2:])
+                return {"Failed": [{"Id": Entries[0]["Id"], "SenderFault": False}, {"Id": Entries[1]["Id"], "SenderFault": True}]}
+            return realSend(QueueUrl=QueueUrl, Entries=Entries)
+
+        with patch.object(self.sqs.sqsClient, "send_message_batch", side_effect=helperFlakySend):
+            with self.sqs.batchSender(self.queueUrl) as sender:
+                for i in range(3):
+                    sender.send({"idx": i})
+        self.assertEqual((sender.sent, sender.failed, sender.requests), (2, 1, 2))
@@ -0,0 +1,58 @@
+# External libraries import statements
+import zoneinfo
+import unittest
+import datetime as dt
+
+
+# This application's import statements
+from stacks.common.src.python.orangeUtils import timeUtils as tu
+
+
+
+class TestWorkHours(unittest.TestCase):
+
+    # Offsets landing in a range are the same ones found by checking them one by one
+    def test_reducedSegmentsRange(self):
+        # 0110 in Auckland
+        theTime = dt.datetime(2020, 10, 13, 12, 10, tzinfo=dt.timezone.utc)
+        rangeList = list(range(0, 630, 10))
+        self.assertEqual(tu.getReducedSegmentsRange(rangeList, theTime, "Pacific/Auckland", "0112-0117"),
+                         list(range(120, 430, 10)))
+
+        theTime = theTime.replace(second=30, microsecond=5)
+        for tz, aRange in (("Pacific/Auckland", "2100-2105"), ("America/New_York", "0408-0410"), ("UTC", "0000-2359")):
+            baseTime = theTime.astimezone(zoneinfo.ZoneInfo(tz))
+            rangeList = list(range(-600, 90000, 7))
+            expected = [x for x in rangeList if tu.isTimeInRange(baseTime + dt.timedelta(seconds=x), aRange)]
+            self.assertEqual(tu.getReducedSegmentsRange(rangeList, theTime, tz, aRange), expected)
+
+
+    # Specs are compiled once; randomization is still done on every call
+    def test_compileWorkHours(self):
+        spec = {"tz": "Pacific/Auckland", "hrs": ["0800-0955", "1300-1730"], "rndm": 15}
+        schedule = tu.compileWorkHours(spec)
+        self.assertIs(tu.compileWorkHours(dict(spec)), schedule)
+        self.assertEqual(tu.compileWorkHours(None).ranges, ["0000-2359"])
+
+        targetTime, theRanges = tu.getWorkHours(dt.datetime(2020, 10, 14, 8, 10, tzinfo=dt.timezone.utc), spec)
+        self.assertEqual(targetTime.strftime("%H%M"), "2110")
+        self.assertEqual(len(theRanges), 2)
+        self.assertEqual(schedule.ranges, spec["hrs"])
+
+        # Callers get their own list; the cached schedule isn't touched
+        notUsed, theRanges = tu.getWorkHours(None, {"tz": "UTC", "hrs": ["0800-1700"]})
+        theRanges.append("1800-1900")
+        self.assertEqual(tu.getWorkHours(None, {"tz": "UTC", "hrs": ["0800-1700"]})[1], ["0800-1700"])
+
+        self.assertTrue(schedule.isActive(targetTime.replace(hour=17, minute=30, second=0)))
+        self.assertFalse(schedule.isActive(targetTime.replace(hour=17, minute=30, second=1)))
+
+
+    # Seconds left are counted on whole minutes; ranges not closing soon raise ValueError
+    def test_closeShopSecsLeft(self):
+        targetTime = dt.datetime(2020, 10, 14, 17, 25, 40)
+        self.assertEqual(tu.closeShopSecsLeft(["0800-0955", "1300-1730"], targetTime, 10), 300)
+        with self.assertRaises(ValueError):
+            tu.closeShopSecsLeft(["0800-0955", "1300-1730"], targetTime, 5)
+        with self.assertRaises(ValueError):
+            tu.closeShopSecsLeft(["0800-0955"], targetTime, 10)
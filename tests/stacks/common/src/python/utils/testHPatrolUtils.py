@@ -4,8 +4,13 @@ import json
 import pathlib
 import os.path
 import logging
+import time
 import unittest
+import threading
 import collections
+import concurrent.futures
+from moto import mock_aws
+from unittest.mock import patch
 
 
 # This is necessary in order for the tests to recognize local utilities
@@ -15,7 +20,9 @@ absolute = os.path.abspath(os.path.join(testdir, srcdir))
 sys.path.insert(0, absolute)
 
 # This application's import statements
+import superGlblVars as GLOBALS
 import utils.hPatrolUtils as hput
+import orangeUtils.awsUtils as awsUtils
 
 
 class TestHPatrolUtils(unittest.TestCase):
@@ -264,3 +271,164 @@ class TestHPatrolUtils(unittest.TestCase):
         self.logger.info(f"Expected => {expectedGoodTranscodeCommand}")
         self.logger.info(f"Actual   => {ffmpegCommandOutput}")
         self.assertTrue(collections.Counter(expectedGoodTranscodeCommand) == collections.Counter(ffmpegCommandOutput))
+
+
+    # Hashes are kept per device and time window; a new invocation sees what the previous ones wrote
+    @mock_aws
+    def test_dedupIndex(self):
+        os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+        awsUtils.boto3.client("s3").create_bucket(Bucket="test")
+        GLOBALS.S3utils = awsUtils.S3utils(None, None, "test")
+
+        firstRun = hput.DedupIndex("test", "deviceA", windowSecs=3600, now=7200).load()
+        self.assertFalse("aaa" in firstRun)
+        firstRun.add("aaa")
+        self.assertTrue(firstRun.flush())
+
+        # Same device in the next window still knows about it; a different device doesn't
+        nextRun = hput.DedupIndex("test", "deviceA", windowSecs=3600, now=10900).load()
+        self.assertTrue("aaa" in nextRun)
+        otherDevice = hput.DedupIndex("test", "deviceB", windowSecs=3600, now=7200).load()
+        self.assertFalse("aaa" in otherDevice)
+
+        # Two windows later it's been forgotten
+        laterRun = hput.DedupIndex("test", "deviceA", windowSecs=3600, now=14500).load()
+        self.assertFalse("aaa" in laterRun)
+
+
+    # Readers take unchanged aimpoints from the manifest and read only the files that changed since
+    @mock_aws
+    @patch.dict(GLOBALS.config, {"defaultWrkBucket": "test"})
+    def test_aimpointManifest(self):
+        s3Client = awsUtils.boto3.client("s3")
+        s3Client.create_bucket(Bucket="test")
+        GLOBALS.S3utils = awsUtils.S3utils(None, None, "test")
+        for i in range(3):
+            s3Client.put_object(Bucket="test", Key=f"aimpoints/ap{i}.json", Body=json.dumps({"deviceID": i}))
+
+        # Without a manifest everything is read from its own file
+        aimpoints = hput.AimpointFiles("aimpoints")
+        self.assertEqual(json.loads(aimpoints.readFileContent("aimpoints/ap0.json")), {"deviceID": 0})
+        self.assertEqual(aimpoints.fileReads, 1)
+
+        hput.updateAimpointManifests(["aimpoints"])
+        s3Client.put_object(Bucket="test", Key="aimpoints/ap1.json", Body=json.dumps({"deviceID": "new"}))
+        aimpoints = hput.AimpointFiles("aimpoints")
+        contents = [json.loads(aimpoints.readFileContent(x))["deviceID"] for x in aimpoints.fileList]
+        self.assertEqual(contents, [0, "new", 2])
+        self.assertEqual(aimpoints.fileReads, 1)
+
+        hput.updateAimpointManifests(["aimpoints"])
+        self.assertEqual(hput.readAimpointManifest("aimpoints/sub")["version"], 2)
+        self.assertIsNone(hput.AimpointFiles("monitored").fileList)
+
+
+    # A warm process only downloads the aimpoints that changed; the manifest is asked for conditionally
+    @mock_aws
+    @patch.dict(GLOBALS.config, {"defaultWrkBucket": "test"})
+    def test_aimpointCache(self):
+        s3Client = awsUtils.boto3.client("s3")
+        s3Client.create_bucket(Bucket="test")
+        GLOBALS.S3utils = awsUtils.S3utils(None, None, "test")
+        gets = []
+        GLOBALS.S3utils.s3Client.meta.events.register("provide-client-params.s3.GetObject", lambda params, **kwargs: gets.append(params["Key"]))
+        for i in range(3):
+            s3Client.put_object(Bucket="test", Key=f"aimpoints/ap{i}.json", Body=json.dumps({"deviceID": i}))
+        hput.updateAimpointManifests(["aimpoints"])
+        hput._aimpointCache.clear()
+        hput._manifestCache.clear()
+
+        try:
+            aimpoints = hput.AimpointFiles("aimpoints")
+            first = aimpoints.readAimpoint("aimpoints/ap0.json")
+            first["deviceID"] = "modified by the caller"
+            self.assertEqual([aimpoints.readAimpoint(x)["deviceID"] for x in aimpoints.fileList], [0, 1, 2])
+            self.assertEqual(aimpoints.fileReads, 0)
+
+            # Next invocation: nothing is downloaded until an aimpoint changes, then only that one
+            gets.clear()
+            aimpoints = hput.AimpointFiles("aimpoints")
+            self.assertEqual([aimpoints.readAimpoint(x)["deviceID"] for x in aimpoints.fileList], [0, 1, 2])
+            self.assertEqual(gets, [])
+
+            s3Client.put_object(Bucket="test", Key="aimpoints/ap2.json", Body=json.dumps({"deviceID": "new"}))
+            s3Client.delete_object(Bucket="test", Key="aimpoints/ap1.json")
+            aimpoints = hput.AimpointFiles("aimpoints")
+            self.assertEqual([aimpoints.readAimpoint(x)["deviceID"] for x in aimpoints.fileList], [0, "new"])
+            self.assertEqual(gets, ["manifests/aimpoints.json", "aimpoints/ap2.json"])
+            self.assertNotIn("aimpoints/ap1.json", hput._aimpointCache)
+        finally:
+            hput._aimpointCache.clear()
+            hput._manifestCache.clear()
+
+
+    # References are rebuilt from S3 once, then from the cache while the ETag holds
+    @mock_aws
+    @patch.dict(GLOBALS.config, {"defaultWrkBucket": "test"})
+    def test_resolveAimpoint(self):
+        s3Client = awsUtils.boto3.client("s3")
+        s3Client.create_bucket(Bucket="test")
+        GLOBALS.S3utils = awsUtils.S3utils(None, None, "test")
+        etag = s3Client.put_object(Bucket="test", Key="aimpoints/ap.json", Body=json.dumps({"deviceID": "cam"}))["ETag"]
+        gets = []
+        GLOBALS.S3utils.s3Client.meta.events.register("provide-client-params.s3.GetObject", lambda params, **kwargs: gets.append(params["Key"]))
+
+        try:
+            ref = hput.aimpointRef("aimpoints/ap.json", etag, overrides={"singleCollector": True})
+            self.assertEqual(hput.resolveAimpoint(ref), {"deviceID": "cam", "singleCollector": True})
+            batch = hput.resolveDispatch({"aimpoints": [ref, {"deviceID": "whole"}], "proxy": "p"})
+            self.assertEqual([x["deviceID"] for x in batch["aimpoints"]], ["cam", "whole"])
+            self.assertEqual(batch["proxy"], "p")
+            self.assertEqual(gets, ["aimpoints/ap.json"])
+
+            with self.assertRaises(hput.HPatrolError):
+                hput.resolveAimpoint(hput.aimpointRef("aimpoints/gone.json", etag))
+
+            # A batch loses only the aimpoints that can't be read; a stale ETag gets the current version
+            s3Client.put_object(Bucket="test", Key="aimpoints/ap.json", Body=json.dumps({"deviceID": "regenerated"}))
+            hput._aimpointCache.clear()     # e.g. a different container
+            batch = hput.resolveDispatch({"aimpoints": [
+                hput.aimpointRef("aimpoints/gone.json", etag), {"deviceID": "whole"}, hput.aimpointRef("aimpoints/ap.json", etag)
+            ]})
+            self.assertEqual([x["deviceID"] for x in batch["aimpoints"]], ["whole", "regenerated"])
+            with self.assertRaises(hput.HPatrolError):
+                hput.resolveDispatch({"aimpoints": [hput.aimpointRef("aimpoints/gone.json", etag)]})
+        finally:
+            hput._aimpointCache.clear()
+
+
+    # Only aimpoints going to the same Collector, through the same proxy and regions can share one
+    def test_collectorBatchKey(self):
+        base = {"collectionType": "M3U", "collRegions": ["us-east-1", "Frankfurt"]}
+        sameRegions = dict(base, collRegions=["Frankfurt", "us-east-1"])
+        self.assertEqual(hput.collectorBatchKey(base), hput.collectorBatchKey(sameRegions))
+
+        self.assertNotEqual(hput.collectorBatchKey(base), hput.collectorBatchKey(dict(base, collectionType="STILLS")))
+        self.assertNotEqual(hput.collectorBatchKey(base), hput.collectorBatchKey(dict(base, vpn="someVpn")))
+        self.assertNotEqual(hput.collectorBatchKey(base), hput.collectorBatchKey(dict(base, collRegions=["Frankfurt"])))
+        self.assertIsNone(hput.collectorBatchKey(dict(base, collectionType="PLAYWRIGHT")))
+        self.assertTrue(hput.collectorFunction(dict(base, proxy="a.whirl.dom:1")).endswith("_VideosVPC"))
+
+
+    # A host has a single limiter; aimpoints asking for different "hostConns" get the smallest together
+    def test_hostLimiter(self):
+        hput._hostLimiters.pop("cams.example.com", None)
+        limiters = [hput.getHostLimiter("cams.example.com", 8), hput.getHostLimiter("cams.example.com", 4)]
+        self.assertIs(limiters[0], limiters[1])
+        self.assertIs(hput.getHostLimiter("cams.example.com", 6), limiters[0])
+
+        lock = threading.Lock()
+        counts = {"now": 0, "max": 0}
+        def helperDownload(limiter):
+            with limiter:
+                with lock:
+                    counts["now"] += 1
+                    counts["max"] = max(counts["max"], counts["now"])
+                time.sleep(0.02)
+                with lock:
+                    counts["now"] -= 1
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=24) as executor:
+            list(executor.map(helperDownload, limiters * 12))
+        self.assertEqual(counts["max"], 4)
+        hput._hostLimiters.pop("cams.example.com", None)
@@ -0,0 +1,119 @@
+# External libraries import statements
+import sys
+import json
+import os.path
+import logging
+import unittest
+from unittest.mock import patch, MagicMock
+
+# This is necessary in order for the tests to recognize local utilities
+testdir = os.path.dirname(__file__)
+srcdir = "../../../../../stacks/dispatcher/src/python"
+absolute = os.path.abspath(os.path.join(testdir, srcdir))
+sys.path.insert(0, absolute)
+
+# This application's import statements
+import main as dispatcher
+import superGlblVars as GLOBALS
+from utils import hPatrolUtils as hput
+
+
+class TestMain(unittest.TestCase):
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(format = "%(asctime)s %(module)s %(levelname)s: %(message)s",
+                    datefmt = "%m/%d/%Y %I:%M:%S %p", level = logging.INFO)
+
+
+    def setUp(self):
+        # Stubbed lambda client; payloads invoked are kept in self.invoked
+        self.invoked = []
+        self.lambdaClient = MagicMock()
+        self.lambdaClient.invoke.side_effect = self.helperInvoke
+        self.failDevices = set()
+        patcher = patch.dict(dispatcher._lambdaClients, {"us-east-1": self.lambdaClient, "eu-central-1": self.lambdaClient})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def helperInvoke(self, FunctionName, InvocationType, Payload):
+        payload = json.loads(Payload)
+        devices = [ap["deviceID"] for ap in payload.get("aimpoints", [payload])]
+        if self.failDevices.intersection(devices):
+            return {"ResponseMetadata": {"HTTPStatusCode": 500}}
+        self.invoked.append((FunctionName.split(":function:")[1], payload))
+        return {"ResponseMetadata": {"HTTPStatusCode": 202}}
+
+
+    def helperAimpoint(self, deviceID, **kwargs):
+        ap = {"deviceID": deviceID, "filenameBase": "{deviceID}", "collectionType": "M3U",
+              "collRegions": ["us-east-1"]}
+        ap.update(kwargs)
+        return ap
+
+
+    # A batch is re-grouped by Collector needs; groups carry their proxy/VPN at the top
+    def test_dispatchBatch(self):
+        proxied = [self.helperAimpoint(x, proxy="a.whirl.dom:1") for x in ("a", "b")]
+        mixed = proxied + [self.helperAimpoint("c"), self.helperAimpoint("pw", collectionType="PLAYWRIGHT")]
+
+        self.assertTrue(dispatcher._dispatchBatch("123456789012", mixed))
+        payloads = {json.dumps(payload, sort_keys=True): function for function, payload in self.invoked}
+        self.assertEqual(len(self.invoked), 3)
+        self.assertEqual(payloads[json.dumps({"aimpoints": proxied, "proxy": "a.whirl.dom:1"}, sort_keys=True)],
+                         f"{GLOBALS.baseStackName}_VideosVPC")
+        self.assertEqual(payloads[json.dumps(mixed[2], sort_keys=True)], f"{GLOBALS.baseStackName}_Videos")
+        self.assertEqual(payloads[json.dumps(mixed[3], sort_keys=True)], f"{GLOBALS.baseStackName}_Playwright")
+
+
+    def helperRecord(self, messageId, body):
+        return {"messageId": messageId, "body": body if isinstance(body, str) else json.dumps(body)}
+
+
+    # Only messages for which nothing was dispatched go back to the queue; bad ones are dropped
+    @patch.object(GLOBALS, "myArn", "arn:aws:lambda:us-east-1:123456789012:function:dispatcher")
+    @patch.dict(GLOBALS.config, {"defaultWrkBucket": "test"})
+    def test_executeRecords(self):
+        self.failDevices = {"down", "alsoDown"}
+        records = [
+            self.helperRecord("good", self.helperAimpoint("good")),
+            self.helperRecord("notJson", "{not json"),
+            self.helperRecord("noRegions", {"deviceID": "x"}),
+            self.helperRecord("gone", hput.aimpointRef("aimpoints/gone.json", '"etag"')),
+            self.helperRecord("failed", self.helperAimpoint("down")),
+            # Half dispatched; retrying would run the other one twice
+            self.helperRecord("partial", {"aimpoints": [self.helperAimpoint("ok"), self.helperAimpoint("down", proxy="p:1")]}),
+            self.helperRecord("allFailed", {"aimpoints": [self.helperAimpoint("down"), self.helperAimpoint("alsoDown", proxy="p:1")]}),
+        ]
+
+        with patch.object(GLOBALS, "S3utils", MagicMock()) as mocked_S3utils:
+            mocked_S3utils.readFileIfChanged.return_value = (None, None)
+            self.assertEqual(sorted(dispatcher.executeRecords(records)), ["allFailed", "failed"])
+        self.assertEqual(sorted(payload["deviceID"] for notUsed, payload in self.invoked), ["good", "ok"])
+
+
+    # An unexpected error returns every message to the queue instead of none
+    @patch("main.auditUtils")
+    @patch("main.processInit")
+    @patch("main.executeRecords")
+    def test_lambdaHandlerError(self, mocked_executeRecords, mocked_processInit, mocked_auditUtils):
+        mocked_processInit.preFlightSetup.return_value = 0
+        mocked_processInit.initialize.return_value = True
+        event = {"Records": [self.helperRecord(x, self.helperAimpoint(x)) for x in ("a", "b")]}
+
+        mocked_executeRecords.return_value = ["b"]
+        self.assertEqual(dispatcher.lambdaHandler(event, MagicMock())["batchItemFailures"], [{"itemIdentifier": "b"}])
+
+        mocked_executeRecords.side_effect = RuntimeError("unexpected")
+        response = dispatcher.lambdaHandler(event, MagicMock())
+        self.assertEqual(response, {"status": False, "batchItemFailures": [{"itemIdentifier": "a"}, {"itemIdentifier": "b"}]})
+
+
+    # Clients are created once per region and kept
+    @patch("main.boto3.client")
+    def test_lambdaClient(self, mocked_client):
+        mocked_client.side_effect = lambda service_name, region_name: MagicMock(region=region_name)
+        dispatcher._lambdaClients.clear()
+        first = dispatcher._lambdaClient("ap-southeast-2")
+        self.assertIs(dispatcher._lambdaClient("ap-southeast-2"), first)
+        self.assertEqual(dispatcher._lambdaClient("sa-east-1").region, "sa-east-1")
+        self.assertEqual(mocked_client.call_count, 2)
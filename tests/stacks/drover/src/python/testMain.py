@@ -228,12 +228,12 @@ class TestMain(unittest.TestCase):
 
     # Test transcoder trigger for 15 intervals
     # Mock config to return defaultWrkBucket equal to test and proxy to None
-    # Mock sqsUtils object function sendMessage (mock objects are required to be included in test parameters)
+    # Mock sqsUtils object function batchSender (mock objects are required to be included in test parameters)
     # Mock S3utils object function readFileContent (mock objects are required to be included in test parameters)
     @patch.dict(superGlblVars.config, {"defaultWrkBucket": "test", "proxy": None})
-    @patch.object(superGlblVars.sqsUtils, "sendMessage")
+    @patch.object(superGlblVars.sqsUtils, "batchSender")
     @patch.object(superGlblVars.S3utils, "readFileContent")
-    def test_sendTaskings(self, test_readFileContent, test_sendMessage):
+    def test_sendTaskings(self, test_readFileContent, test_batchSender):
         theTask = drover.DroverTask.TRANSCODE
         fileList = ["Test"]
 
@@ -302,12 +302,12 @@ class TestMain(unittest.TestCase):
 
     # Test transcoder trigger for 10 minute intervals
     # Mock config to return defaultWrkBucket equal to test and proxy to None
-    # Mock sqsUtils object function sendMessage (mock objects are required to be included in test parameters)
+    # Mock sqsUtils object function batchSender (mock objects are required to be included in test parameters)
     # Mock S3utils object function readFileContent (mock objects are required to be included in test parameters)
     @patch.dict(superGlblVars.config, {"defaultWrkBucket": "test", "proxy": None})    
-    @patch.object(superGlblVars.sqsUtils, "sendMessage")
+    @patch.object(superGlblVars.sqsUtils, "batchSender")
     @patch.object(superGlblVars.S3utils, "readFileContent")
-    def test_sendTaskingsInterval(self,test_readFileContent, test_sendMessage):
+    def test_sendTaskingsInterval(self,test_readFileContent, test_batchSender):
         self.logger.info("testing the following time interval ")
         theTask = drover.DroverTask.TRANSCODE
         fileList = ["Test"]
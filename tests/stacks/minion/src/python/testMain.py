@@ -0,0 +1,84 @@
+# External libraries import statements
+import io
+import sys
+import boto3
+import os.path
+import logging
+import tarfile
+import zipfile
+import unittest
+from moto import mock_aws
+from unittest.mock import patch
+
+# This is necessary in order for the tests to recognize local utilities
+testdir = os.path.dirname(__file__)
+srcdir = "../../../../../stacks/minion/src/python"
+absolute = os.path.abspath(os.path.join(testdir, srcdir))
+sys.path.insert(0, absolute)
+
+# This application's import statements
+import main as minion
+import superGlblVars as GLOBALS
+import orangeUtils.awsUtils as awsUtils
+
+
+class TestMain(unittest.TestCase):
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(format = "%(asctime)s %(module)s %(levelname)s: %(message)s",
+                    datefmt = "%m/%d/%Y %I:%M:%S %p", level = logging.INFO)
+
+
+    def setUp(self):
+        self.mockAws = mock_aws()
+        self.mockAws.start()
+        self.s3Client = boto3.client("s3", region_name="us-east-1")
+        for aBucket in ("wrk", "dst"):
+            self.s3Client.create_bucket(Bucket=aBucket)
+        GLOBALS.S3utils = awsUtils.S3utils(None, None, "wrk")
+
+        # Loose stills plus a rolling archive from a "stillsArchive" aimpoint
+        for name in ("cam_100.JPG", "cam_101.JPG", "notes.txt"):
+            self.s3Client.put_object(Bucket="wrk", Key=f"stillsLz/cam/{name}", Body=name.encode())
+        tarData = io.BytesIO()
+        with tarfile.open(fileobj=tarData, mode="w") as tarObj:
+            for name in ("cam_102.JPG", "index.json"):
+                info = tarfile.TarInfo(name)
+                info.size = len(name)
+                tarObj.addfile(info, io.BytesIO(name.encode()))
+        self.s3Client.put_object(Bucket="wrk", Key="stillsLz/cam/cam_102.TAR", Body=tarData.getvalue())
+
+        self.selection = {"selected": "cam", "zipFileName": "cam.zip", "wrkBucket": "wrk", "dstBucket": "dst",
+                          "bucketPrefix": "stills", "filesLocation": "stillsLz/cam", "deliveryKey": ["data", "norData"]}
+
+
+    def tearDown(self):
+        self.mockAws.stop()
+        GLOBALS.S3utils = None
+
+
+    # Loose and archived stills are zipped once; the other destinations get copies
+    def test_execute(self):
+        self.assertTrue(minion.execute(self.selection))
+
+        for aKey in ("data", "norData"):
+            zipData = self.s3Client.get_object(Bucket="dst", Key=f"{aKey}/stills/cam.zip")["Body"].read()
+            with zipfile.ZipFile(io.BytesIO(zipData)) as zipObj:
+                self.assertEqual(sorted(zipObj.namelist()), ["cam_100.JPG", "cam_101.JPG", "cam_102.JPG"])
+                self.assertEqual(zipObj.read("cam_102.JPG"), b"cam_102.JPG")
+
+        # Already delivered; nothing to redo
+        self.assertTrue(minion.execute(self.selection))
+
+
+    # A file that can't be read fails the run without leaving an incomplete zip behind
+    def test_executeMissingFile(self):
+        fileList = GLOBALS.S3utils.getFilesAsStrList("wrk", "stillsLz/cam") + ["stillsLz/cam/cam_103.JPG"]
+        with patch.object(GLOBALS.S3utils, "getFilesAsStrList", return_value=fileList):
+            self.assertFalse(minion.execute(self.selection))
+        self.assertFalse(GLOBALS.S3utils.isFileInS3("dst", "data/stills/cam.zip"))
+        self.assertEqual(self.s3Client.list_multipart_uploads(Bucket="dst").get("Uploads", []), [])
+
+        # A failed copy fails it as well
+        with patch.object(GLOBALS.S3utils, "copyLargeFile", return_value=False):
+            self.assertFalse(minion.execute(self.selection))
+        self.assertTrue(GLOBALS.S3utils.isFileInS3("dst", "data/stills/cam.zip"))
@@ -0,0 +1,121 @@
+# External libraries import statements
+import sys
+import os.path
+import logging
+import unittest
+import datetime as dt
+from unittest.mock import patch, MagicMock
+
+# This is necessary in order for the tests to recognize local utilities
+testdir = os.path.dirname(__file__)
+srcdir = "../../../../../stacks/scheduler/src/python"
+absolute = os.path.abspath(os.path.join(testdir, srcdir))
+sys.path.insert(0, absolute)
+
+# This application's import statements
+import main as scheduler
+import superGlblVars as GLOBALS
+from utils import hPatrolUtils as hput
+
+
+class TestMain(unittest.TestCase):
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(format = "%(asctime)s %(module)s %(levelname)s: %(message)s",
+                    datefmt = "%m/%d/%Y %I:%M:%S %p", level = logging.INFO)
+
+
+    def helperAimpoint(self, deviceID, **kwargs):
+        ap = {"deviceID": deviceID, "filenameBase": "{deviceID}", "collectionType": "M3U",
+              "collRegions": ["us-east-1"], "pollFrequency": 60}
+        ap.update(kwargs)
+        return ap
+
+
+    # Aimpoints that can share a Collector go out together, up to collectorBatch per message
+    @patch.object(GLOBALS, "onProd", True)
+    @patch.object(GLOBALS, "collectorBatch", 2)
+    def test_sendBatches(self):
+        now = dt.datetime(2024, 1, 1, 12, 0)
+        aimpoints = [self.helperAimpoint(x) for x in ("a", "b", "c")]
+        aimpoints.append(self.helperAimpoint("vpn", vpn="someVpn"))
+        aimpoints.append(self.helperAimpoint("pw", collectionType="PLAYWRIGHT"))
+
+        batched = {}
+        toSend = []
+        for ap in aimpoints:
+            scheduler._sendTasks(now, [0, 60], ap, batched, toSend, {"msg": ap["deviceID"]})
+        # Playwright aimpoints are never grouped; they go right away
+        self.assertEqual(toSend, [({"msg": "pw"}, 0), ({"msg": "pw"}, 60)])
+
+        scheduler._sendBatches(now, batched, toSend)
+        sent = sorted((theDelay, str(theMsg)) for theMsg, theDelay in toSend[2:])
+        self.assertEqual(sent, sorted(
+            (theDelay, str(theMsg)) for theDelay in (0, 60) for theMsg in (
+                {"aimpoints": [{"msg": "a"}, {"msg": "b"}]}, {"msg": "c"}, {"msg": "vpn"}
+            )
+        ))
+
+
+    # Helper stands in for hput.AimpointFiles over the given {key: aimpoint}
+    def helperAimpointFiles(self, aimpoints):
+        def readAimpoint(aFile):
+            if aimpoints[aFile] is None:
+                raise ValueError("unreadable aimpoint")
+            return dict(aimpoints[aFile])
+
+        files = MagicMock()
+        files.fileList = list(aimpoints)
+        files.etags = {aFile: f'"etag-{aFile}"' for aFile in aimpoints}
+        files.readAimpoint.side_effect = readAimpoint
+        files.fileReads = 0
+        return files
+
+
+    # Aimpoints are loaded concurrently; skipped and disabled ones send nothing, the rest
+    # go out as references with one message per delay, grouped where they can share a Collector
+    @patch.object(GLOBALS, "onProd", True)
+    @patch.object(GLOBALS, "dispatchRefs", True)
+    @patch.object(GLOBALS, "collectorBatch", 2)
+    def test_execute(self):
+        files = self.helperAimpointFiles({
+            "aimpoints/a.json": self.helperAimpoint("a", pollFrequency=120),
+            "aimpoints/b.json": self.helperAimpoint("b", pollFrequency=120),
+            "aimpoints/single.json": self.helperAimpoint("single", collectionType="STILLS", pollFrequency=5, singleCollector=True),
+            "aimpoints/off.json": self.helperAimpoint("off", enabled=False),
+            "aimpoints/bad.json": None,
+        })
+        sent = []
+        sender = MagicMock(sent=0, failed=0, requests=0)
+        sender.send.side_effect = lambda theMsg, theDelay: sent.append((theMsg, theDelay))
+        sqsUtils = MagicMock()
+        sqsUtils.batchSender.return_value.__enter__.return_value = sender
+
+        with patch.object(GLOBALS, "sqsUtils", sqsUtils, create=True), patch("main.hput.AimpointFiles", return_value=files):
+            self.assertEqual(scheduler.execute(), 5)
+
+        sqsUtils.batchSender.assert_called_once_with(scheduler.config["disQueue"])
+        refA = hput.aimpointRef("aimpoints/a.json", '"etag-aimpoints/a.json"')
+        refB = hput.aimpointRef("aimpoints/b.json", '"etag-aimpoints/b.json"')
+        refSingle = hput.aimpointRef("aimpoints/single.json", '"etag-aimpoints/single.json"')
+        # systemPeriodicity plus 30s of overlap, every 120s; singleCollector only gets the first
+        delays = list(range(0, scheduler.config["systemPeriodicity"] * 60 + 30, 120))
+        expected = [({"aimpoints": [refA, refB]}, x) for x in delays] + [(refSingle, 0)]
+        self.assertEqual(sorted(sent, key=str), sorted(expected, key=str))
+
+
+    # Off production only the first aimpoint is processed
+    @patch.object(GLOBALS, "onProd", False)
+    @patch.object(GLOBALS, "dispatchRefs", False)
+    @patch.object(GLOBALS, "collectorBatch", 1)
+    def test_executeNotOnProd(self):
+        aimpointA = self.helperAimpoint("a", pollFrequency=300)
+        files = self.helperAimpointFiles({"aimpoints/a.json": aimpointA, "aimpoints/b.json": self.helperAimpoint("b")})
+        sqsUtils = MagicMock()
+        sender = sqsUtils.batchSender.return_value.__enter__.return_value
+        sender.sent = sender.failed = sender.requests = 0
+
+        with patch.object(GLOBALS, "sqsUtils", sqsUtils, create=True), patch("main.hput.AimpointFiles", return_value=files):
+            self.assertEqual(scheduler.execute(), 2)
+
+        files.readAimpoint.assert_called_once_with("aimpoints/a.json")
+        self.assertEqual([aCall.args for aCall in sender.send.call_args_list], [(aimpointA, 0), (aimpointA, 300), (aimpointA, 600)])